@@ -1,5 +1,8 @@
+from .compiled import CompiledGraph
 from .pg import PathsGraph, CombinedPathsGraph, get_reachable_sets
+from .layered import LayeredPathsGraph
 from .pre_cfpg import PreCFPG
 from .cfpg import CFPG, CombinedCFPG
 from .paths_tree import PathsTree
+from .cache import ReachSetCache
 from .api import *
@@ -1,14 +1,17 @@
 import logging
-import itertools
-import numpy as np
 import networkx as nx
-from .pg import get_reachable_sets, PathsGraph
+from .pg import get_reachable_sets, PathsGraph, iter_chunks
 from .cfpg import CFPG
+from .cache import ReachSetCache
+from .compiled import CompiledGraph, count_walks_by_length
+from .sampling import get_rng
 
 logger = logging.getLogger('paths_graph')
 
 
-__all__ = ['load_signed_sif', 'sample_paths', 'enumerate_paths', 'count_paths']
+__all__ = ['load_signed_sif', 'sample_paths', 'enumerate_paths', 'count_paths',
+           'count_paths_by_length', 'iter_paths', 'iter_samples',
+           'batch_sample_paths', 'batch_count_paths']
 
 
 def load_signed_sif(sif_file):
@@ -44,7 +47,8 @@ def load_signed_sif(sif_file):
 
 
 def sample_paths(g, source, target, max_depth=None, num_samples=1000,
-                 cycle_free=True, signed=False, target_polarity=0):
+                 cycle_free=True, signed=False, target_polarity=0,
+                 reach_cache=None, rng=None, distribution='weighted'):
     """Sample paths over a range of lengths from a graph.
 
     This high-level function provides explicit access to path sampling
@@ -57,7 +61,7 @@ def sample_paths(g, source, target, max_depth=None, num_samples=1000,
 
     Parameters
     ----------
-    g : networkx.DiGraph
+    g : networkx.DiGraph or CompiledGraph
         The underlying graph on which paths will be generated.
     source : str
         Name of the source node.
@@ -79,6 +83,19 @@ def sample_paths(g, source, target, max_depth=None, num_samples=1000,
     target_polarity : 0 or 1
         For a signed graph, specifies the polarity of the target node: 0
         indicates positive/activation, 1 indicates negative/inhibition.
+    reach_cache : Optional[paths_graph.ReachSetCache]
+        If provided, the forward and backward reachable sets are looked up
+        in and stored in the cache, so that they are only computed once
+        across queries sharing the same source or target. In this case a
+        networkx graph is compiled on each call; pass a
+        :py:class:`paths_graph.CompiledGraph` to avoid this.
+    rng : None, int, numpy.random.SeedSequence or numpy.random.Generator
+        Source of randomness, see :py:func:`paths_graph.sampling.get_rng`.
+        Default is None (the global NumPy random state).
+    distribution : str
+        'weighted' to sample paths at each depth according to the edge
+        weights, or 'uniform' to sample each of the paths at a depth with
+        the same probability. Default is 'weighted'.
 
     Returns
     -------
@@ -87,16 +104,19 @@ def sample_paths(g, source, target, max_depth=None, num_samples=1000,
         a path from source to target.
     """
     return _run_by_depth('sample_paths', [num_samples], g, source, target,
-                         max_depth, cycle_free, signed, target_polarity)
+                         max_depth, cycle_free, signed, target_polarity,
+                         reach_cache, {'rng': get_rng(rng),
+                                       'distribution': distribution})
 
 
 def enumerate_paths(g, source, target, max_depth=None,
-                    cycle_free=True, signed=False, target_polarity=0):
+                    cycle_free=True, signed=False, target_polarity=0,
+                    reach_cache=None):
     """Enumerate paths over a range of lengths.
 
     Parameters
     ----------
-    g : networkx.DiGraph
+    g : networkx.DiGraph or CompiledGraph
         The underlying graph on which paths will be generated.
     source : str
         Name of the source node.
@@ -116,6 +136,12 @@ def enumerate_paths(g, source, target, max_depth=None,
     target_polarity : 0 or 1
         For a signed graph, specifies the polarity of the target node: 0
         indicates positive/activation, 1 indicates negative/inhibition.
+    reach_cache : Optional[paths_graph.ReachSetCache]
+        If provided, the forward and backward reachable sets are looked up
+        in and stored in the cache, so that they are only computed once
+        across queries sharing the same source or target. In this case a
+        networkx graph is compiled on each call; pass a
+        :py:class:`paths_graph.CompiledGraph` to avoid this.
 
     Returns
     -------
@@ -124,16 +150,127 @@ def enumerate_paths(g, source, target, max_depth=None,
         a path from source to target.
     """
     return _run_by_depth('enumerate_paths', [], g, source, target, max_depth,
-                         cycle_free, signed, target_polarity)
+                         cycle_free, signed, target_polarity, reach_cache)
+
+
+def iter_paths(g, source, target, max_depth=None, cycle_free=True,
+               signed=False, target_polarity=0, reach_cache=None,
+               chunk_size=None):
+    """Iterate over all paths over a range of lengths.
+
+    Unlike :py:func:`enumerate_paths`, the paths graph for each length is
+    only built once the paths of the previous lengths have been consumed,
+    and paths are generated one at a time, so memory use does not grow
+    with the number of paths.
+
+    Parameters
+    ----------
+    g : networkx.DiGraph or CompiledGraph
+        The underlying graph on which paths will be generated.
+    source : str
+        Name of the source node.
+    target : str
+        Name of the target node.
+    max_depth : Optional[int]
+        The maximum path length to consider. If not specified, the number of
+        nodes in the graph is used as the default maximum depth.
+    cycle_free : bool
+        If True, only cycle-free paths are generated, using CFPGs. Default is
+        True.
+    signed : bool
+        Specifies whether the underlying graph has signed edges, encoded in
+        the 'sign' field of the edge data.
+    target_polarity : 0 or 1
+        For a signed graph, specifies the polarity of the target node: 0
+        indicates positive/activation, 1 indicates negative/inhibition.
+    reach_cache : Optional[paths_graph.ReachSetCache]
+        Cache to look up and store the forward and backward reachable sets
+        in, see :py:func:`sample_paths`.
+    chunk_size : Optional[int]
+        If given, paths are yielded in tuples of (at most) this many paths
+        instead of one by one.
+
+    Returns
+    -------
+    generator
+        Generator of paths (or tuples of paths, if chunk_size is given),
+        each a tuple of node names, in order of increasing length.
+    """
+    paths = (path for pg in _iter_pgs_by_depth(g, source, target, max_depth,
+                                                cycle_free, signed,
+                                                target_polarity, reach_cache)
+             for path in pg.iter_paths())
+    return iter_chunks(paths, chunk_size)
+
+
+def iter_samples(g, source, target, max_depth=None, num_samples=1000,
+                 cycle_free=True, signed=False, target_polarity=0,
+                 reach_cache=None, rng=None, chunk_size=None,
+                 distribution='weighted'):
+    """Iterate over paths sampled over a range of lengths.
+
+    Generates the same samples as :py:func:`sample_paths` (given the same
+    random state), but one at a time, so that memory use does not grow with
+    the number of samples.
+
+    Parameters
+    ----------
+    g : networkx.DiGraph or CompiledGraph
+        The underlying graph on which paths will be generated.
+    source : str
+        Name of the source node.
+    target : str
+        Name of the target node.
+    max_depth : Optional[int]
+        The maximum path length to consider. If not specified, the number of
+        nodes in the graph is used as the default maximum depth.
+    num_samples : int
+        Number of path samples at each depth.
+    cycle_free : bool
+        If True, only cycle-free paths are generated, using CFPGs. Default is
+        True.
+    signed : bool
+        Specifies whether the underlying graph has signed edges, encoded in
+        the 'sign' field of the edge data.
+    target_polarity : 0 or 1
+        For a signed graph, specifies the polarity of the target node: 0
+        indicates positive/activation, 1 indicates negative/inhibition.
+    reach_cache : Optional[paths_graph.ReachSetCache]
+        Cache to look up and store the forward and backward reachable sets
+        in, see :py:func:`sample_paths`.
+    rng : None, int, numpy.random.SeedSequence or numpy.random.Generator
+        Source of randomness, see :py:func:`paths_graph.sampling.get_rng`.
+        Default is None (the global NumPy random state).
+    chunk_size : Optional[int]
+        If given, paths are yielded in tuples of (at most) this many paths
+        instead of one by one.
+    distribution : str
+        'weighted' or 'uniform', see :py:func:`sample_paths`. Default is
+        'weighted'.
+
+    Returns
+    -------
+    generator
+        Generator of paths (or tuples of paths, if chunk_size is given),
+        each a tuple of node names, in order of increasing length.
+    """
+    rng = get_rng(rng)
+    paths = (path for pg in _iter_pgs_by_depth(g, source, target, max_depth,
+                                                cycle_free, signed,
+                                                target_polarity, reach_cache)
+             for path in pg.iter_samples(num_samples, rng=rng,
+                                         distribution=distribution))
+    return iter_chunks(paths, chunk_size)
 
 
 def count_paths(g, source, target, max_depth=None,
-                cycle_free=True, signed=False, target_polarity=0):
+                cycle_free=True, signed=False, target_polarity=0,
+                reach_cache=None):
     """Count unique paths over a range of lengths without explicit enumeration.
 
     Parameters
     ----------
-    g : networkx.DiGraph
+    g : networkx.DiGraph or CompiledGraph
         The underlying graph on which paths will be generated.
     source : str
         Name of the source node.
@@ -153,6 +290,12 @@ def count_paths(g, source, target, max_depth=None,
     target_polarity : 0 or 1
         For a signed graph, specifies the polarity of the target node: 0
         indicates positive/activation, 1 indicates negative/inhibition.
+    reach_cache : Optional[paths_graph.ReachSetCache]
+        If provided, the forward and backward reachable sets are looked up
+        in and stored in the cache, so that they are only computed once
+        across queries sharing the same source or target. In this case a
+        networkx graph is compiled on each call; pass a
+        :py:class:`paths_graph.CompiledGraph` to avoid this.
 
     Returns
     -------
@@ -160,22 +303,234 @@ def count_paths(g, source, target, max_depth=None,
         Total number of paths up to the specified maximum depth.
     """
     return _run_by_depth('count_paths', [], g, source, target, max_depth,
-                         cycle_free, signed, target_polarity)
+                         cycle_free, signed, target_polarity, reach_cache)
 
 
-def _run_by_depth(func_name, func_args, g, source, target, max_depth=None,
-                  cycle_free=True, signed=False, target_polarity=0):
-    """Run a function over paths graphs computed for different lengths."""
+def count_paths_by_length(g, source, target, max_depth=None, signed=False,
+                          target_polarity=0):
+    """Count paths (which may contain cycles) for each length up to a maximum.
+
+    The counts are the same as those of
+    :py:meth:`paths_graph.PathsGraph.count_paths` for the paths graph of
+    each length, but all lengths are counted in a single pass over the
+    graph, without building any paths graphs (see
+    :py:func:`paths_graph.compiled.count_walks_by_length`). The sum of the
+    counts is the result of :py:func:`count_paths` with cycle_free=False.
+
+    For signed graphs, this only holds if the target can be reached from the
+    source with positive polarity within the depth of the reachable sets:
+    otherwise the reachable sets are empty, and no paths graphs are built
+    even for a target_polarity of 1. Paths are counted here regardless, so
+    for example, a single negative edge from source to target gives one
+    path of length 1 with target_polarity=1, where
+    :py:meth:`paths_graph.PathsGraph.count_paths` gives 0.
+
+    Parameters
+    ----------
+    g : networkx.DiGraph or CompiledGraph
+        The underlying graph on which paths will be counted. When counting
+        paths for many pairs, pass a :py:class:`paths_graph.CompiledGraph`
+        to avoid compiling the graph on each call.
+    source : str
+        Name of the source node.
+    target : str
+        Name of the target node.
+    max_depth : Optional[int]
+        The maximum path length to consider. If not specified, the number of
+        nodes in the graph is used as the default maximum depth.
+    signed : bool
+        Specifies whether the underlying graph has signed edges, encoded in
+        the 'sign' field of the edge data.
+    target_polarity : 0 or 1
+        For a signed graph, specifies the polarity of the target node: 0
+        indicates positive/activation, 1 indicates negative/inhibition.
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of length max_depth + 1 whose entry k is the number of paths
+        of length k (the entry for length 0 is 0). The array has an object
+        dtype, holding Python ints, if the counts exceed the int64 range.
+    """
     if max_depth is None:
         max_depth = len(g)
-    f_level, b_level = get_reachable_sets(g, source, target, max_depth,
-                                          signed=signed)
-    # Compute path graphs over a range of path lengths
-    pg_by_length = {}
+    if not isinstance(g, CompiledGraph):
+        g = CompiledGraph.from_graph(g)
+    return count_walks_by_length(g, source, target, max_depth, signed=signed,
+                                 target_polarity=target_polarity)
+
+
+def batch_sample_paths(g, pairs, max_depth=None, num_samples=1000,
+                       cycle_free=True, signed=False, target_polarity=0,
+                       reach_cache=None, as_generator=False, rng=None,
+                       distribution='weighted'):
+    """Sample paths for many source/target pairs in the same graph.
+
+    Pairs are grouped by source, or by target if there are fewer distinct
+    targets than sources, and the forward and backward reachable sets are
+    computed only once for each distinct source and target by sharing a
+    :py:class:`paths_graph.ReachSetCache` across the pairs.
+
+    Parameters
+    ----------
+    g : networkx.DiGraph or CompiledGraph
+        The underlying graph on which paths will be generated. A networkx
+        graph is compiled once for the whole batch.
+    pairs : iterable of tuples
+        Each element is either a (source, target) tuple, or a (source,
+        target, target_polarity) tuple overriding the default target
+        polarity for that pair.
+    max_depth : Optional[int]
+        The maximum path length to consider. If not specified, the number of
+        nodes in the graph is used as the default maximum depth.
+    num_samples : int
+        Number of path samples at each depth, for each pair.
+    cycle_free : bool
+        If True, sample only cycle-free paths using CFPGs. Default is True.
+    signed : bool
+        Specifies whether the underlying graph has signed edges, encoded in
+        the 'sign' field of the edge data.
+    target_polarity : 0 or 1
+        For a signed graph, the default polarity of the target node for
+        pairs that don't specify one.
+    reach_cache : Optional[paths_graph.ReachSetCache]
+        Cache to use for the reachable sets. If not provided, a new cache is
+        created for the batch.
+    as_generator : bool
+        If True, return a generator yielding (pair, paths) tuples as each
+        pair is completed instead of a dict. Default is False.
+    rng : None, int, numpy.random.SeedSequence or numpy.random.Generator
+        Source of randomness, see :py:func:`paths_graph.sampling.get_rng`.
+        Default is None (the global NumPy random state).
+    distribution : str
+        'weighted' or 'uniform', see :py:func:`sample_paths`. Default is
+        'weighted'.
+
+    Returns
+    -------
+    dict or generator
+        Dictionary keyed by the pairs as given, with the list of sampled
+        paths for each pair as values (see :py:func:`sample_paths`).
+    """
+    results = _batch_by_depth('sample_paths', [num_samples], g, pairs,
+                              max_depth, cycle_free, signed, target_polarity,
+                              reach_cache, {'rng': get_rng(rng),
+                                            'distribution': distribution})
+    return results if as_generator else dict(results)
+
+
+def batch_count_paths(g, pairs, max_depth=None, cycle_free=True,
+                      signed=False, target_polarity=0, reach_cache=None,
+                      as_generator=False):
+    """Count paths for many source/target pairs in the same graph.
+
+    Pairs are grouped by source, or by target if there are fewer distinct
+    targets than sources, and the forward and backward reachable sets are
+    computed only once for each distinct source and target by sharing a
+    :py:class:`paths_graph.ReachSetCache` across the pairs.
+
+    Parameters
+    ----------
+    g : networkx.DiGraph or CompiledGraph
+        The underlying graph on which paths will be counted. A networkx
+        graph is compiled once for the whole batch.
+    pairs : iterable of tuples
+        Each element is either a (source, target) tuple, or a (source,
+        target, target_polarity) tuple overriding the default target
+        polarity for that pair.
+    max_depth : Optional[int]
+        The maximum path length to consider. If not specified, the number of
+        nodes in the graph is used as the default maximum depth.
+    cycle_free : bool
+        If True, count only cycle-free paths using CFPGs. Default is True.
+    signed : bool
+        Specifies whether the underlying graph has signed edges, encoded in
+        the 'sign' field of the edge data.
+    target_polarity : 0 or 1
+        For a signed graph, the default polarity of the target node for
+        pairs that don't specify one.
+    reach_cache : Optional[paths_graph.ReachSetCache]
+        Cache to use for the reachable sets. If not provided, a new cache is
+        created for the batch.
+    as_generator : bool
+        If True, return a generator yielding (pair, count) tuples as each
+        pair is completed instead of a dict. Default is False.
+
+    Returns
+    -------
+    dict or generator
+        Dictionary keyed by the pairs as given, with the total number of
+        paths up to the maximum depth for each pair as values.
+    """
+    results = _batch_by_depth('count_paths', [], g, pairs, max_depth,
+                              cycle_free, signed, target_polarity,
+                              reach_cache)
+    return results if as_generator else dict(results)
+
+
+def _batch_by_depth(func_name, func_args, g, pairs, max_depth=None,
+                    cycle_free=True, signed=False, target_polarity=0,
+                    reach_cache=None, func_kwargs=None):
+    """Run a function over paths graphs for a batch of source/target pairs.
+
+    Yields (pair, result) tuples. Pairs are processed grouped by source, or
+    by target if the batch has fewer distinct targets than sources, so that
+    the pairs sharing the more common endpoint run back to back and reuse
+    its cached reachable sets before they can be evicted.
+    """
+    if reach_cache is None:
+        reach_cache = ReachSetCache()
+    g = reach_cache.compile(g)
+    pairs = list(pairs)
+    sources = set(pair[0] for pair in pairs)
+    targets = set(pair[1] for pair in pairs)
+    key_ix = 1 if len(targets) < len(sources) else 0
+    # Group the pairs by the chosen endpoint, keeping the order in which the
+    # endpoints are first seen
+    pairs_by_key = {}
+    keys = []
+    for pair in pairs:
+        if pair[key_ix] not in pairs_by_key:
+            pairs_by_key[pair[key_ix]] = []
+            keys.append(pair[key_ix])
+        pairs_by_key[pair[key_ix]].append(pair)
+    logger.info("Running %s for %d %s" %
+                (func_name, len(keys), 'targets' if key_ix else 'sources'))
+    for key in keys:
+        for pair in pairs_by_key[key]:
+            source, target = pair[:2]
+            pair_polarity = pair[2] if len(pair) > 2 else target_polarity
+            result = _run_by_depth(func_name, func_args, g, source, target,
+                                   max_depth, cycle_free, signed,
+                                   pair_polarity, reach_cache, func_kwargs)
+            yield (pair, result)
+
+
+def _run_by_depth(func_name, func_args, g, source, target, max_depth=None,
+                  cycle_free=True, signed=False, target_polarity=0,
+                  reach_cache=None, func_kwargs=None):
+    """Run a function over paths graphs computed for different lengths."""
     if func_name == 'count_paths':
         results = 0
     else:
         results = []
+    for pg in _iter_pgs_by_depth(g, source, target, max_depth, cycle_free,
+                                 signed, target_polarity, reach_cache):
+        func = getattr(pg, func_name)
+        results += func(*func_args, **(func_kwargs or {}))
+    return results
+
+
+def _iter_pgs_by_depth(g, source, target, max_depth=None, cycle_free=True,
+                       signed=False, target_polarity=0, reach_cache=None):
+    """Generate the non-empty paths graphs for a range of lengths."""
+    if max_depth is None:
+        max_depth = len(g)
+    if reach_cache is not None:
+        g = reach_cache.compile(g)
+    f_level, b_level = get_reachable_sets(g, source, target, max_depth,
+                                          signed=signed, cache=reach_cache)
+    # Compute path graphs over a range of path lengths
     for path_length in range(1, max_depth+1):
         logger.info("Length %d: computing paths graph" % path_length)
         args = [g, source, target, path_length, f_level, b_level]
@@ -184,10 +539,5 @@ def _run_by_depth(func_name, func_args, g, source, target, max_depth=None,
             pg = CFPG.from_graph(*args, **kwargs)
         else:
             pg = PathsGraph.from_graph(*args, **kwargs)
-        pg_by_length[path_length] = pg
-        # If we're sampling by depth, do sampling here
         if pg:
-            func = getattr(pg, func_name)
-            results += func(*func_args)
-    return results
-
+            yield pg
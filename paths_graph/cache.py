@@ -0,0 +1,122 @@
+import logging
+from collections import OrderedDict
+import numpy as np
+from .compiled import CompiledGraph, expand_levels
+from .pg import get_reachable_sets
+
+logger = logging.getLogger('paths_graph')
+
+
+class ReachSetCache(object):
+    """Least-recently-used cache of forward and backward reachable levels.
+
+    The forward levels computed by :py:func:`paths_graph.get_reachable_sets`
+    depend only on the graph, the source, the maximum depth and whether the
+    graph is signed; likewise the backward levels only depend on the target.
+    This cache stores each direction independently, keyed by the fingerprint
+    of the compiled graph and the endpoint, so that queries sharing a source
+    or a target compute the corresponding levels only once. If a query asks
+    for a greater depth than has been cached, the cached levels are extended
+    rather than recomputed.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Approximate upper bound on the memory used by the cached level masks.
+        When it is exceeded, the least recently used entries are evicted.
+        Default is 1 GB.
+
+    Attributes
+    ----------
+    hits : int
+        Number of lookups that found the endpoint in the cache.
+    misses : int
+        Number of lookups that had to start from scratch.
+    nbytes : int
+        Memory currently used by the cached level masks.
+    """
+    def __init__(self, max_bytes=2**30):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+
+    def get_reachable_sets(self, g, source, target, max_depth=10,
+                           signed=False):
+        """Get reachable sets of a graph, using and updating the cache.
+
+        Takes the same arguments as :py:func:`paths_graph.get_reachable_sets`
+        and returns the same result.
+        """
+        return get_reachable_sets(g, source, target, max_depth=max_depth,
+                                  signed=signed, cache=self)
+
+    def get_levels(self, cg, start, max_depth, direction='forward',
+                   signed=False):
+        """Get the level masks reachable from a state, up to a given depth.
+
+        Parameters
+        ----------
+        cg : CompiledGraph
+            The graph to compute the levels in.
+        start : int
+            The state (see :py:meth:`CompiledGraph.state`) at depth 0.
+        max_depth : int
+            The depth up to which levels are required.
+        direction : str
+            'forward' to follow out-edges, 'backward' to follow in-edges.
+        signed : bool
+            Whether the levels are over signed (node, polarity) states.
+
+        Returns
+        -------
+        list of numpy.ndarray
+            Boolean state masks for each depth. The list may be longer than
+            requested if deeper levels were cached previously, or shorter if
+            no states are reachable at greater depths.
+        """
+        key = (cg.fingerprint, direction, start, signed)
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            masks = [np.zeros(cg.num_states(signed), dtype=bool)]
+            masks[0][start] = True
+            exhausted = False
+        else:
+            self.hits += 1
+            masks, exhausted = entry
+            self.nbytes -= _masks_nbytes(masks)
+        if not exhausted and len(masks) <= max_depth:
+            exhausted = expand_levels(cg, masks, max_depth, direction, signed)
+        # Re-inserting the entry marks it as the most recently used
+        self._entries[key] = (masks, exhausted)
+        self.nbytes += _masks_nbytes(masks)
+        self._evict()
+        return masks
+
+    def compile(self, g):
+        """Return the graph as a CompiledGraph, compiling it if necessary."""
+        if isinstance(g, CompiledGraph):
+            return g
+        return CompiledGraph.from_graph(g)
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        self._entries.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict(self):
+        # Always keep the most recently used entry, even if it is larger
+        # than the memory cap by itself
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            key, (masks, _) = self._entries.popitem(last=False)
+            self.nbytes -= _masks_nbytes(masks)
+            logger.debug("Evicted reach set for %s" % str(key[1:]))
+
+
+def _masks_nbytes(masks):
+    return sum(mask.nbytes for mask in masks)
@@ -1,11 +1,19 @@
-import os
 import logging
 import itertools
+import contextlib
+from bisect import bisect_right
 from collections import Counter
 import numpy as np
 import networkx as nx
 from paths_graph import PathsGraph
+from paths_graph.pg import iter_chunks, _is_parallel
 from paths_graph.pre_cfpg import PreCFPG
+from paths_graph.parallel import sample_parallel, worker_pool, \
+                                 run_with_worker_obj, get_n_jobs
+from paths_graph.prune import prune_graph
+from paths_graph.sampling import cumulative_weights, canonical_order, \
+                                 get_rng, sample_distinct_indices, \
+                                 stochastic_beam_search
 import pickle
 
 
@@ -75,15 +83,24 @@ class CFPG(PathsGraph):
     ensure that the set of tags of u (T_cf[u]) is included in the set of tags
     of v (T_cf[v]) in G_cf. The challenge is to achieve this while ensuring
     that the properies (CF1), (CF2) and (CF3) are met.
+
+    The nodes of G_cf are of the form (level, name, tags), with the tags
+    given as a frozenset of nodes of G_0 (and 0 for the source and target).
+    In compact mode (see :py:meth:`to_compact`), the tags in each node are
+    instead replaced by the index of the tag set in the `tag_sets` table,
+    in which each distinct tag set is stored once; :py:meth:`node_view` and
+    :py:meth:`to_full` give back the nodes with their tag sets.
     """
     def __init__(self, source_name, source_node, target_name, target_node,
-                 path_length, graph):
+                 path_length, graph, signed=False, tag_sets=None):
         self.source_name = source_name
         self.source_node = source_node
         self.target_name = target_name
         self.target_node = target_node
         self.path_length = path_length
         self.graph = graph
+        self.signed = signed
+        self.tag_sets = tag_sets
 
     @classmethod
     def from_graph(klass, *args, **kwargs):
@@ -91,7 +108,7 @@ class CFPG(PathsGraph):
 
         Parameters
         ----------
-        g : networkx.DiGraph
+        g : networkx.DiGraph or CompiledGraph
             The underlying graph on which paths will be generated.
         source : str
             Name of the source node.
@@ -123,6 +140,15 @@ class CFPG(PathsGraph):
         target_polarity : 0 or 1
             Specifies the polarity of the target node: 0 indicates
             positive/activation, 1 indicates negative/inhibition.
+        compact : bool
+            If True, the CFPG is built in compact mode, with tag sets
+            interned in a table (see :py:meth:`to_compact`). Default is
+            False.
+        n_jobs : Optional[int]
+            If given (and not 1), the nodes of each level are split in
+            this many worker processes (-1 uses all CPUs). The CFPG built
+            is the same as with a single process. Default is None (build
+            in this process).
 
         Returns
         -------
@@ -131,11 +157,13 @@ class CFPG(PathsGraph):
             target with a given length and overall polarity.
         """
         #pre_cfpg = PreCFPG.from_graph(*args, **kwargs)
+        compact = kwargs.pop('compact', False)
+        n_jobs = kwargs.pop('n_jobs', None)
         pg = PathsGraph.from_graph(*args, **kwargs)
-        return klass.from_pg(pg)
+        return klass.from_pg(pg, compact=compact, n_jobs=n_jobs)
 
     @classmethod
-    def from_pg(klass, pg):
+    def from_pg(klass, pg, compact=False, n_jobs=None):
         """Get an instance of a CFPG from a PathsGraph.
 
         Parameters
@@ -143,6 +171,15 @@ class CFPG(PathsGraph):
         pg : PathsGraph
             "Raw" (contains cycles) paths graph as created by
             :py:func:`indra.explanation.paths_graph.PathsGraph.from_graph`.
+        compact : bool
+            If True, the CFPG is built in compact mode, with tag sets
+            interned in a table (see :py:meth:`to_compact`). Default is
+            False.
+        n_jobs : Optional[int]
+            If given (and not 1), the nodes of each level are split in
+            this many worker processes (-1 uses all CPUs). The CFPG built
+            is the same as with a single process. Default is None (build
+            in this process).
 
         Returns
         -------
@@ -160,7 +197,8 @@ class CFPG(PathsGraph):
         if not pg.graph:
             return CFPG(pg.source_name, pg.source_node + (0,),
                         pg.target_name, pg.target_node + (0,),
-                        pg.path_length, nx.DiGraph())
+                        pg.path_length, nx.DiGraph(),
+                        tag_sets=[0] if compact else None)
         pg_raw = pg.graph
         ntp_0 = [v for v in pg_raw.nodes()
                  if (v != src_2node and v[1] == src_2node[1]) or
@@ -172,59 +210,37 @@ class CFPG(PathsGraph):
             pg_0 = pg_raw
         else:
             pg_0 = prune(pg_raw, ntp_0, src_2node, tgt_2node)
-        if not pg_0:
+        # There are no paths if the source or target were pruned away
+        if src_2node not in pg_0 or tgt_2node not in pg_0:
             return CFPG(pg.source_name, pg.source_node + (0,),
                         pg.target_name, pg.target_node + (0,),
-                        pg.path_length, nx.DiGraph())
+                        pg.path_length, nx.DiGraph(),
+                        tag_sets=[0] if compact else None)
 
-        past = get_past(src_2node,tgt_2node, pg_0)
+        node_bits = _NodeBits(pg_0)
+        tag_table = _TagTable(node_bits, compact)
+        past = _get_past_bits(src_2node, tgt_2node, pg_0, node_bits)
+        state = _SplitState(src_2node, pg_0, node_bits, past=past)
         next_tgt = {tgt_3node: []}
         pred_tgt = {tgt_3node: list(pg_0.predecessors(tgt_2node))}
         past_tgt = past[tgt_2node]
         t_cf_tgt = {tgt_3node: past_tgt}
         dic_CF = {path_length: ([tgt_3node], next_tgt, pred_tgt, t_cf_tgt)}
-        for i in reversed(range(1, path_length)):
-            V_ip1, next_ip1, pred_ip1, t_cf_ip1 = dic_CF[i+1]
-            #assert V_ip1 != []
-            V_current = []
-            for v in V_ip1:
-                V_current.extend(pred_ip1[v])
-                V_current = list(set(V_current))
-            #assert V_current != []
-            V_i = []
-            next_i = {}
-            pred_i = {}
-            t_cf_i = {}
-        # Now comes the heart of the construction. We take a node x in
-        # V_current and split it into -in general- multiple copies to ensure
-        # that if (u,v) is an edge in G_cf then the set of tags of u is
-        # included in the set of tags of v
-            for x in V_current:
-                past_x = past[x]
-                pg_x = pg_0.subgraph(past_x)
-                ntp_x = [v for v in past_x if v != x and v[1] == x[1]]
-                """
-                For the negative polarity case the above should be:
-                ntp_x = [v for v in past_x if v != x and v[1][0] == x[1][0]]
-                
-                """
-                if ntp_x == []:
-                    tags_x = pg_x.nodes()
-                else:
-                    pg_x_pruned = prune(pg_x, ntp_x, src_2node, x)
-                    if x not in pg_x_pruned or src_2node not in nx.ancestors(pg_x_pruned, x):
-                        continue
-                    tags_x = pg_x_pruned.nodes()
-                X_ip1 = [w for w in V_ip1 if x in pred_ip1[w]]
-                X_im1 = list(pg_0.predecessors(x))
-                assert X_ip1 != []
-                V_x, next_x, pred_x, t_cf_x = \
-                         _split_graph(src_2node, tgt_2node, x,  X_ip1, X_im1, t_cf_ip1, tags_x, pg_0)
-                V_i.extend(V_x)
-                next_i.update(next_x)
-                pred_i.update(pred_x)
-                t_cf_i.update(t_cf_x)
-            dic_CF[i] = (V_i, next_i, pred_i, t_cf_i)
+        with _split_pool(state, n_jobs) as pool:
+            for i in reversed(range(1, path_length)):
+                V_ip1, next_ip1, pred_ip1, t_cf_ip1 = dic_CF[i+1]
+                #assert V_ip1 != []
+                V_current = []
+                for v in V_ip1:
+                    V_current.extend(pred_ip1[v])
+                    V_current = list(set(V_current))
+                #assert V_current != []
+                # Now comes the heart of the construction. We take a node x
+                # in V_current and split it into -in general- multiple copies
+                # to ensure that if (u,v) is an edge in G_cf then the set of
+                # tags of u is included in the set of tags of v
+                dic_CF[i] = _split_level(V_current, dic_CF[i+1], state,
+                                         tag_table, pool, n_jobs)
         V_1 = dic_CF[1][0]
         V_0 = [src_3node]
         next_src = {src_3node: V_1}
@@ -236,14 +252,16 @@ class CFPG(PathsGraph):
     # Prune out possible unreachable nodes in G_cf
         nodes_prune = [v for v in G_cf if (v != tgt_3node and not G_cf.successors(v)) or
                         (v != src_3node and not G_cf.predecessors(v))]
-        G_cf_pruned = prune(G_cf, nodes_prune, src_3node, tgt_3node)
+        G_cf_pruned = prune(G_cf, nodes_prune, src_3node, tgt_3node,
+                            in_place=True)
 
         return klass(pg.source_name, pg.source_node + (0,),
                      pg.target_name, pg.target_node + (0,),
-                     pg.path_length, G_cf_pruned)
+                     pg.path_length, G_cf_pruned, pg.signed,
+                     tag_table.tag_sets if compact else None)
 
     @classmethod
-    def from_pre_cfpg(klass, pre_cfpg):
+    def from_pre_cfpg(klass, pre_cfpg, compact=False, n_jobs=None):
         """Generate a cycle free paths graph (CFPG).
 
         Implements the major step (the outer loop) for constructing G_cf. We do
@@ -277,6 +295,15 @@ class CFPG(PathsGraph):
         ----------
         pre_cfpg : instance of PreCFPG
             The pre-cycle free paths graph to use to compute the CFPG.
+        compact : bool
+            If True, the CFPG is built in compact mode, with tag sets
+            interned in a table (see :py:meth:`to_compact`). Default is
+            False.
+        n_jobs : Optional[int]
+            If given (and not 1), the nodes of each level are split in
+            this many worker processes (-1 uses all CPUs). The CFPG built
+            is the same as with a single process. Default is None (build
+            in this process).
 
         Returns
         -------
@@ -296,58 +323,54 @@ class CFPG(PathsGraph):
         if not pre_cfpg.graph:
             return CFPG(pre_cfpg.source_name, pre_cfpg.source_node + (0,),
                         pre_cfpg.target_name, pre_cfpg.target_node + (0,),
-                        pre_cfpg.path_length, nx.DiGraph())
+                        pre_cfpg.path_length, nx.DiGraph(),
+                        tag_sets=[0] if compact else None)
         # We first hardwire the contents of the dictionary for the level of the
         # target node: dic_CF[path_length]
+        # Tag sets are handled as bitsets over the nodes of the pre-CFPG (and
+        # any pruned nodes remaining in the tags)
+        node_bits = _NodeBits(pre_cfpg.graph,
+                              itertools.chain(*pre_cfpg.tags.values()))
+        tags_bits = dict((node, node_bits.to_bits(tags))
+                         for node, tags in pre_cfpg.tags.items())
+        tag_table = _TagTable(node_bits, compact)
+        state = _SplitState(src_2node, pre_cfpg.graph, node_bits,
+                            tags=tags_bits)
         next_tgt = {tgt_3node: []}
         pred_tgt = {tgt_3node: list(pre_cfpg.graph.predecessors(tgt_2node))}
-        t_cf_tgt = {tgt_3node: pre_cfpg.tags[tgt_2node]}
+        t_cf_tgt = {tgt_3node: tags_bits[tgt_2node]}
         dic_CF = {path_length: ([tgt_3node], next_tgt, pred_tgt, t_cf_tgt)}
         logger.info("Creating CFPG from pre-CFPG")
-        # Iterate from level n-1 (one "above" the target) back to the source
-        for i in reversed(range(1, path_length)):
-            # Get the information for level i+1 (one level closer to the target)
-            V_ip1, next_ip1, pred_ip1, t_cf_ip1 = dic_CF[i+1]
-            # Because we are working off of a non-empty pre-CFPG, we should
-            # never end with a level in the graph with no nodes
-            assert V_ip1 != []
-            # TODO: Can V_current be replaced simply by the nodes in pre-CFPG at
-            # level i?
-            # TODO: Rename V_current -> V_i_old, V_i -> V_i_new?
-            V_current = []
-            for v in V_ip1:
-                V_current.extend(pred_ip1[v])
-                V_current = list(set(V_current))
-            # V_current should never be empty by construction of the pre-CFPG
-            assert V_current != []
-            # Thus V_current is the set of nodes (which will be 2-tuples) at
-            # level i to be processed. The converted  nodes (which will be
-            # 3-tuples, including the copy number) will be binned into V_i.
-            V_i, next_i, pred_i, t_cf_i = ([], {}, {}, {})
-            # Now comes the heart of the construction. We take a node x in
-            # V_current and split it into--in general--multiple copies to ensure
-            # that if (u,v) is an edge in G_cf then the set of tags of u is
-            # included in the set of tags of v
-            for x in V_current:
-                # X_ip1 is the set of nodes at the level i+1 to which x is
-                # connected via the pred_ip1 function. These nodes, already
-                # processed, will be 3-tuples. X_im1 are the set of predecessor
-                # nodes of x at the level i-1. They are unprocessed 2-tuples.
-                X_ip1 = [w for w in V_ip1 if x in pred_ip1[w]]
-                X_im1 = list(pre_cfpg.graph.predecessors(x))
-                assert X_ip1 != []
-                # The actual splitting of node x and connect the resulting
-                # copies of x to its neighbors above and below is carried out
-                # by the _split_graph function, below.
-                V_x, next_x, pred_x, t_cf_x = \
-                        _split_graph(src_2node, tgt_2node, x, X_ip1, X_im1,
-                                     t_cf_ip1, pre_cfpg.tags[x], pre_cfpg.graph)
-                # We now extend V_i, next_i, pred_i and t_i in the obvious way.
-                V_i.extend(V_x) # V_x contains the new, split versions of x
-                next_i.update(next_x)
-                pred_i.update(pred_x)
-                t_cf_i.update(t_cf_x)
-            dic_CF[i] = (V_i, next_i, pred_i, t_cf_i)
+        with _split_pool(state, n_jobs) as pool:
+            # Iterate from level n-1 (one "above" the target) back to the
+            # source
+            for i in reversed(range(1, path_length)):
+                # Get the information for level i+1 (one level closer to the
+                # target)
+                V_ip1, next_ip1, pred_ip1, t_cf_ip1 = dic_CF[i+1]
+                # Because we are working off of a non-empty pre-CFPG, we
+                # should never end with a level in the graph with no nodes
+                assert V_ip1 != []
+                # TODO: Can V_current be replaced simply by the nodes in
+                # pre-CFPG at level i?
+                # TODO: Rename V_current -> V_i_old, V_i -> V_i_new?
+                V_current = []
+                for v in V_ip1:
+                    V_current.extend(pred_ip1[v])
+                    V_current = list(set(V_current))
+                # V_current should never be empty by construction of the
+                # pre-CFPG
+                assert V_current != []
+                # Thus V_current is the set of nodes (which will be 2-tuples)
+                # at level i to be processed. The converted  nodes (which will
+                # be 3-tuples, including the tags) will be binned into V_i.
+                # Now comes the heart of the construction. We take a node x
+                # in V_current and split it into--in general--multiple copies
+                # to ensure that if (u,v) is an edge in G_cf then the set of
+                # tags of u is included in the set of tags of v. This is
+                # carried out by the _split_level function, below.
+                dic_CF[i] = _split_level(V_current, dic_CF[i+1], state,
+                                         tag_table, pool, n_jobs)
         # Finally we hardwire dic_CF[0]
         V_1 = dic_CF[1][0]
         V_0 = [src_3node]
@@ -360,10 +383,71 @@ class CFPG(PathsGraph):
         nodes_prune = [v for v in G_cf
                          if (v != tgt_3node and not G_cf.successors(v)) or
                             (v != src_3node and not G_cf.predecessors(v))]
-        G_cf_pruned = prune(G_cf, nodes_prune, src_3node, tgt_3node)
+        G_cf_pruned = prune(G_cf, nodes_prune, src_3node, tgt_3node,
+                            in_place=True)
         return klass(pre_cfpg.source_name, pre_cfpg.source_node + (0,),
                      pre_cfpg.target_name, pre_cfpg.target_node + (0,),
-                     pre_cfpg.path_length, G_cf_pruned)
+                     pre_cfpg.path_length, G_cf_pruned, pre_cfpg.signed,
+                     tag_table.tag_sets if compact else None)
+
+    def node_view(self, node):
+        """Return a node of the graph with its tags as a set of nodes.
+
+        In compact mode, the tag set index in the node is replaced by the
+        tag set itself, giving the node as it is in a CFPG that is not in
+        compact mode; otherwise the node is returned as is.
+        """
+        if self.tag_sets is None:
+            return node
+        return node[0:2] + (self.tag_sets[node[2]],)
+
+    def to_compact(self):
+        """Return the CFPG in compact mode.
+
+        In compact mode, each distinct tag set is stored once, in the
+        `tag_sets` list, and the nodes of the graph are of the form (level,
+        name, tag_id) with the index of their tag set in the list. Hashing
+        and comparing these nodes doesn't involve their (potentially large)
+        tag sets. The first entry of `tag_sets` is 0, the tag of the source
+        and target nodes.
+
+        Returns
+        -------
+        CFPG
+            A CFPG in compact mode with the same paths (self if it is already
+            in compact mode).
+        """
+        if self.tag_sets is not None:
+            return self
+        tag_ids = {0: 0}
+        mapping = {}
+        for node in self.graph:
+            tag_id = tag_ids.setdefault(node[2], len(tag_ids))
+            mapping[node] = node[0:2] + (tag_id,)
+        tag_sets = sorted(tag_ids, key=tag_ids.get)
+        return self._relabeled(mapping, tag_sets)
+
+    def to_full(self):
+        """Return the CFPG with the tag sets in its nodes.
+
+        Returns
+        -------
+        CFPG
+            A CFPG with the same paths that is not in compact mode (self if
+            it is not in compact mode), see :py:meth:`node_view`.
+        """
+        if self.tag_sets is None:
+            return self
+        mapping = dict((node, self.node_view(node)) for node in self.graph)
+        return self._relabeled(mapping, None)
+
+    def _relabeled(self, mapping, tag_sets):
+        graph = nx.relabel_nodes(self.graph, mapping, copy=True)
+        return self.__class__(self.source_name, mapping.get(self.source_node,
+                                                            self.source_node),
+                              self.target_name, mapping.get(self.target_node,
+                                                            self.target_node),
+                              self.path_length, graph, self.signed, tag_sets)
 
 
 class CombinedCFPG(object):
@@ -374,6 +458,7 @@ class CombinedCFPG(object):
     cfpg_list : list of cfpg instances
     """
     def __init__(self, cfpg_list):
+        self.cfpg_list = cfpg_list
         self.graph = nx.DiGraph()
         for cfpg in cfpg_list:
             self.graph.add_edges_from(cfpg.graph.edges(data=True))
@@ -382,8 +467,11 @@ class CombinedCFPG(object):
         self.source_node = cfpg.source_node
         self.target_name = cfpg.target_name
         self.target_node = cfpg.target_node
+        # Sampling tables keyed by the set of nodes the sampler is at
+        self._successor_tables = {}
 
-    def sample_paths(self, num_samples):
+    def sample_paths(self, num_samples, rng=None, n_jobs=None,
+                     executor=None):
         """Sample paths of variable length between source and target.
 
         Sampling makes use of edge weights where available; if they are not
@@ -393,6 +481,17 @@ class CombinedCFPG(object):
         ----------
         num_samples : int
             The number of paths to sample.
+        rng : None, int, numpy.random.SeedSequence or numpy.random.Generator
+            Source of randomness, see :py:func:`paths_graph.sampling.get_rng`.
+            Default is None (the global NumPy random state).
+        n_jobs : Optional[int]
+            If given (and not 1), the samples are split across this many
+            worker processes, each with an independent random stream spawned
+            from rng (see :py:func:`paths_graph.parallel.sample_parallel`).
+            -1 uses all CPUs. Default is None (sample in this process).
+        executor : Optional[concurrent.futures.Executor]
+            Process-based executor to run parallel sampling tasks in. If
+            given without n_jobs, the number of CPUs is used as n_jobs.
 
         Returns
         -------
@@ -402,53 +501,218 @@ class CombinedCFPG(object):
         """
         if not self.graph:
             return tuple([])
-        paths = []
-        while len(paths) < num_samples:
+        if _is_parallel(n_jobs, executor):
+            return sample_parallel(self, 'sample_paths', num_samples,
+                                   n_jobs, executor, rng)
+        return tuple(self.iter_samples(num_samples, rng=rng))
+
+    def iter_samples(self, num_samples=None, rng=None, chunk_size=None):
+        """Iterate over paths of variable length sampled from the graph.
+
+        Paths are sampled one at a time as the generator is consumed, so
+        that memory use doesn't grow with the number of samples.
+
+        Parameters
+        ----------
+        num_samples : Optional[int]
+            The number of paths to sample. If None, sampling continues for
+            as long as the generator is consumed.
+        rng : None, int, numpy.random.SeedSequence or numpy.random.Generator
+            Source of randomness, see :py:func:`paths_graph.sampling.get_rng`.
+            Default is None (the global NumPy random state).
+        chunk_size : Optional[int]
+            If given, the paths are yielded in tuples of (at most) this many
+            paths instead of one by one.
+
+        Returns
+        -------
+        generator
+            Generator of paths (or tuples of paths, if chunk_size is given).
+        """
+        return iter_chunks(self._iter_samples(num_samples, rng), chunk_size)
+
+    def _iter_samples(self, num_samples, rng):
+        if not self.graph:
+            return
+        rng = get_rng(rng)
+        count = 0
+        while num_samples is None or count < num_samples:
             # Get a path, starting from the source node
             current_nodes = [self.source_node]
             current_name = self.source_name
             path = [current_name]
             while current_name != self.target_name:
-                current_name, current_nodes = self._successors(current_nodes)
+                current_name, current_nodes = \
+                        self._successors(current_nodes, rng)
                 path.append(current_name)
-            # Add the current path
-            paths.append(tuple(path))
-        return tuple(paths)
+            count += 1
+            yield tuple(path)
+
+    def sample_unique_paths(self, k, weighted=True, rng=None):
+        """Sample k distinct paths of variable length without replacement.
+
+        Parameters
+        ----------
+        k : int
+            The number of paths to sample. If it is at least the total number
+            of paths in the CFPGs, all paths are returned, in order of
+            length and then in enumeration order.
+        weighted : bool
+            If True, paths are drawn one at a time, each with probability
+            proportional to its probability under :py:meth:`sample_paths`
+            among the paths not drawn yet (using a stochastic beam search,
+            see :py:func:`paths_graph.sampling.stochastic_beam_search`), and
+            are returned in the order they are drawn. If False, every set of
+            k paths of any length is equally likely, and the paths are
+            returned ordered by length and then in enumeration order.
+            Default is True.
+        rng : None, int, numpy.random.SeedSequence or numpy.random.Generator
+            Source of randomness, see :py:func:`paths_graph.sampling.get_rng`.
+            Default is None (the global NumPy random state).
+
+        Returns
+        -------
+        tuple of tuples
+            Each item is a tuple of strings representing a path.
+        """
+        cfpg_list = [cfpg for cfpg in self.cfpg_list if cfpg.graph]
+        counts = [cfpg.count_paths() for cfpg in cfpg_list]
+        if k >= sum(counts):
+            return tuple(path for cfpg in cfpg_list
+                         for path in cfpg.enumerate_paths())
+        rng = get_rng(rng)
+        if not weighted:
+            paths = []
+            indices = sample_distinct_indices(sum(counts), k, rng)
+            offset = 0
+            cfpg_ix = 0
+            # The indices are sorted so the CFPGs can be traversed in order
+            for index in indices:
+                while index - offset >= counts[cfpg_ix]:
+                    offset += counts[cfpg_ix]
+                    cfpg_ix += 1
+                paths.append(cfpg_list[cfpg_ix].path_at(index - offset))
+            return tuple(paths)
+
+        # States are the nodes the sampler is at and the path of names so far
+        def children(state):
+            current_nodes, path = state
+            succs = self._successor_probabilities(current_nodes)
+            with np.errstate(divide='ignore'):
+                log_probs = np.log([prob for _, prob, _ in succs]).tolist()
+            return [((next_nodes, path + (name,)), log_prob,
+                     name == self.target_name)
+                    for (name, _, next_nodes), log_prob in
+                    zip(succs, log_probs)]
+
+        states = stochastic_beam_search(((self.source_node,),
+                                         (self.source_name,)),
+                                        children, k, rng)
+        return tuple(path for _, path in states)
+
+    def visit_probabilities(self):
+        """Return the probability that a sampled path visits each node and
+        edge.
+
+        The probabilities are exact marginals of the distribution of paths
+        sampled by :py:meth:`sample_paths`, obtained in a single forward
+        pass: the probability of each state of the sampler (the set of
+        nodes it is at) is propagated one step at a time using the
+        transition probabilities of the state, merging the probabilities of
+        paths that lead to the same state.
+
+        Returns
+        -------
+        tuple of dicts
+            Dictionaries mapping nodes, as (depth, name) tuples, and edges
+            between them, as (u, v) tuples, to their visit probabilities.
+        """
+        node_probs = {}
+        edge_probs = {}
+        if not self.graph:
+            return node_probs, edge_probs
+        node_probs[(0, self.source_name)] = 1.0
+        states = {(self.source_node,): 1.0}
+        depth = 0
+        while states:
+            next_states = {}
+            for current_nodes, state_prob in states.items():
+                u = (depth, current_nodes[0][1])
+                # Sampling stops at the target
+                if u[1] == self.target_name:
+                    continue
+                for name, prob, next_nodes in \
+                        self._successor_probabilities(current_nodes):
+                    prob *= state_prob
+                    v = (depth + 1, name)
+                    next_states[next_nodes] = \
+                            next_states.get(next_nodes, 0.0) + prob
+                    node_probs[v] = node_probs.get(v, 0.0) + prob
+                    edge_probs[(u, v)] = edge_probs.get((u, v), 0.0) + prob
+            states = next_states
+            depth += 1
+        return node_probs, edge_probs
+
+    def path_length_distribution(self):
+        """Return the probability that a sampled path has each length.
+
+        Returns
+        -------
+        dict
+            Dictionary mapping path lengths to the probability that a path
+            sampled with :py:meth:`sample_paths` has that length, computed
+            analytically from :py:meth:`visit_probabilities`.
+        """
+        node_probs, _ = self.visit_probabilities()
+        return dict((node[0], prob) for node, prob in node_probs.items()
+                    if node[1] == self.target_name)
 
-    def _successors(self, current_nodes):
+    def _successors(self, current_nodes, rng):
+        node_names, cdf, nodes_by_name = self._successor_table(current_nodes)
+        pred_idx = bisect_right(cdf, rng.random())
+        next_name = node_names[pred_idx]
+        next_nodes = nodes_by_name[next_name]
+        return (next_name, next_nodes)
+
+    def _successor_table(self, current_nodes):
+        key = tuple(current_nodes)
+        table = self._successor_tables.get(key)
+        if table is None:
+            table = self._get_successor_table(current_nodes)
+            self._successor_tables[key] = table
+        return table
+
+    def _successor_probabilities(self, current_nodes):
+        # The names the sampler can move to from a set of nodes, with the
+        # probability of each, and the nodes it would then be at
+        node_names, cdf, nodes_by_name = self._successor_table(current_nodes)
+        probs = np.diff([0.0] + cdf).tolist()
+        return [(name, prob, tuple(nodes_by_name[name]))
+                for name, prob in zip(node_names, probs)]
+
+    def _get_successor_table(self, current_nodes):
         out_edges = [e for node in current_nodes
                        for e in self.graph.out_edges(node, data=True)]
         weight_dict = {}
         nodes_by_name = {}
         for u, v, data in out_edges:
             v_name = v[1]
-            weight_dict[v_name] = data['weight']
+            weight_dict[v_name] = data.get('weight', 1.0)
             if v_name in nodes_by_name:
                 nodes_by_name[v_name].append(v)
             else:
                 nodes_by_name[v_name] = [v]
-        # Get list of possible downstream nodes with associated weights
-        node_names = []
-        weights = np.empty(len(nodes_by_name))
-        nodes_by_name_keys = nodes_by_name.keys()
-        # If we're testing, canonicalize the order of the nodes we're choosing
-        if 'TEST_FLAG' in os.environ:
-            nodes_by_name_keys = sorted(list(nodes_by_name_keys))
-        # Get node names and weights in a corresponding order
-        for ix, name in enumerate(nodes_by_name_keys):
-            node_names.append(name)
-            weights[ix] = weight_dict[name]
-        # Normalize the weights to a proper probability distribution
-        p =  weights / np.sum(weights)
-        pred_idx = np.random.choice(len(node_names), p=p)
-        next_name = node_names[pred_idx]
-        next_nodes = nodes_by_name[next_name]
-        return (next_name, next_nodes)
+        # Get list of possible downstream nodes with associated weights, in
+        # a canonical order so that seeded sampling is reproducible
+        node_names = canonical_order(nodes_by_name.keys())
+        # Get node weights in a corresponding order
+        weights = [weight_dict[name] for name in node_names]
+        return (node_names, cumulative_weights(weights), nodes_by_name)
 
-def prune(g, nodes_to_prune, source, target):
-    """Iteratively prunes nodes from a copy of the paths graph.
+def prune(g, nodes_to_prune, source, target, in_place=False):
+    """Iteratively prunes nodes from (a copy of) a paths graph or CFPG.
 
-    We prune the graph *pg* iteratively by the following procedure:
+    We prune the graph *g* iteratively by the following procedure:
       1. Remove the nodes given by *nodes_to_prune* from the graph.
       2. Identify nodes (other than the source node) that now have no
          incoming edges.
@@ -457,9 +721,12 @@ def prune(g, nodes_to_prune, source, target):
       4. Set *nodes_to_prune* to the nodes identified in steps 2 and 3.
       5. Repeat from 1 until there are no more nodes to prune.
 
+    See :py:func:`paths_graph.prune.prune_graph`, which also returns the set
+    of removed nodes.
+
     Parameters
     ----------
-    pg : networkx.DiGraph
+    g : networkx.DiGraph
         Paths graph to prune.
     nodes_to_prune : list
         Nodes to prune from paths graph.
@@ -467,47 +734,345 @@ def prune(g, nodes_to_prune, source, target):
         Source node, of the form (0, source_name).
     target : tuple
         Target node, of the form (target_depth, source_name).
+    in_place : bool
+        If True, the nodes are removed from g itself instead of from a copy.
+        Default is False.
 
     Returns
     -------
     networkx.DiGraph()
         Pruned paths graph.
     """
-    # First check if we are pruning any nodes to prevent unnecessary copying
-    # of the paths graph
-    if not nodes_to_prune:
-        return g
-    # Make a copy of the graph
-    g_pruned = g.copy()
-    # Perform iterative pruning
-    while nodes_to_prune:
-        # Remove the nodes in our pruning list
-        g_pruned.remove_nodes_from(nodes_to_prune)
-        # Make a list of nodes whose in or out degree is now 0 (making
-        # sure to exclude the source and target, whose depths are at 0 and
-        # path_length, respectively)
-        no_in_edges = [node for node, in_deg in g_pruned.in_degree()
-                        if in_deg == 0 and node != source]
-        no_out_edges = [node for node, out_deg in g_pruned.out_degree()
-                        if out_deg == 0 and node != target]
-        nodes_to_prune = set(no_in_edges + no_out_edges)
-    return g_pruned
+    return prune_graph(g, nodes_to_prune, source, target, in_place)[0]
 
 
 def get_past(src, tgt, pg_0):
-    past = {src: [src]}
-    for i in range(1, tgt[0] + 1):
-        W_i = [w for w in pg_0.nodes() if w[0] == i]
-        for w in W_i:
-            past_w = [w]
-            for u in pg_0.predecessors(w):
-                past_w.extend(past[u])
-            past_w = list(set(past_w))
-            past[w] = past_w
+    """Get the past of each node of a paths graph.
+
+    The past of a node is the set of nodes from which it can be reached,
+    including the node itself.
+
+    Parameters
+    ----------
+    src : tuple
+        Source node of the paths graph.
+    tgt : tuple
+        Target node of the paths graph.
+    pg_0 : networkx.DiGraph
+        Paths graph whose nodes are of the form (depth, name).
+
+    Returns
+    -------
+    dict
+        Dictionary mapping each node to the list of nodes in its past, in
+        order of depth.
+    """
+    node_bits = _NodeBits(pg_0)
+    past = _get_past_bits(src, tgt, pg_0, node_bits)
+    return dict((node, node_bits.to_nodes(past_node))
+                for node, past_node in past.items())
+
+
+def _get_past_bits(src, tgt, pg_0, node_bits=None):
+    """Get the past of each node of a paths graph as a bitset.
+
+    The past of a node is the set of nodes from which it can be reached,
+    including the node itself. Pasts are computed level by level with one
+    bitwise OR per edge.
+
+    Parameters
+    ----------
+    src : tuple
+        Source node of the paths graph.
+    tgt : tuple
+        Target node of the paths graph.
+    pg_0 : networkx.DiGraph
+        Paths graph whose nodes are of the form (depth, name).
+    node_bits : Optional[_NodeBits]
+        Index of the nodes of pg_0 defining the bitsets. If not given, one
+        is created.
+
+    Returns
+    -------
+    dict
+        Dictionary mapping each node to its past, as an int bitset over the
+        node index (see :py:meth:`_NodeBits.to_nodes`).
+    """
+    if node_bits is None:
+        node_bits = _NodeBits(pg_0)
+    past = {}
+    for w in node_bits.nodes:
+        past_w = node_bits.bit(w)
+        for u in pg_0.predecessors(w):
+            past_w |= past[u]
+        past[w] = past_w
     return past
 
 
-def _split_graph(src, tgt, x,  X_ip1, X_im1, t_cf, tags_x, g):
+class _NodeBits(object):
+    """Represents sets of nodes of a paths graph as int bitsets.
+
+    Nodes are indexed in order of depth, so that the set bits of a bitset
+    enumerate its nodes in topological order. Set operations then become
+    bitwise operations on (arbitrarily large) Python ints.
+
+    Parameters
+    ----------
+    g : networkx.DiGraph
+        Paths graph whose nodes are of the form (depth, ...).
+    extra_nodes : Optional[iterable]
+        Nodes not in g that should also be indexed, e.g., tags of nodes that
+        were pruned from the graph. They have no edges.
+    """
+    def __init__(self, g, extra_nodes=None):
+        nodes = list(g)
+        if extra_nodes is not None:
+            nodes += [node for node in set(extra_nodes) if node not in g]
+        self.nodes = sorted(nodes, key=lambda node: node[0])
+        self.index = dict((node, i) for i, node in enumerate(self.nodes))
+        self.pred_bits = [self.to_bits(g.predecessors(node)) if node in g
+                          else 0 for node in self.nodes]
+        self.succ_bits = [self.to_bits(g.successors(node)) if node in g
+                          else 0 for node in self.nodes]
+
+    def bit(self, node):
+        """Return the bitset containing only the given node."""
+        return 1 << self.index[node]
+
+    def to_bits(self, nodes):
+        """Return the bitset of a collection of nodes."""
+        bits = 0
+        for node in nodes:
+            bits |= 1 << self.index[node]
+        return bits
+
+    def positions(self, bits):
+        """Return the indices of the nodes in a bitset, in increasing order."""
+        num_bytes = (len(self.nodes) + 7) // 8
+        data = np.frombuffer(bits.to_bytes(num_bytes, 'little'),
+                             dtype=np.uint8)
+        return np.flatnonzero(np.unpackbits(data, bitorder='little')).tolist()
+
+    def to_nodes(self, bits):
+        """Return the list of nodes in a bitset, in order of depth."""
+        return [self.nodes[i] for i in self.positions(bits)]
+
+    def closure(self, bits, source, target):
+        """Return the nodes of a set lying on a path from source to target.
+
+        This gives the same nodes as inducing the subgraph on the set and
+        pruning it (see :py:func:`prune`) with the given source and target,
+        but with one forward and one backward sweep over the set.
+
+        Returns
+        -------
+        int
+            The bitset of nodes lying on some path from source to target
+            that only goes through nodes in the set, or 0 if there is no
+            such path.
+        """
+        source_id = self.index[source]
+        target_id = self.index[target]
+        positions = self.positions(bits)
+        forward = 0
+        for i in positions:
+            if i == source_id or self.pred_bits[i] & forward:
+                forward |= 1 << i
+        backward = 0
+        for i in reversed(positions):
+            if (i == target_id or self.succ_bits[i] & backward) and \
+               (forward >> i) & 1:
+                backward |= 1 << i
+        return backward
+
+
+class _TagTable(object):
+    """Interns the tag sets of the nodes of a CFPG under construction.
+
+    Each distinct tag set (given as a bitset over node_bits) is converted to
+    a frozenset of nodes only once, so that nodes with the same tags share
+    the same frozenset. In compact mode, nodes refer to tag sets by their
+    index in `tag_sets` instead.
+
+    Parameters
+    ----------
+    node_bits : _NodeBits
+        The index over which tag sets are given as bitsets.
+    compact : bool
+        Whether :py:meth:`intern` returns the index of a tag set rather than
+        the tag set itself.
+    """
+    def __init__(self, node_bits, compact=False):
+        self.node_bits = node_bits
+        self.compact = compact
+        # The first entry is the tag of the source and target nodes
+        self.tag_sets = [0]
+        self._ids = {}
+
+    def intern(self, bits):
+        """Return the tag of a node with the tag set given as a bitset."""
+        tag_id = self._ids.get(bits)
+        if tag_id is None:
+            tag_id = len(self.tag_sets)
+            self._ids[bits] = tag_id
+            self.tag_sets.append(frozenset(self.node_bits.to_nodes(bits)))
+        return tag_id if self.compact else self.tag_sets[tag_id]
+
+
+class _SplitState(object):
+    """Read-only state used to split the nodes of G_0 into CFPG nodes.
+
+    When nodes are split in parallel, the state is sent to each worker
+    process once, when the worker starts (see :py:func:`_split_pool`).
+
+    Parameters
+    ----------
+    src : tuple
+        The source node of G_0.
+    g : networkx.DiGraph
+        The graph G_0 (a pruned paths graph or a pre-CFPG).
+    node_bits : _NodeBits
+        The index over which tag sets are given as bitsets.
+    past : Optional[dict]
+        The past of each node, as returned by :py:func:`_get_past_bits`. If
+        given, the tags of a node are computed from its past.
+    tags : Optional[dict]
+        The tags of each node, as bitsets. Used if past is not given.
+    """
+    def __init__(self, src, g, node_bits, past=None, tags=None):
+        self.src = src
+        self.node_bits = node_bits
+        self.predecessors = dict((x, list(g.predecessors(x))) for x in g)
+        # Tags may include nodes that are not in g (e.g., pruned from a
+        # pre-CFPG), which can't be on the paths through a split node
+        self.graph_bits = node_bits.to_bits(g)
+        self.past = past
+        self.tags = tags
+        # The bitset of the nodes with each name
+        self.name_bits = {}
+        for v in node_bits.nodes:
+            self.name_bits[v[1]] = self.name_bits.get(v[1], 0) | \
+                                   node_bits.bit(v)
+
+    def get_tags(self, x):
+        """Return the tags of a node as a bitset (0 if there are none)."""
+        if self.past is None:
+            return self.tags[x] & self.graph_bits
+        past_x = self.past[x]
+        ntp_x = past_x & self.name_bits[x[1]] & ~self.node_bits.bit(x)
+        """
+        For the negative polarity case the above should be:
+        ntp_x = [v for v in past_x if v != x and v[1][0] == x[1][0]]
+        """
+        if not ntp_x:
+            return past_x
+        # Keep the nodes on paths from the source to x avoiding the other
+        # nodes named like x
+        return self.node_bits.closure(past_x & ~ntp_x, self.src, x)
+
+
+def _split_pool(state, n_jobs):
+    """Return a context manager giving the process pool to split nodes in.
+
+    If n_jobs is None or 1, the context gives None and nodes are split in
+    this process.
+    """
+    if n_jobs is None or n_jobs == 1:
+        return _no_pool()
+    return worker_pool(state, get_n_jobs(n_jobs))
+
+
+@contextlib.contextmanager
+def _no_pool():
+    # Same as contextlib.nullcontext(), which needs Python 3.7
+    yield None
+
+
+def _split_level(V_current, level_ip1, state, tag_table, pool=None,
+                 n_jobs=None):
+    """Split the nodes x of G_0 at a level into nodes of the CFPG.
+
+    The nodes are split with :py:func:`_split_graph`, independently of each
+    other, either in this process or in chunks in the workers of a process
+    pool. The copies of the nodes are collected in the order of V_current,
+    and their tags are interned in tag_table, so that the result doesn't
+    depend on the number of workers.
+
+    Parameters
+    ----------
+    V_current : list
+        The nodes of G_0 at level i to be split.
+    level_ip1 : tuple
+        The nodes at level i+1 of the CFPG, with their successors,
+        predecessors (nodes of G_0 at level i) and tags, as a (V_ip1,
+        next_ip1, pred_ip1, t_cf_ip1) tuple.
+    state : _SplitState
+        The state to split nodes with.
+    tag_table : _TagTable
+        The table interning the tag sets of the CFPG nodes.
+    pool : Optional[concurrent.futures.Executor]
+        Process pool created by :py:func:`_split_pool` to split the nodes
+        in. Default is None (split in this process).
+    n_jobs : Optional[int]
+        The number of chunks to split the nodes in if a pool is given. If
+        None or -1, the number of CPUs is used.
+
+    Returns
+    -------
+    tuple
+        The nodes at level i of the CFPG with their successors, predecessors
+        and tags, as a (V_i, next_i, pred_i, t_cf_i) tuple.
+    """
+    V_ip1, next_ip1, pred_ip1, t_cf_ip1 = level_ip1
+    # X_ip1 is the set of nodes at the level i+1 to which x is connected via
+    # the pred_ip1 function. They are referred to by their index in V_ip1 so
+    # that the (large) CFPG nodes don't have to be sent to workers.
+    X_ip1s = dict((x, []) for x in V_current)
+    for j, w in enumerate(V_ip1):
+        for x in pred_ip1[w]:
+            X_ip1s[x].append(j)
+    X_ip1s = [X_ip1s[x] for x in V_current]
+    t_cf = [t_cf_ip1[w] for w in V_ip1]
+    if pool is None:
+        copies = _split_nodes(state, V_current, X_ip1s, t_cf)
+    else:
+        chunks = [chunk.tolist() for chunk in
+                  np.array_split(np.arange(len(V_current)),
+                                 get_n_jobs(n_jobs)) if len(chunk)]
+        tasks = [(_split_nodes, ([V_current[k] for k in chunk],
+                                 [X_ip1s[k] for k in chunk], t_cf))
+                 for chunk in chunks]
+        copies = [x_copies for chunk_copies in
+                  pool.map(run_with_worker_obj, tasks)
+                  for x_copies in chunk_copies]
+    V_i, next_i, pred_i, t_cf_i = ([], {}, {}, {})
+    for x, x_copies in zip(V_current, copies):
+        for r, next_ids, pred_x in x_copies:
+            x_c = (x[0], x[1], tag_table.intern(r))
+            V_i.append(x_c)
+            next_i[x_c] = [V_ip1[j] for j in next_ids]
+            pred_i[x_c] = pred_x
+            t_cf_i[x_c] = r
+    return (V_i, next_i, pred_i, t_cf_i)
+
+
+def _split_nodes(state, nodes, X_ip1s, t_cf):
+    """Split each node with :py:func:`_split_graph`; runs in workers."""
+    copies = []
+    for x, X_ip1 in zip(nodes, X_ip1s):
+        tags_x = state.get_tags(x)
+        # Nodes with no tags are not on any cycle-free path
+        if not tags_x:
+            copies.append([])
+            continue
+        assert X_ip1 != []
+        copies.append(_split_graph(state.src, x, X_ip1,
+                                   state.predecessors[x], t_cf, tags_x,
+                                   state.node_bits))
+    return copies
+
+
+def _split_graph(src, x, X_ip1, X_im1, t_cf, tags_x, node_bits):
     """Splits a node x from G_0 into multiple copies for the CFPG.
 
     The nodes in X_ip1 represent the possible successor nodes to x in the CFPG.
@@ -516,44 +1081,34 @@ def _split_graph(src, tgt, x,  X_ip1, X_im1, t_cf, tags_x, g):
     obtain this by finding the intersection between the tags of x and the tags
     of w. This is the set X_wx below for each w in X_ip1.
 
-    However X_wx is the set of nodes (in G_0) from which we can reach x->w
-    without encountering x[1] AND without encountering w[1]. As a result some
-    nodes in X_wx may be isolated.  Hence we prune them away.
+    Tag sets (t_cf[w], tags_x and the returned tags) are int bitsets over
+    node_bits (see :py:class:`_NodeBits`), so that intersections are
+    bitwise ANDs.
+
+    Returns
+    -------
+    list of tuples
+        For each copy of x, its tags, its successors (among X_ip1) and its
+        predecessors (among X_im1).
     """
-    V_x = []
-    next_x = {}
-    pred_x = {}
-    t_x = {}
     S_ip1 = {}
+    # X_wx must contain both the source and x for a copy of x to lie on a
+    # path between src and w
+    endpoints = node_bits.bit(src) | node_bits.bit(x)
     for w in X_ip1:
-        X_wx =  set(t_cf[w]) & set(tags_x)
-        N_wx = list(X_wx)
-        # TODO: Reimplement pruning so as to avoid inducing a subgraph?
-        g_wx = g.subgraph(N_wx)
-        nodes_prune = [v for v in g_wx
-                         if (v != x and not g_wx.successors(v)) or
-                            (v!= src and not g_wx.predecessors(v))]
-        g_wx_pruned = prune(g_wx, nodes_prune, src, x)
-        # If the pruned graph still contains both src and x itself, there is
-        # at least one path from the source to x->w. The nodes in this subgraph
-        # constitute the new set of tags of the copy of x that lies on a path
-        # between src and w.
-        if x in g_wx_pruned and src in g_wx_pruned:
-            s = frozenset(g_wx_pruned.nodes())
-            S_ip1[w] = s
-    S = set(S_ip1.values())
-    # Each element of the set S will be a unique, (frozen) set of tags. We will
-    # create one copy x_r of x for each unique tag set r in S, and we assign r
-    # to be the set of tags of the new, split node x_r. The successors of x_r
-    # are assembled using S_ip1; pred is defined in the expected way using
-    # X_im1.
-    for c, r in enumerate(S):
-        x_c = (x[0], x[1], r)
-        V_x.append(x_c)
-        next_x[x_c] = [w for w in S_ip1.keys() if r == S_ip1[w]]
-        pred_x[x_c] = [u for u in X_im1 if u in r]
-        t_x[x_c] = r
-    return (V_x, next_x, pred_x, t_x)
+        X_wx = t_cf[w] & tags_x
+        if X_wx & endpoints == endpoints:
+            S_ip1[w] = X_wx
+    # Each distinct value in S_ip1 is a unique set of tags. We will create one
+    # copy x_r of x for each unique tag set r, and we assign r to be the set
+    # of tags of the new, split node x_r. The successors of x_r are assembled
+    # using S_ip1; pred is defined in the expected way using X_im1.
+    copies = []
+    for r in dict.fromkeys(S_ip1.values()):
+        next_r = [w for w in S_ip1.keys() if r == S_ip1[w]]
+        pred_r = [u for u in X_im1 if (r >> node_bits.index[u]) & 1]
+        copies.append((r, next_r, pred_r))
+    return copies
 
 
 """
@@ -0,0 +1,500 @@
+import logging
+import hashlib
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+import numpy as np
+import networkx as nx
+
+logger = logging.getLogger('paths_graph')
+
+# Path counts are kept in int64 arrays while they are below this bound
+_MAX_EXACT_INT64 = float(2**62)
+
+
+class CompiledGraph(object):
+    """Integer-indexed, array-based representation of a (signed) graph.
+
+    Node names are interned to integer ids once, and the forward and
+    backward adjacency of the graph, along with edge signs and weights, are
+    stored as NumPy arrays in compressed sparse row (CSR) format. Instances
+    can be used in place of a networkx graph in
+    :py:func:`paths_graph.get_reachable_sets`,
+    :py:meth:`paths_graph.PathsGraph.from_graph`,
+    :py:meth:`paths_graph.CFPG.from_graph` and the functions in
+    :py:mod:`paths_graph.api`, avoiding the cost of walking the networkx
+    dictionaries each time the same graph is queried.
+
+    Instances should generally be created using the factory class method
+    :py:meth:`from_graph`.
+
+    Parameters
+    ----------
+    nodes : list
+        Node names, in order of their integer ids.
+    edge_sources : numpy.ndarray
+        Integer ids of the source node of each edge.
+    edge_targets : numpy.ndarray
+        Integer ids of the target node of each edge.
+    signs : numpy.ndarray or None
+        Sign of each edge (0 for positive, 1 for negative), or None if the
+        graph does not have sign information on every edge.
+    weights : numpy.ndarray
+        Weight of each edge.
+
+    Attributes
+    ----------
+    nodes : list
+        Node names, indexed by integer node id.
+    node_index : dict
+        Dictionary mapping node names to their integer ids.
+    fwd_indptr : numpy.ndarray
+        CSR row pointers for the forward adjacency: the out-edges of node
+        `i` are the edges `fwd_indptr[i]` to `fwd_indptr[i+1] - 1`.
+    fwd_indices : numpy.ndarray
+        Integer ids of the target node of each out-edge.
+    signs : numpy.ndarray or None
+        Sign of each out-edge, in the same order as `fwd_indices`.
+    weights : numpy.ndarray
+        Weight of each out-edge, in the same order as `fwd_indices`.
+    back_indptr : numpy.ndarray
+        CSR row pointers for the backward adjacency.
+    back_indices : numpy.ndarray
+        Integer ids of the source node of each in-edge.
+    back_edges : numpy.ndarray
+        Position of each in-edge in the forward edge arrays, used to look up
+        its sign and weight.
+    """
+    def __init__(self, nodes, edge_sources, edge_targets, signs, weights):
+        self.nodes = list(nodes)
+        self.node_index = dict((name, ix) for ix, name in enumerate(nodes))
+        num_nodes = len(self.nodes)
+        edge_sources = np.asarray(edge_sources, dtype=np.int64)
+        edge_targets = np.asarray(edge_targets, dtype=np.int64)
+        # Forward adjacency: sort edges by source node, keeping the original
+        # edge order within each node
+        fwd_order = np.argsort(edge_sources, kind='stable')
+        self.fwd_indptr = _indptr(edge_sources, num_nodes)
+        self.fwd_indices = edge_targets[fwd_order]
+        self.signs = None if signs is None else \
+                np.asarray(signs, dtype=np.int8)[fwd_order]
+        self.weights = np.asarray(weights, dtype=np.float64)[fwd_order]
+        # Backward adjacency: sort the (already ordered) forward edges by
+        # target node and keep a pointer back into the forward edge arrays
+        fwd_sources = edge_sources[fwd_order]
+        self.back_edges = np.argsort(self.fwd_indices, kind='stable')
+        self.back_indptr = _indptr(self.fwd_indices, num_nodes)
+        self.back_indices = fwd_sources[self.back_edges]
+        self._fingerprint = None
+        self._transitions = {}
+
+    @classmethod
+    def from_graph(klass, g):
+        """Compile a networkx graph into integer-indexed CSR arrays.
+
+        Parameters
+        ----------
+        g : networkx.DiGraph or networkx.MultiDiGraph
+            The graph to compile. If every edge has a 'sign' entry in its
+            edge data, signs are stored and the compiled graph can be used
+            for signed queries. Edge weights are taken from the 'weight'
+            entry of the edge data, defaulting to 1.
+
+        Returns
+        -------
+        CompiledGraph
+            The compiled graph.
+        """
+        nodes = list(g.nodes())
+        node_index = dict((name, ix) for ix, name in enumerate(nodes))
+        num_edges = g.number_of_edges()
+        edge_sources = np.empty(num_edges, dtype=np.int64)
+        edge_targets = np.empty(num_edges, dtype=np.int64)
+        signs = np.empty(num_edges, dtype=np.int8)
+        weights = np.empty(num_edges, dtype=np.float64)
+        has_signs = True
+        for ix, (u, v, data) in enumerate(g.edges(data=True)):
+            edge_sources[ix] = node_index[u]
+            edge_targets[ix] = node_index[v]
+            weights[ix] = float(data.get('weight', 1.0))
+            sign = data.get('sign')
+            if sign is None:
+                has_signs = False
+            else:
+                signs[ix] = sign
+        if not has_signs:
+            signs = None
+        logger.info("Compiled graph with %d nodes and %d edges" %
+                    (len(nodes), num_edges))
+        return klass(nodes, edge_sources, edge_targets, signs, weights)
+
+    @property
+    def fingerprint(self):
+        """A hash of the node names and edge arrays identifying the graph.
+
+        Used to key cached results computed over the graph. It is computed
+        on first access and then stored.
+        """
+        if self._fingerprint is None:
+            h = hashlib.sha1(repr(self.nodes).encode('utf-8'))
+            arrays = [self.fwd_indptr, self.fwd_indices, self.weights]
+            if self.signs is not None:
+                arrays.append(self.signs)
+            for arr in arrays:
+                h.update(np.ascontiguousarray(arr).tobytes())
+            self._fingerprint = h.hexdigest()
+        return self._fingerprint
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, name):
+        return name in self.node_index
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def number_of_edges(self):
+        """Return the number of edges in the graph."""
+        return len(self.fwd_indices)
+
+    def node_id(self, name):
+        """Return the integer id of the node with the given name."""
+        try:
+            return self.node_index[name]
+        except KeyError:
+            raise nx.NetworkXError("The node %s is not in the digraph." %
+                                   (name,))
+
+    def out_edges(self, label, signed=False):
+        """Return the out-edges of a node as (successor, weight) pairs.
+
+        Parameters
+        ----------
+        label : str or tuple
+            For an unsigned query, the name of the node; for a signed query,
+            a tuple (name, polarity) giving the cumulative polarity at the
+            node.
+        signed : bool
+            Whether successors should be returned as (name, polarity)
+            tuples, with the polarity of the successor obtained by combining
+            the polarity of the node with the sign of the edge.
+
+        Returns
+        -------
+        list of tuples
+            Successors of the node, paired with the weight of the
+            corresponding edge.
+        """
+        if signed:
+            name, polarity = label
+        else:
+            name = label
+        u = self.node_id(name)
+        start, end = self.fwd_indptr[u], self.fwd_indptr[u+1]
+        succ_names = [self.nodes[v] for v in self.fwd_indices[start:end]]
+        weights = self.weights[start:end].tolist()
+        if not signed:
+            return list(zip(succ_names, weights))
+        self._check_signed()
+        succ_pols = (self.signs[start:end] + polarity) % 2
+        return [((v, int(p)), w)
+                for v, p, w in zip(succ_names, succ_pols, weights)]
+
+    def num_states(self, signed=False):
+        """Return the size of the (possibly signed) node state space.
+
+        Nodes are represented by integer states: the node id for unsigned
+        queries, and 2 * node id + polarity for signed queries.
+        """
+        return 2 * len(self.nodes) if signed else len(self.nodes)
+
+    def state(self, label, signed=False):
+        """Return the integer state of a node name or (name, polarity)."""
+        if signed:
+            name, polarity = label
+            return 2 * self.node_id(name) + polarity
+        return self.node_id(label)
+
+    def label(self, state, signed=False):
+        """Return the node name or (name, polarity) of an integer state."""
+        if signed:
+            return (self.nodes[state // 2], state % 2)
+        return self.nodes[state]
+
+    def states_mask(self, labels, signed=False):
+        """Return a boolean mask over the state space for a set of labels."""
+        mask = np.zeros(self.num_states(signed), dtype=bool)
+        states = [self.state(label, signed) for label in labels]
+        mask[np.array(states, dtype=np.int64)] = True
+        return mask
+
+    def expand(self, mask, direction='forward', signed=False):
+        """Return the states reachable in one step from a set of states.
+
+        Parameters
+        ----------
+        mask : numpy.ndarray
+            Boolean mask over the state space representing the frontier.
+        direction : str
+            'forward' to follow out-edges, 'backward' to follow in-edges.
+        signed : bool
+            Whether states carry a cumulative polarity, which is combined
+            with the sign of each edge traversed.
+
+        Returns
+        -------
+        numpy.ndarray
+            Boolean mask of the states reachable from the frontier.
+        """
+        states = np.flatnonzero(mask)
+        edges, rows = self._edge_positions(states, direction, signed)
+        reach = np.zeros(self.num_states(signed), dtype=bool)
+        reach[self._edge_states(edges, states[rows], direction, signed)] = \
+                True
+        return reach
+
+    def state_transitions(self, signed=False):
+        """Return the distinct one-step transitions between states.
+
+        Parallel edges (with the same sign, for signed queries) lead to the
+        same transition, so that each transition corresponds to one edge of
+        a paths graph. The transitions are computed on first use and then
+        stored.
+
+        Parameters
+        ----------
+        signed : bool
+            Whether the transitions are between signed (node, polarity)
+            states.
+
+        Returns
+        -------
+        tuple of numpy.ndarray
+            CSR row pointers over the states the transitions lead to, and
+            the state each transition leaves from, so that the transitions
+            into state `v` leave from the states `from_states[indptr[v]]` to
+            `from_states[indptr[v+1] - 1]`.
+        """
+        if signed not in self._transitions:
+            states = np.arange(self.num_states(signed))
+            edges, rows = self._edge_positions(states, 'forward', signed)
+            from_states = states[rows]
+            to_states = self._edge_states(edges, from_states, 'forward',
+                                          signed)
+            num_states = self.num_states(signed)
+            pairs = np.unique(to_states * num_states + from_states)
+            to_states, from_states = np.divmod(pairs, num_states)
+            self._transitions[signed] = (_indptr(to_states, num_states),
+                                         from_states)
+        return self._transitions[signed]
+
+    def _edge_positions(self, states, direction, signed):
+        """Return CSR positions of the edges leaving a set of states.
+
+        Also returns, for each edge, the index into `states` of the state
+        the edge leaves from.
+        """
+        indptr = self.fwd_indptr if direction == 'forward' else \
+                 self.back_indptr
+        nodes = states // 2 if signed else states
+        starts = indptr[nodes]
+        counts = indptr[nodes + 1] - starts
+        # Gather the edge ranges of all nodes with a single arange: each
+        # edge position is its offset within the concatenated ranges plus
+        # the start of its own range
+        rows = np.repeat(np.arange(len(nodes)), counts)
+        ends = np.cumsum(counts)
+        edges = np.arange(ends[-1] if len(ends) else 0) + \
+                np.repeat(starts - ends + counts, counts)
+        return edges, rows
+
+    def _edge_states(self, edges, from_states, direction, signed):
+        """Return the states reached by traversing edges at CSR positions."""
+        if direction == 'forward':
+            nodes = self.fwd_indices[edges]
+        else:
+            nodes = self.back_indices[edges]
+        if not signed:
+            return nodes
+        self._check_signed()
+        if direction == 'forward':
+            signs = self.signs[edges]
+        else:
+            signs = self.signs[self.back_edges[edges]]
+        return 2 * nodes + ((from_states + signs) % 2)
+
+    def _check_signed(self):
+        if self.signs is None:
+            raise ValueError("Signed query on a compiled graph without sign "
+                             "information on every edge.")
+
+
+def _indptr(row_ids, num_rows):
+    """Return CSR row pointers given the row id of each entry."""
+    counts = np.bincount(row_ids, minlength=num_rows)
+    indptr = np.zeros(num_rows + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    return indptr
+
+
+def expand_levels(cg, masks, max_depth, direction='forward', signed=False):
+    """Extend a list of level masks in place up to the given depth.
+
+    Parameters
+    ----------
+    cg : CompiledGraph
+        The graph over whose states the masks are defined.
+    masks : list of numpy.ndarray
+        Boolean state masks for depths 0 up to some depth; the list is
+        extended in place.
+    max_depth : int
+        Depth up to which the levels should be computed.
+    direction : str
+        'forward' to follow out-edges, 'backward' to follow in-edges.
+    signed : bool
+        Whether the masks are over signed (node, polarity) states.
+
+    Returns
+    -------
+    bool
+        True if expansion stopped because a level was empty, in which case
+        no deeper levels exist.
+    """
+    while len(masks) <= max_depth:
+        reach = cg.expand(masks[-1], direction, signed)
+        # If the reachable set is empty then we can stop
+        if not reach.any():
+            return True
+        masks.append(reach)
+    return False
+
+
+def count_walks_by_length(cg, source, target, max_depth, signed=False,
+                          target_polarity=0):
+    """Count the paths of every length up to a maximum in a single pass.
+
+    The number of paths of length k from source to target in the paths
+    graph of length k (see :py:meth:`paths_graph.PathsGraph.from_graph`),
+    which is the number of walks of length k in the graph, is obtained for
+    all k at once by propagating path counts from the source one step at a
+    time over the (signed) states of the graph. As in paths graphs of
+    unsigned graphs, the target may only appear at the end of a path.
+    Unlike paths graphs, signed paths to a target with polarity 1 are
+    counted even if the target can't be reached with polarity 0 (see
+    :py:func:`paths_graph.count_paths_by_length`).
+
+    Counts are kept in int64 arrays as long as they cannot overflow, and as
+    Python ints (in object arrays) after that.
+
+    Parameters
+    ----------
+    cg : CompiledGraph
+        The graph to count paths in.
+    source : str
+        Name of the source node.
+    target : str
+        Name of the target node.
+    max_depth : int
+        The maximum path length to count paths for.
+    signed : bool
+        Whether paths are counted over signed (node, polarity) states.
+    target_polarity : 0 or 1
+        For signed graphs, the cumulative polarity of the paths to count.
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of length max_depth + 1 whose entry k is the number of paths
+        of length k (the entry for length 0 is 0).
+    """
+    if signed:
+        cg._check_signed()
+    source_state = cg.state((source, 0) if signed else source, signed)
+    target_state = cg.state((target, target_polarity) if signed else target,
+                            signed)
+    indptr, from_states = cg.state_transitions(signed)
+    counts = np.zeros(cg.num_states(signed), dtype=np.int64)
+    counts[source_state] = 1
+    path_counts = np.zeros(max_depth + 1, dtype=np.int64)
+    for length in range(1, max_depth + 1):
+        prev_counts = counts[from_states]
+        # The total over all transitions bounds every count and the
+        # cumulative sums taken below
+        if prev_counts.dtype != object and \
+           prev_counts.sum(dtype=np.float64) >= _MAX_EXACT_INT64:
+            logger.debug("Path counts exceed int64 at length %d, "
+                         "switching to Python ints" % length)
+            prev_counts = prev_counts.astype(object)
+            path_counts = path_counts.astype(object)
+        counts = _sum_rows(prev_counts, indptr)
+        path_counts[length] = counts[target_state]
+        # In unsigned paths graphs, the target doesn't appear before the
+        # last level
+        if not signed:
+            counts[target_state] = 0
+        if not counts.any():
+            break
+    return path_counts
+
+
+def _sum_rows(values, indptr):
+    """Return the sums of consecutive slices of values given by CSR rows."""
+    if values.dtype.kind == 'f':
+        # Floats are summed row by row rather than as differences of a
+        # cumulative sum, which would introduce rounding errors
+        num_rows = len(indptr) - 1
+        rows = np.repeat(np.arange(num_rows), np.diff(indptr))
+        return np.bincount(rows, weights=values, minlength=num_rows)
+    totals = np.zeros(len(values) + 1, dtype=values.dtype)
+    np.cumsum(values, out=totals[1:])
+    return totals[indptr[1:]] - totals[indptr[:-1]]
+
+
+class LevelSets(Mapping):
+    """Reachable sets by depth, stored as boolean masks over graph states.
+
+    Behaves as a read-only dict with integer depths as keys and sets of node
+    names (or (name, polarity) tuples for signed graphs) as values, as
+    returned by :py:func:`paths_graph.get_reachable_sets` for networkx
+    graphs. The sets are only built from the underlying masks when they are
+    accessed; the raw masks are available via :py:meth:`mask`.
+
+    Parameters
+    ----------
+    graph : CompiledGraph
+        The compiled graph over whose states the masks are defined.
+    masks : list of numpy.ndarray
+        Boolean masks over the state space, one for each depth starting from
+        0.
+    signed : bool
+        Whether the masks are over signed (node, polarity) states.
+    """
+    def __init__(self, graph, masks, signed):
+        self.graph = graph
+        self.masks = list(masks)
+        self.signed = signed
+        self._sets = {}
+
+    def mask(self, depth):
+        """Return the boolean state mask for the given depth."""
+        if not 0 <= depth < len(self.masks):
+            raise KeyError(depth)
+        return self.masks[depth]
+
+    def __getitem__(self, depth):
+        if depth not in self._sets:
+            states = np.flatnonzero(self.mask(depth))
+            self._sets[depth] = set(self.graph.label(s, self.signed)
+                                    for s in states.tolist())
+        return self._sets[depth]
+
+    def __contains__(self, depth):
+        return isinstance(depth, int) and 0 <= depth < len(self.masks)
+
+    def __iter__(self):
+        return iter(range(len(self.masks)))
+
+    def __len__(self):
+        return len(self.masks)
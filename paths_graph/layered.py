@@ -0,0 +1,1136 @@
+import heapq
+import logging
+import itertools
+from bisect import bisect_right
+import numpy as np
+import networkx as nx
+from .compiled import _MAX_EXACT_INT64, _sum_rows, _indptr
+from .pg import get_paths_graph_edges, iter_chunks
+from .sampling import canonical_order, get_rng, check_distribution, \
+                      random_below, sample_distinct_indices, \
+                      stochastic_beam_search
+
+logger = logging.getLogger('paths_graph')
+
+
+class LayeredPathsGraph(object):
+    """Compact, array-based storage of a paths graph.
+
+    In a paths graph every edge connects a node at level i to a node at
+    level i+1. Rather than storing the graph as a networkx graph with tuple
+    nodes and an attribute dict for each edge, this class stores, for each
+    level, an integer array of node name ids (into a shared table of names),
+    and for the edges between each pair of neighboring levels CSR arrays of
+    successors and predecessors along with an array of edge weights. Within
+    each level, nodes are indexed by their position in the level.
+
+    Instances should generally be created using the factory class methods
+    :py:meth:`from_graph` or :py:meth:`from_pg`. Nodes can be given any
+    number of components after the name (such as the tags of CFPG nodes);
+    these are stored per level in `level_keys`.
+
+    Attributes
+    ----------
+    source_name : str or tuple
+        The name of the source.
+    source_node : tuple
+        The source node as it is represented in the paths graph.
+    target_name : str or tuple
+        The name of the target.
+    target_node : tuple
+        The target node as it is represented in the paths graph.
+    path_length : int
+        Length of the paths connecting source and target.
+    names : list
+        Table of node names (the second component of the paths graph nodes).
+    level_names : list of numpy.ndarray
+        For each level, the ids in `names` of the nodes at that level.
+    level_keys : list
+        For each level, None, or a list with the components of each node
+        following its name.
+    succ_indptr : list of numpy.ndarray
+        For each level i < path_length, CSR row pointers into
+        `succ_indices[i]` for each node at level i.
+    succ_indices : list of numpy.ndarray
+        For each level i < path_length, the position within level i+1 of the
+        successor at the end of each edge.
+    weights : list of numpy.ndarray
+        For each level i < path_length, the weight of each edge, in the same
+        order as `succ_indices[i]`.
+    pred_indptr : list of numpy.ndarray
+        For each level i < path_length, CSR row pointers into
+        `pred_indices[i]` for each node at level i+1.
+    pred_indices : list of numpy.ndarray
+        For each level i < path_length, the position within level i of the
+        predecessor at the start of each edge.
+    pred_edges : list of numpy.ndarray
+        For each level i < path_length, the position of each edge in
+        `succ_indices[i]` and `weights[i]`, in the same order as
+        `pred_indices[i]`.
+    """
+    def __init__(self, source_node, target_node, names, level_names,
+                 level_keys, edges, weight_dtype=np.float64):
+        self.source_node = source_node
+        self.target_node = target_node
+        self.source_name = source_node[1]
+        self.target_name = target_node[1]
+        self.path_length = target_node[0]
+        self.names = names
+        self.level_names = level_names
+        self.level_keys = level_keys
+        self.succ_indptr = []
+        self.succ_indices = []
+        self.weights = []
+        self.pred_indptr = []
+        self.pred_indices = []
+        self.pred_edges = []
+        self._cum_weights = None
+        self._path_counts = None
+        self._path_offsets = None
+        self._forward_counts = None
+        self._cum_counts = None
+        for i, (us, vs, ws) in enumerate(edges):
+            num_u = len(level_names[i])
+            num_v = len(level_names[i+1])
+            order = np.lexsort((vs, us))
+            us, vs = us[order], vs[order]
+            self.succ_indptr.append(_indptr(us, num_u))
+            self.succ_indices.append(vs.astype(np.int32))
+            self.weights.append(np.asarray(ws, dtype=weight_dtype)[order])
+            pred_order = np.argsort(vs, kind='stable')
+            self.pred_indptr.append(_indptr(vs, num_v))
+            self.pred_indices.append(us[pred_order].astype(np.int32))
+            self.pred_edges.append(pred_order.astype(np.int32))
+
+    @classmethod
+    def from_graph(klass, g, source, target, length, fwd_reachset=None,
+                   back_reachset=None, signed=False, target_polarity=0,
+                   weight_dtype=np.float64):
+        """Create a layered paths graph directly from a graph.
+
+        Takes the same arguments as
+        :py:meth:`paths_graph.PathsGraph.from_graph`, but the paths graph is
+        built without creating an intermediate networkx graph.
+
+        Parameters
+        ----------
+        weight_dtype : numpy.dtype
+            The dtype used to store edge weights, e.g. numpy.float32 to
+            reduce memory usage. Default is numpy.float64.
+
+        Returns
+        -------
+        LayeredPathsGraph
+            Instance representing paths from source to target with a given
+            length and overall polarity.
+        """
+        edges = get_paths_graph_edges(g, source, target, length,
+                                      fwd_reachset, back_reachset, signed,
+                                      target_polarity)
+        if signed:
+            source_node = (0, (source, 0))
+            target_node = (length, (target, target_polarity))
+        else:
+            source_node = (0, source)
+            target_node = (length, target)
+        return klass._from_edges(source_node, target_node,
+                                 ((u, v, data['weight'])
+                                  for u, v, data in edges), weight_dtype)
+
+    @classmethod
+    def from_pg(klass, pg, weight_dtype=np.float64):
+        """Create a layered paths graph from a PathsGraph or CFPG.
+
+        Parameters
+        ----------
+        pg : PathsGraph
+            The paths graph to convert. Nodes must be tuples whose first
+            component is the level, as in PathsGraph and CFPG instances.
+        weight_dtype : numpy.dtype
+            The dtype used to store edge weights. Default is numpy.float64.
+
+        Returns
+        -------
+        LayeredPathsGraph
+            Instance with the same nodes, edges and weights as the paths
+            graph.
+        """
+        return klass._from_edges(pg.source_node, pg.target_node,
+                                 pg.graph.edges(data='weight', default=1.0),
+                                 weight_dtype)
+
+    @classmethod
+    def _from_edges(klass, source_node, target_node, weighted_edges,
+                    weight_dtype):
+        length = target_node[0]
+        weighted_edges = list(weighted_edges)
+        if not weighted_edges:
+            return klass(source_node, target_node, [], [], [], [],
+                         weight_dtype)
+        # Collect the nodes at each level, in canonical order so that the
+        # layout (and hence seeded sampling) does not depend on the order in
+        # which the edges were given
+        nodes_by_level = [set() for i in range(length+1)]
+        for u, v, _ in weighted_edges:
+            nodes_by_level[u[0]].add(u)
+            nodes_by_level[v[0]].add(v)
+        # If a level has no nodes, the edges can't form any paths
+        if not all(nodes_by_level):
+            return klass(source_node, target_node, [], [], [], [],
+                         weight_dtype)
+        nodes_by_level = [canonical_order(level_nodes)
+                          for level_nodes in nodes_by_level]
+        # Paths start from the first node at level 0
+        nodes_by_level[0] = [source_node] + \
+                [node for node in nodes_by_level[0] if node != source_node]
+        # Intern the names and index the nodes within each level
+        names = []
+        name_index = {}
+        level_names = []
+        level_keys = []
+        node_pos = {}
+        for level_nodes in nodes_by_level:
+            name_ids = np.empty(len(level_nodes), dtype=np.int32)
+            keys = [] if len(level_nodes[0]) > 2 else None
+            for pos, node in enumerate(level_nodes):
+                name = node[1]
+                if name not in name_index:
+                    name_index[name] = len(names)
+                    names.append(name)
+                name_ids[pos] = name_index[name]
+                if keys is not None:
+                    keys.append(node[2:])
+                node_pos[node] = pos
+            level_names.append(name_ids)
+            level_keys.append(keys)
+        # Group the edges by the level they start from
+        edges_by_level = [([], [], []) for i in range(length)]
+        for u, v, weight in weighted_edges:
+            us, vs, ws = edges_by_level[u[0]]
+            us.append(node_pos[u])
+            vs.append(node_pos[v])
+            ws.append(weight)
+        edges = [(np.array(us, dtype=np.int64), np.array(vs, dtype=np.int64),
+                  np.array(ws, dtype=np.float64))
+                 for us, vs, ws in edges_by_level]
+        return klass(source_node, target_node, names, level_names,
+                     level_keys, edges, weight_dtype)
+
+    def __len__(self):
+        return sum(len(level) for level in self.level_names)
+
+    @property
+    def nbytes(self):
+        """Memory used by the arrays of the layered paths graph."""
+        arrays = self.level_names + self.succ_indptr + self.succ_indices + \
+                 self.weights + self.pred_indptr + self.pred_indices + \
+                 self.pred_edges
+        return sum(arr.nbytes for arr in arrays)
+
+    def node(self, level, pos):
+        """Return the paths graph node at the given position in a level."""
+        node = (level, self.names[self.level_names[level][pos]])
+        if self.level_keys[level] is not None:
+            node += self.level_keys[level][pos]
+        return node
+
+    def successors(self, level, pos):
+        """Return the positions in level+1 of the successors of a node."""
+        indptr = self.succ_indptr[level]
+        return self.succ_indices[level][indptr[pos]:indptr[pos+1]]
+
+    def to_networkx(self):
+        """Return the paths graph as a networkx DiGraph.
+
+        Returns
+        -------
+        networkx.DiGraph
+            Graph with nodes of the form (depth, name, ...) as used by
+            PathsGraph and CFPG instances, and the edge weights in the
+            'weight' attribute of each edge.
+        """
+        graph = nx.DiGraph()
+        for i in range(len(self.succ_indptr)):
+            nodes_i = [self.node(i, pos)
+                       for pos in range(len(self.level_names[i]))]
+            nodes_ip1 = [self.node(i+1, pos)
+                         for pos in range(len(self.level_names[i+1]))]
+            indptr = self.succ_indptr[i]
+            for u_pos in range(len(nodes_i)):
+                for e in range(indptr[u_pos], indptr[u_pos+1]):
+                    v_pos = self.succ_indices[i][e]
+                    graph.add_edge(nodes_i[u_pos], nodes_ip1[v_pos],
+                                   weight=float(self.weights[i][e]))
+        return graph
+
+    def _get_path_counts(self):
+        """Get the number of paths from each node to the target, by level.
+
+        The counts of each level are obtained from those of the next level
+        as a sparse matrix-vector product with the level's successor
+        adjacency (in CSR form), so the work done per level is vectorized.
+        Counts are int64 arrays as long as they cannot overflow; as soon as
+        the counts of a level could exceed the int64 range, that level and
+        all the ones before it are computed exactly with Python ints
+        (object arrays) instead.
+
+        Returns
+        -------
+        list of numpy.ndarray
+            For each level, an array giving the number of paths to the
+            target from each node at that level. The entry for the source
+            node gives the total number of paths in the graph. The counts
+            are computed once and cached, since they only depend on the
+            structure of the graph.
+        """
+        if self._path_counts is not None:
+            return self._path_counts
+        if not self.level_names:
+            return []
+        counts = [None] * (self.path_length + 1)
+        counts[-1] = np.ones(len(self.level_names[-1]), dtype=np.int64)
+        for i in reversed(range(0, self.path_length)):
+            counts[i] = _propagate_counts(counts[i+1], self.succ_indices[i],
+                                          self.succ_indptr[i])
+        self._path_counts = counts
+        return counts
+
+    def _get_forward_counts(self):
+        """Get the number of paths from the source to each node, by level.
+
+        Counts are computed as in :py:meth:`_get_path_counts`, propagating
+        forward from the source over the predecessor adjacency of each
+        level, and are cached.
+        """
+        if self._forward_counts is not None:
+            return self._forward_counts
+        if not self.level_names:
+            return []
+        counts = [np.zeros(len(self.level_names[0]), dtype=np.int64)]
+        counts[0][0] = 1
+        for i in range(0, self.path_length):
+            counts.append(_propagate_counts(counts[i], self.pred_indices[i],
+                                            self.pred_indptr[i]))
+        self._forward_counts = counts
+        return counts
+
+    def _get_path_offsets(self):
+        # For each level, a list with the number of paths through the edges
+        # of the level before each edge, so that the paths from node u
+        # through its edge e are numbered from offsets[e] - offsets[start]
+        # on, where start is the first edge of u
+        if self._path_offsets is None:
+            counts = self._get_path_counts()
+            self._path_offsets = [
+                [0] + np.cumsum(counts[i+1][self.succ_indices[i]]).tolist()
+                for i in range(0, self.path_length)]
+        return self._path_offsets
+
+    def path_at(self, index, names_only=True):
+        """Return the path with the given index in enumeration order.
+
+        Paths are numbered from 0 to count_paths() - 1 in the order in which
+        they are generated by :py:meth:`iter_paths`. Negative indices count
+        from the end, as for sequences.
+
+        Parameters
+        ----------
+        index : int
+            The index of the path.
+        names_only : boolean
+            Whether the path should consist only of node names, or of node
+            tuples (e.g., including depth and polarity). Default is True
+            (only names).
+
+        Returns
+        -------
+        tuple
+            The path with the given index.
+        """
+        positions, _ = self._unrank(index)
+        return self._path_from_positions(positions, names_only)
+
+    def index_of(self, path, names_only=True):
+        """Return the index of a path in enumeration order.
+
+        This is the inverse of :py:meth:`path_at`.
+
+        Parameters
+        ----------
+        path : tuple
+            The path, as a sequence of node names (or of nodes, if
+            names_only is False).
+        names_only : boolean
+            Whether the path is given as node names or as node tuples.
+            Default is True (names).
+
+        Returns
+        -------
+        int
+            The index of the path.
+
+        Raises
+        ------
+        ValueError
+            If the path is not in the graph.
+        """
+        if self.level_names and len(path) == self.path_length + 1 and \
+           self._path_from_positions([0], names_only)[0] == path[0]:
+            offsets = self._get_path_offsets()
+            index = self._rank(path, names_only, offsets, 0, 0)
+            if index is not None:
+                return index
+        raise ValueError("%s is not a path in the graph" % str(path))
+
+    def _rank(self, path, names_only, offsets, level, pos):
+        # Return the index of the path among the paths starting from the
+        # node at the given position, or None if it is not among them
+        if level == self.path_length:
+            return 0
+        indptr = self.succ_indptr[level]
+        for edge in range(indptr[pos], indptr[pos+1]):
+            succ = self.succ_indices[level][edge]
+            if names_only:
+                node = self.names[self.level_names[level+1][succ]]
+            else:
+                node = self.node(level+1, succ)
+            if node != path[level+1]:
+                continue
+            rank = self._rank(path, names_only, offsets, level+1, succ)
+            if rank is not None:
+                return offsets[level][edge] - offsets[level][indptr[pos]] + \
+                       rank
+        return None
+
+    def _unrank(self, index):
+        """Return the positions and edges of the path with a given index."""
+        num_paths = self.count_paths()
+        if index < 0:
+            index += num_paths
+        if not 0 <= index < num_paths:
+            raise IndexError("Path index out of range")
+        offsets = self._get_path_offsets()
+        positions = [0]
+        edges = []
+        for i in range(0, self.path_length):
+            indptr = self.succ_indptr[i]
+            start, end = indptr[positions[-1]], indptr[positions[-1]+1]
+            # Find the edge whose range of paths contains the index
+            edge = bisect_right(offsets[i], offsets[i][start] + index,
+                                start, end) - 1
+            index -= offsets[i][edge] - offsets[i][start]
+            edges.append(edge)
+            positions.append(int(self.succ_indices[i][edge]))
+        return positions, edges
+
+    def paths_slice(self, start, stop=None, names_only=True):
+        """Return the paths with indices from start up to (excluding) stop.
+
+        The paths are generated by resuming the enumeration of
+        :py:meth:`iter_paths` from the path at index start, so a page of
+        paths can be obtained without enumerating the paths before it.
+
+        Parameters
+        ----------
+        start : int
+            The index of the first path.
+        stop : Optional[int]
+            The index after the last path. If None or larger than the number
+            of paths, paths up to the last one are returned.
+        names_only : boolean
+            Whether the paths should consist only of node names, or of node
+            tuples (e.g., including depth and polarity). Default is True
+            (only names).
+
+        Returns
+        -------
+        tuple of tuples
+            The paths in the slice.
+        """
+        num_paths = self.count_paths()
+        start, stop, _ = slice(start, stop).indices(num_paths)
+        if start >= stop:
+            return tuple()
+        paths = self._iter_positions(self._unrank(start))
+        return tuple(self._path_from_positions(positions, names_only)
+                     for positions in itertools.islice(paths, stop - start))
+
+    def count_paths(self):
+        """Count the total number of paths without enumerating them.
+
+        Returns
+        -------
+        int
+            The number of paths.
+        """
+        if not self.level_names:
+            return 0
+        return int(self._get_path_counts()[0][0])
+
+    def set_uniform_path_distribution(self):
+        """Adjusts edge weights to allow uniform sampling of paths.
+
+        Note that calling this method will over-write any existing edge
+        weights in the graph.
+        """
+        for weights, ratios in zip(self.weights, self._get_count_ratios()):
+            weights[:] = ratios
+        self._cum_weights = None
+
+    def _get_count_ratios(self):
+        """Return count(v) / count(u) for each edge u->v, level by level.
+
+        With these edge weights, the probability of each path is
+        1 / count(source).
+        """
+        counts = self._get_path_counts()
+        all_ratios = []
+        for i in range(0, len(self.succ_indptr)):
+            indptr = self.succ_indptr[i]
+            # Dividing Python ints directly gives correctly rounded ratios
+            # even for counts beyond the range of floats.
+            u_counts = np.repeat(counts[i], np.diff(indptr))
+            v_counts = counts[i+1][self.succ_indices[i]]
+            # Edges into nodes without paths to the target get weight 0
+            u_counts[u_counts == 0] = 1
+            if u_counts.dtype == object:
+                ratios = (v_counts / u_counts).astype(np.float64)
+            else:
+                ratios = v_counts / u_counts.astype(np.float64)
+            all_ratios.append(ratios)
+        return all_ratios
+
+    def node_path_counts(self, weighted=False):
+        """Return the number of paths through the nodes with each name.
+
+        The number of paths through each node is the number of paths from
+        the source to the node times the number of paths from the node to
+        the target, and the counts are summed over the nodes with the same
+        name at different levels (so that a path visiting a name more than
+        once is counted once per visit).
+
+        Parameters
+        ----------
+        weighted : bool
+            If True, return instead the expected number of visits to each
+            name of a path sampled with :py:meth:`sample_paths` under the
+            current edge weights, which for cycle-free paths is the marginal
+            probability of visiting the name. Paths are taken to end when
+            they reach the target, and are conditioned on reaching it.
+            Default is False.
+
+        Returns
+        -------
+        dict
+            Dictionary keyed by node name (as in :py:attr:`names`), with
+            the number of paths (or the expected number of visits) as
+            values. Names not on any path are omitted.
+        """
+        if weighted:
+            level_values, _ = self._get_visit_probabilities()
+        else:
+            level_values = self._get_node_path_counts()
+        if not level_values:
+            return {}
+        keys = np.concatenate(self.level_names)
+        values = _concatenate(level_values)
+        return dict((self.names[key], value) for key, value in
+                    zip(*_sum_by_key(keys, values)) if value)
+
+    def edge_path_counts(self, weighted=False):
+        """Return the number of paths through the edges between each pair of
+        names.
+
+        The number of paths through each edge u->v is the number of paths
+        from the source to u times the number of paths from v to the target,
+        and the counts are summed over the edges between the same pair of
+        names at different levels.
+
+        Parameters
+        ----------
+        weighted : bool
+            If True, return instead the expected number of traversals of the
+            edges between each pair of names by a path sampled with
+            :py:meth:`sample_paths` under the current edge weights (see
+            :py:meth:`node_path_counts`). Default is False.
+
+        Returns
+        -------
+        dict
+            Dictionary keyed by (name, name) tuples, with the number of
+            paths (or the expected number of traversals) as values. Edges
+            not on any path are omitted.
+        """
+        if weighted:
+            _, level_values = self._get_visit_probabilities()
+        else:
+            level_values = self._get_edge_path_counts()
+        if not level_values:
+            return {}
+        num_names = len(self.names)
+        keys = np.concatenate([
+            np.repeat(self.level_names[i].astype(np.int64),
+                      np.diff(self.succ_indptr[i])) * num_names +
+            self.level_names[i+1][self.succ_indices[i]]
+            for i in range(0, self.path_length)])
+        values = _concatenate(level_values)
+        return dict(((self.names[key // num_names],
+                      self.names[key % num_names]), value)
+                    for key, value in zip(*_sum_by_key(keys, values))
+                    if value)
+
+    def _get_node_path_counts(self):
+        # The number of paths through each node, by level
+        if not self.level_names:
+            return []
+        fwd_counts = self._get_forward_counts()
+        counts = self._get_path_counts()
+        dtype = counts[0].dtype
+        return [fwd.astype(dtype) * bwd
+                for fwd, bwd in zip(fwd_counts, counts)]
+
+    def _get_edge_path_counts(self):
+        # The number of paths through each edge, by level, in the order of
+        # succ_indices
+        if not self.level_names:
+            return []
+        fwd_counts = self._get_forward_counts()
+        counts = self._get_path_counts()
+        # The number of paths through an edge is at most the total number
+        # of paths, so the products can only overflow if the total does
+        dtype = counts[0].dtype
+        return [np.repeat(fwd_counts[i].astype(dtype),
+                          np.diff(self.succ_indptr[i])) *
+                counts[i+1][self.succ_indices[i]]
+                for i in range(0, self.path_length)]
+
+    def _get_transition_probabilities(self):
+        """Get the probability of sampling each edge from its start node.
+
+        Returns
+        -------
+        tuple
+            For each level, a boolean array telling which nodes are the
+            target (at which sampled paths end, so that their out-edges have
+            probability 0), and for each level but the last, the transition
+            probability of each edge, in the order of `succ_indices`. Both
+            lists are empty if the graph has no paths or no target.
+        """
+        if not self.level_names or \
+           self.target_name not in self.names:
+            return [], []
+        target_id = self.names.index(self.target_name)
+        at_target = [level == target_id for level in self.level_names]
+        trans_probs = []
+        for i in range(0, self.path_length):
+            indptr = self.succ_indptr[i]
+            totals = np.repeat(_sum_rows(self.weights[i].astype(np.float64),
+                                         indptr), np.diff(indptr))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                probs = np.where(totals > 0, self.weights[i] / totals, 0.0)
+            # Paths don't go on from the target
+            probs[np.repeat(at_target[i], np.diff(indptr))] = 0.0
+            trans_probs.append(probs)
+        return at_target, trans_probs
+
+    def _get_visit_probabilities(self):
+        """Get the expected number of visits to each node and edge by a
+        sampled path, by level.
+
+        The probabilities are obtained with the forward-backward algorithm:
+        the probability of reaching each node from the source, and that of
+        reaching the target from each node, are each propagated over the
+        levels with the transition probabilities given by the edge weights.
+        Since sampling stops at the target, nodes with the target name are
+        not left, wherever they are.
+
+        Returns
+        -------
+        tuple
+            Lists, for each level, of the probabilities of the nodes and of
+            the edges (in the order of `succ_indices`). Both lists are empty
+            if the target can't be reached.
+        """
+        at_target, trans_probs = self._get_transition_probabilities()
+        if not at_target:
+            return [], []
+        # Backward: the probability of reaching the target from each node
+        backward = [at_target[-1].astype(np.float64)]
+        for i in reversed(range(0, self.path_length)):
+            reach = _sum_rows(trans_probs[i] *
+                              backward[0][self.succ_indices[i]],
+                              self.succ_indptr[i])
+            backward.insert(0, np.where(at_target[i], 1.0, reach))
+        total = backward[0][0]
+        if total <= 0:
+            return [], []
+        # Forward: the probability of reaching each node from the source
+        forward = [np.zeros(len(self.level_names[0]))]
+        forward[0][0] = 1.0
+        edge_probs = []
+        for i in range(0, self.path_length):
+            edge_forward = np.repeat(forward[i], np.diff(self.succ_indptr[i]))
+            edge_probs.append(edge_forward * trans_probs[i] *
+                              backward[i+1][self.succ_indices[i]] / total)
+            forward.append(_sum_rows((edge_forward *
+                                      trans_probs[i])[self.pred_edges[i]],
+                                     self.pred_indptr[i]))
+        node_probs = [fwd * bwd / total for fwd, bwd in zip(forward, backward)]
+        return node_probs, edge_probs
+
+    def top_k_paths(self, k, names_only=True):
+        """Return the k most probable paths under weighted sampling.
+
+        The probability of a path is the product of the transition
+        probabilities of its edges, i.e., of the edge weights normalized
+        over the out-edges of each node, as in :py:meth:`sample_paths`
+        (paths end at the target). The paths are found with a best-first
+        search from the source in log space, guided by the exact log
+        probability of the best completion of each partial path, which is
+        computed beforehand in a single backward (Viterbi) pass over the
+        levels. Each path is therefore found with a number of steps
+        proportional to its length, whatever the total number of paths.
+
+        Parameters
+        ----------
+        k : int
+            The number of paths to return.
+        names_only : boolean
+            Whether the paths should consist only of node names, or of node
+            tuples (e.g., including depth and polarity). Default is True
+            (only names).
+
+        Returns
+        -------
+        tuple of tuples
+            Up to k (path, probability) tuples, in order of decreasing
+            probability (ties in the order in which the paths were found).
+        """
+        at_target, trans_probs = self._get_transition_probabilities()
+        if not at_target:
+            return tuple()
+        with np.errstate(divide='ignore'):
+            log_probs = [np.log(probs) for probs in trans_probs]
+        # The log probability of the best path from each node to the target
+        best = [np.where(at_target[-1], 0.0, -np.inf)]
+        for i in reversed(range(0, self.path_length)):
+            indptr = self.succ_indptr[i]
+            rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+            row_best = np.full(len(indptr) - 1, -np.inf)
+            np.maximum.at(row_best, rows,
+                          log_probs[i] + best[0][self.succ_indices[i]])
+            best.insert(0, np.where(at_target[i], 0.0, row_best))
+        if best[0][0] == -np.inf:
+            return tuple()
+        at_target = [level.tolist() for level in at_target]
+        best = [level.tolist() for level in best]
+        indptrs = [indptr.tolist() for indptr in self.succ_indptr]
+        succs = [indices.tolist() for indices in self.succ_indices]
+        probs = [level.tolist() for level in trans_probs]
+        log_probs = [level.tolist() for level in log_probs]
+        # Entries are (-priority, tie breaker, log prob, prob, positions)
+        counter = itertools.count()
+        heap = [(-best[0][0], next(counter), 0.0, 1.0, (0,))]
+        paths = []
+        while heap and len(paths) < k:
+            _, _, log_prob, prob, positions = heapq.heappop(heap)
+            level = len(positions) - 1
+            u = positions[-1]
+            if at_target[level][u]:
+                paths.append((self._path_from_positions(positions,
+                                                        names_only), prob))
+                continue
+            for edge in range(indptrs[level][u], indptrs[level][u+1]):
+                v = succs[level][edge]
+                priority = log_prob + log_probs[level][edge] + \
+                           best[level+1][v]
+                if priority == -np.inf:
+                    continue
+                heapq.heappush(heap, (-priority, next(counter),
+                                      log_prob + log_probs[level][edge],
+                                      prob * probs[level][edge],
+                                      positions + (v,)))
+        return tuple(paths)
+
+    def enumerate_paths(self, names_only=True):
+        """Enumerate all paths from source to target.
+
+        Parameters
+        ----------
+        names_only : boolean
+            Whether the paths should consist only of node names, or of node
+            tuples (e.g., including depth and polarity). Default is True
+            (only names).
+
+        Returns
+        -------
+        tuple of tuples
+            Each item is a tuple representing a path.
+        """
+        return tuple(self.iter_paths(names_only=names_only))
+
+    def iter_paths(self, names_only=True, chunk_size=None):
+        """Iterate over all paths from source to target.
+
+        Paths are generated by a depth-first search over the successor
+        arrays of each level, keeping only the current path and one edge
+        cursor per level in memory. Paths are generated in lexicographic
+        order of the positions of their nodes within each level.
+
+        Parameters
+        ----------
+        names_only : boolean
+            Whether the paths should consist only of node names, or of node
+            tuples (e.g., including depth and polarity). Default is True
+            (only names).
+        chunk_size : Optional[int]
+            If given, the paths are yielded in tuples of (at most) this many
+            paths instead of one by one.
+
+        Returns
+        -------
+        generator
+            Generator of paths (or tuples of paths, if chunk_size is given).
+        """
+        if names_only:
+            level_nodes = [[self.names[name_id] for name_id in name_ids]
+                           for name_ids in self.level_names]
+        else:
+            level_nodes = [[self.node(i, pos) for pos in range(len(name_ids))]
+                           for i, name_ids in enumerate(self.level_names)]
+        paths = (tuple([level_nodes[i][pos] for i, pos in enumerate(path)])
+                 for path in self._iter_positions())
+        return iter_chunks(paths, chunk_size)
+
+    def enumerate_path_ids(self):
+        """Enumerate all paths as rows of an integer array.
+
+        Paths are expanded level by level for all partial paths at once, and
+        are in the same order as those of :py:meth:`iter_paths`.
+
+        Returns
+        -------
+        numpy.ndarray
+            A (num_paths, path_length + 1) array whose rows are the paths,
+            given as indices into the table of node names
+            (:py:attr:`names`).
+        """
+        if not self.level_names:
+            return np.empty((0, self.path_length + 1), dtype=np.int32)
+        # Positions of the nodes of the partial paths at the current level
+        positions = np.zeros((1, 1), dtype=np.int64)
+        for i in range(0, self.path_length):
+            indptr = self.succ_indptr[i]
+            starts = indptr[positions[:, -1]]
+            degrees = indptr[positions[:, -1] + 1] - starts
+            # Each partial path is repeated once for each of its successors,
+            # and the edges of each row are taken in order
+            rows = np.repeat(np.arange(len(positions)), degrees)
+            offsets = np.arange(len(rows)) - \
+                      np.repeat(np.cumsum(degrees) - degrees, degrees)
+            succs = self.succ_indices[i][starts[rows] + offsets]
+            positions = np.column_stack((positions[rows], succs))
+        paths = np.empty(positions.shape, dtype=np.int32)
+        for i, name_ids in enumerate(self.level_names):
+            paths[:, i] = name_ids[positions[:, i]]
+        return paths
+
+    def _iter_positions(self, start=None):
+        """Generate the paths as lists of node positions within each level.
+
+        The same list is modified and yielded for each path. If start is
+        given, it is the (positions, edges) tuple of the path to start the
+        enumeration from, as returned by :py:meth:`_unrank`.
+        """
+        if not self.level_names:
+            return
+        length = self.path_length
+        indptrs = [indptr.tolist() for indptr in self.succ_indptr]
+        succs = [indices.tolist() for indices in self.succ_indices]
+        if start is None:
+            path = [0] * (length + 1)
+            # The next edge to follow and the end of the edges of the current
+            # node at each level
+            cursors = [indptrs[0][0]] + [0] * (length - 1)
+            ends = [indptrs[0][1]] + [0] * (length - 1)
+            level = 0
+        else:
+            # Resume as if the given path had just been reached by following
+            # its last edge
+            path, edges = list(start[0]), start[1]
+            cursors = [edge + 1 for edge in edges[:-1]] + [edges[-1]]
+            ends = [indptrs[i][path[i]+1] for i in range(length)]
+            level = length - 1
+        while level >= 0:
+            if cursors[level] == ends[level]:
+                level -= 1
+                continue
+            v = succs[level][cursors[level]]
+            cursors[level] += 1
+            path[level+1] = v
+            if level + 1 == length:
+                yield path
+            else:
+                level += 1
+                cursors[level] = indptrs[level][v]
+                ends[level] = indptrs[level][v+1]
+
+    def sample_paths(self, num_samples, names_only=True, rng=None,
+                     distribution='weighted'):
+        """Sample paths of the given length between source and target.
+
+        Parameters
+        ----------
+        num_samples : int
+            The number of paths to sample.
+        names_only : boolean
+            Whether the paths should consist only of node names, or of node
+            tuples (e.g., including depth and polarity). Default is True
+            (only names).
+        rng : None, int, numpy.random.SeedSequence or numpy.random.Generator
+            Source of randomness, see :py:func:`paths_graph.sampling.get_rng`.
+            Default is None (the global NumPy random state).
+        distribution : str
+            'weighted' to draw the successor of each node according to the
+            edge weights, or 'uniform' to draw every path with the same
+            probability. Uniform paths are drawn by picking a random path
+            index and unranking it (see :py:meth:`path_at`), which amounts
+            to drawing each successor in proportion to the number of paths
+            leading from it to the target; the cached path counts are used
+            and the edge weights are left unchanged. Default is 'weighted'.
+
+        Returns
+        -------
+        tuple of tuples
+            Each item is a tuple representing a path. Note that the paths
+            may not be unique.
+        """
+        check_distribution(distribution)
+        if not self.level_names:
+            return tuple()
+        rng = get_rng(rng)
+        if distribution == 'uniform':
+            num_paths = self.count_paths()
+            if not num_paths:
+                return tuple()
+            return tuple(self._path_from_positions(
+                            self._unrank(random_below(num_paths, rng))[0],
+                            names_only)
+                         for i in range(num_samples))
+        cum_weights = self._get_cum_weights()
+        paths = []
+        while len(paths) < num_samples:
+            positions = [0]
+            for i in range(0, self.path_length):
+                indptr = self.succ_indptr[i]
+                cum = cum_weights[i]
+                start, end = indptr[positions[-1]], indptr[positions[-1]+1]
+                # If we reach a node without successors, start over
+                if cum[end] <= cum[start]:
+                    break
+                target = cum[start] + rng.random() * (cum[end] - cum[start])
+                edge = np.searchsorted(cum, target, side='right') - 1
+                edge = min(max(edge, start), end - 1)
+                positions.append(int(self.succ_indices[i][edge]))
+            else:
+                paths.append(self._path_from_positions(positions,
+                                                       names_only))
+        return tuple(paths)
+
+    def sample_unique_paths(self, k, weighted=True, names_only=True,
+                            rng=None):
+        """Sample k distinct paths without replacement.
+
+        Parameters
+        ----------
+        k : int
+            The number of paths to sample. If it is at least the number of
+            paths in the graph, all paths are returned, in enumeration
+            order.
+        weighted : bool
+            If True, paths are drawn one at a time, each with probability
+            proportional to its probability under :py:meth:`sample_paths`
+            among the paths not drawn yet; this is done in a single pass with
+            a stochastic beam search (see
+            :py:func:`paths_graph.sampling.stochastic_beam_search`), and the
+            paths are returned in the order they are drawn. If False, every
+            set of k paths is equally likely, and the paths are obtained by
+            drawing k distinct path indices (see :py:meth:`path_at`) and are
+            returned in enumeration order. Default is True.
+        names_only : boolean
+            Whether the paths should consist only of node names, or of node
+            tuples (e.g., including depth and polarity). Default is True
+            (only names).
+        rng : None, int, numpy.random.SeedSequence or numpy.random.Generator
+            Source of randomness, see :py:func:`paths_graph.sampling.get_rng`.
+            Default is None (the global NumPy random state).
+
+        Returns
+        -------
+        tuple of tuples
+            The sampled paths.
+        """
+        num_paths = self.count_paths()
+        if k >= num_paths:
+            return self.enumerate_paths(names_only=names_only)
+        rng = get_rng(rng)
+        if not weighted:
+            return tuple(self.path_at(index, names_only=names_only)
+                         for index in sample_distinct_indices(num_paths, k,
+                                                              rng))
+        # Log-probabilities of the edges of each level, normalized over the
+        # edges of each node
+        cum_weights = self._get_cum_weights()
+        row_totals = [np.repeat(cum[indptr[1:]] - cum[indptr[:-1]],
+                                np.diff(indptr))
+                      for cum, indptr in zip(cum_weights, self.succ_indptr)]
+        with np.errstate(divide='ignore'):
+            log_probs = [(np.log(weights) - np.log(totals)).tolist()
+                         for weights, totals in zip(self.weights,
+                                                    row_totals)]
+        indptrs = [indptr.tolist() for indptr in self.succ_indptr]
+        succs = [indices.tolist() for indices in self.succ_indices]
+
+        # States are tuples of the positions of the nodes of partial paths
+        def children(positions):
+            level = len(positions) - 1
+            indptr = indptrs[level]
+            return [(positions + (succs[level][edge],),
+                     log_probs[level][edge], level + 1 == self.path_length)
+                    for edge in range(indptr[positions[-1]],
+                                      indptr[positions[-1]+1])]
+
+        paths = stochastic_beam_search((0,), children, k, rng)
+        return tuple(self._path_from_positions(positions, names_only)
+                     for positions in paths)
+
+    def sample_paths_batch(self, num_samples, rng=None,
+                           distribution='weighted'):
+        """Sample paths, advancing all samples together level by level.
+
+        At each level, the successors of the current nodes of all samples
+        are drawn in a single vectorized step, making this much faster than
+        :py:meth:`sample_paths` for large numbers of samples. Samples that
+        reach a node without successors are discarded and drawn again.
+
+        Parameters
+        ----------
+        num_samples : int
+            The number of paths to sample.
+        rng : None, int, numpy.random.SeedSequence or numpy.random.Generator
+            Source of randomness, see :py:func:`paths_graph.sampling.get_rng`.
+            Default is None (the global NumPy random state).
+        distribution : str
+            'weighted' to draw successors according to the edge weights, or
+            'uniform' to draw them in proportion to the (cached) number of
+            paths from each successor to the target, so that all paths are
+            equally likely, without changing the edge weights. Default is
+            'weighted'.
+
+        Returns
+        -------
+        tuple
+            A (num_samples, path_length + 1) integer array whose rows are
+            the sampled paths, given as indices into the table of node
+            names, and the table of node names (:py:attr:`names`). Note that
+            the paths may not be unique.
+        """
+        check_distribution(distribution)
+        rng = get_rng(rng)
+        empty = np.empty((0, self.path_length + 1), dtype=np.int32)
+        if not self.level_names or \
+           not all(len(succs) for succs in self.succ_indices):
+            return empty, self.names
+        cum_weights = self._get_cum_weights() if distribution == 'weighted' \
+                      else self._get_cum_counts()
+        positions = np.zeros((num_samples, self.path_length + 1),
+                             dtype=np.int64)
+        num_done = 0
+        while num_done < num_samples:
+            num_left = num_samples - num_done
+            block = np.zeros((num_left, self.path_length + 1),
+                             dtype=np.int64)
+            valid = np.ones(num_left, dtype=bool)
+            for i in range(0, self.path_length):
+                indptr = self.succ_indptr[i]
+                cum = cum_weights[i]
+                starts = indptr[block[:, i]]
+                ends = indptr[block[:, i] + 1]
+                lower = cum[starts]
+                totals = cum[ends] - lower
+                # Samples at nodes without successors (or with zero total
+                # weight) are discarded
+                valid &= totals > 0
+                targets = lower + rng.random(num_left) * totals
+                edges = np.searchsorted(cum, targets, side='right') - 1
+                # Keep the edges within the row of each sample (rounding can
+                # otherwise push them out); the edges of discarded samples
+                # are arbitrary
+                edges = np.clip(edges, starts, ends - 1)
+                block[:, i+1] = self.succ_indices[i][edges]
+            num_valid = np.count_nonzero(valid)
+            if not num_valid and not self.count_paths():
+                return empty, self.names
+            positions[num_done:num_done + num_valid] = block[valid]
+            num_done += num_valid
+        paths = np.empty(positions.shape, dtype=np.int32)
+        for i, name_ids in enumerate(self.level_names):
+            paths[:, i] = name_ids[positions[:, i]]
+        return paths, self.names
+
+    def _get_cum_weights(self):
+        # For each level, the cumulative sum of edge weights with a leading
+        # zero, so that the weights of the edges of row u sum to
+        # cum[indptr[u+1]] - cum[indptr[u]]
+        if self._cum_weights is None:
+            self._cum_weights = [
+                np.concatenate(([0.0], np.cumsum(weights, dtype=np.float64)))
+                for weights in self.weights]
+        return self._cum_weights
+
+    def _get_cum_counts(self):
+        # As _get_cum_weights, but with edge weights proportional to the
+        # number of paths from the end of each edge to the target, divided
+        # exactly by the count of its start (see _get_count_ratios), so that
+        # they stay in range and precise however large the counts are. These
+        # only depend on the structure of the graph, so they are computed
+        # once.
+        if self._cum_counts is None:
+            self._cum_counts = [
+                np.concatenate(([0.0], np.cumsum(ratios)))
+                for ratios in self._get_count_ratios()]
+        return self._cum_counts
+
+    def _path_from_positions(self, positions, names_only):
+        if names_only:
+            return tuple(self.names[self.level_names[i][pos]]
+                         for i, pos in enumerate(positions))
+        return tuple(self.node(i, pos) for i, pos in enumerate(positions))
+
+
+def _propagate_counts(counts, indices, indptr):
+    """Return the sums of counts over the CSR rows of a level's edges."""
+    edge_counts = counts[indices]
+    # The total over the edges of the level bounds both the count of every
+    # row and the cumulative sums taken by _sum_rows
+    if edge_counts.dtype != object and \
+       edge_counts.sum(dtype=np.float64) >= _MAX_EXACT_INT64:
+        logger.debug("Path counts exceed int64, switching to Python ints")
+        edge_counts = edge_counts.astype(object)
+    return _sum_rows(edge_counts, indptr)
+
+
+def _sum_by_key(keys, values):
+    """Return the distinct keys and the sums of the values for each key."""
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    indptr = np.append(starts, len(keys))
+    return keys[starts].tolist(), _sum_rows(values[order], indptr).tolist()
+
+
+def _concatenate(arrays):
+    # Concatenate arrays, keeping Python ints if any of the arrays has them
+    if any(arr.dtype == object for arr in arrays):
+        arrays = [arr.astype(object) for arr in arrays]
+    return np.concatenate(arrays)
@@ -0,0 +1,173 @@
+import os
+import logging
+from copy import deepcopy
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+logger = logging.getLogger('paths_graph')
+
+
+# The object being sampled from in a worker process, set once per worker by
+# _init_worker so that it doesn't have to be sent along with each task
+_worker_obj = None
+
+
+def sample_parallel(obj, method_name, num_samples, n_jobs=None,
+                    executor=None, rng=None, return_attr=None, **kwargs):
+    """Run a sampling method of an object in parallel worker processes.
+
+    The samples are split as evenly as possible into one chunk per job, and
+    each chunk is drawn in a separate task with an independent random
+    stream spawned from a common SeedSequence. The results are concatenated
+    in chunk order, so they are reproducible for a given seed and number of
+    jobs (but differ from those of serial sampling with the same seed).
+
+    Parameters
+    ----------
+    obj : object
+        The object to sample from, e.g., a PathsGraph. It must be picklable.
+    method_name : str
+        The name of the sampling method of the object. It is called with
+        the number of samples of a chunk, the `rng` keyword argument and
+        any additional keyword arguments.
+    num_samples : int
+        The total number of samples to draw.
+    n_jobs : Optional[int]
+        The number of chunks (and worker processes if no executor is
+        given). If None or -1, the number of CPUs is used.
+    executor : Optional[concurrent.futures.Executor]
+        Process-based executor to submit the tasks to (sampling may modify
+        the object, so it should not be shared by the threads of a thread
+        pool). If not given, a process pool with n_jobs workers is created
+        for the call, and the object is sent to each worker once, when the
+        worker starts. With a given executor, the object is sent along with
+        each task.
+    rng : None, int, numpy.random.SeedSequence or numpy.random.Generator
+        Seed for the random streams of the tasks. If None, the seed is drawn
+        from the global NumPy random state.
+    return_attr : Optional[str]
+        If given, the value of this attribute of the object, after sampling
+        in the worker, is returned for each chunk along with the samples.
+
+    Returns
+    -------
+    tuple or (tuple, list)
+        The samples of all chunks, concatenated. If return_attr is given,
+        also the list of values of the attribute for each chunk.
+    """
+    n_jobs = get_n_jobs(n_jobs)
+    chunk_sizes = [len(chunk) for chunk in
+                   np.array_split(np.arange(num_samples), n_jobs)]
+    chunk_sizes = [size for size in chunk_sizes if size]
+    seeds = get_seed_sequence(rng).spawn(len(chunk_sizes))
+    tasks = [(method_name, size, seed, return_attr, kwargs)
+             for size, seed in zip(chunk_sizes, seeds)]
+    logger.debug("Sampling %d paths in %d chunks" %
+                 (num_samples, len(tasks)))
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=len(tasks) or 1,
+                                 initializer=_init_worker,
+                                 initargs=(obj,)) as pool:
+            results = list(pool.map(_run_task, tasks))
+    else:
+        futures = [executor.submit(_run_obj_task, obj, task)
+                   for task in tasks]
+        results = [future.result() for future in futures]
+    samples = tuple(sample for chunk, _ in results for sample in chunk)
+    if return_attr is None:
+        return samples
+    return samples, [attr for _, attr in results]
+
+
+def get_n_jobs(n_jobs=None):
+    """Return the number of jobs to use, the number of CPUs if None or -1."""
+    if n_jobs is None or n_jobs == -1:
+        return os.cpu_count() or 1
+    return n_jobs
+
+
+def worker_pool(obj, n_jobs):
+    """Return a process pool whose workers each receive an object once.
+
+    The object is sent to each worker when it starts, so that tasks run
+    with :py:func:`run_with_worker_obj` can use it without it being sent
+    along with each task.
+
+    Parameters
+    ----------
+    obj : object
+        The (read-only) object to send to the workers. It must be picklable.
+    n_jobs : int
+        The number of worker processes.
+
+    Returns
+    -------
+    concurrent.futures.ProcessPoolExecutor
+        The process pool, to be shut down after use (e.g., by using it as a
+        context manager).
+    """
+    return ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                               initargs=(obj,))
+
+
+def run_with_worker_obj(task):
+    """Run a task in a worker of a pool created by :py:func:`worker_pool`.
+
+    Parameters
+    ----------
+    task : tuple
+        A function and a tuple of arguments. The function is called with
+        the object of the worker followed by the arguments. The function
+        must be picklable, e.g., defined at the top level of a module.
+    """
+    func, args = task
+    return func(_worker_obj, *args)
+
+
+def get_seed_sequence(rng=None):
+    """Return a SeedSequence from which independent streams can be spawned.
+
+    Parameters
+    ----------
+    rng : None, int, numpy.random.SeedSequence or numpy.random.Generator
+        If an int, it is used as the entropy of the SeedSequence; a
+        SeedSequence is returned as is. Otherwise, the entropy is drawn
+        from the given Generator (or RandomState), or from the global NumPy
+        random state if None, so that numpy.random.seed makes the result
+        reproducible.
+    """
+    if isinstance(rng, np.random.SeedSequence):
+        return rng
+    if rng is None or rng is np.random:
+        entropy = np.random.randint(0, 2**31, size=4)
+    elif isinstance(rng, np.random.Generator):
+        entropy = rng.integers(0, 2**31, size=4)
+    elif isinstance(rng, np.random.RandomState):
+        entropy = rng.randint(0, 2**31, size=4)
+    else:
+        entropy = rng
+    return np.random.SeedSequence(entropy)
+
+
+def _init_worker(obj):
+    global _worker_obj
+    _worker_obj = obj
+
+
+def _run_task(task):
+    return _run_obj_task(_worker_obj, task)
+
+
+def _run_obj_task(obj, task):
+    method_name, num_samples, seed, return_attr, kwargs = task
+    # The attribute is reset after each task so that the results of a task
+    # don't depend on which tasks ran before it in the same worker
+    initial_attr = deepcopy(getattr(obj, return_attr)) \
+                   if return_attr is not None else None
+    method = getattr(obj, method_name)
+    samples = method(num_samples, rng=np.random.default_rng(seed), **kwargs)
+    attr = None
+    if return_attr is not None:
+        attr = getattr(obj, return_attr)
+        setattr(obj, return_attr, initial_attr)
+    return samples, attr
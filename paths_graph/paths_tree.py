@@ -1,7 +1,7 @@
-import os
 from collections import deque
 import numpy as np
 import networkx as nx
+from .sampling import SuccessorSampler, get_rng
 
 class PathsTree(object):
     """Build a tree representing a set of paths.
@@ -28,6 +28,7 @@ class PathsTree(object):
     """
     def __init__(self, paths, source_graph=None):
         self.graph = nx.DiGraph()
+        self._sampler = None
         if paths:
             edge_set = set()
             for path in paths:
@@ -49,7 +50,15 @@ class PathsTree(object):
                 edges_with_weights.append((head, tail, {'weight': weight}))
             self.graph.add_edges_from(edges_with_weights)
 
-    def sample(self, num_samples=1000):
+    @property
+    def sampler(self):
+        """The SuccessorSampler used to draw successors in :py:meth:`sample`.
+        """
+        if self._sampler is None or self._sampler.graph is not self.graph:
+            self._sampler = SuccessorSampler(self.graph)
+        return self._sampler
+
+    def sample(self, num_samples=1000, rng=None):
         """Sample a set of paths from the path tree.
 
         At each sampling step, the next node is chosen at random from the set
@@ -60,31 +69,28 @@ class PathsTree(object):
         ----------
         num_samples : int
             Number of paths to sample.
+        rng : None, int, numpy.random.SeedSequence or numpy.random.Generator
+            Source of randomness, see :py:func:`paths_graph.sampling.get_rng`.
+            Default is None (the global NumPy random state).
         """
         # Make sure we have a graph to sample from
         if not self.graph:
             return []
         # If so, do the sampling
+        rng = get_rng(rng)
+        sampler = self.sampler
         sampled_paths = []
         while len(sampled_paths) < num_samples:
             # The root of the tree should be the empty tuple
             node = tuple()
             while True:
-                out_edges = list(self.graph.out_edges(node, data=True))
+                # Choose a successor at random based on the weights
+                next = sampler.sample(node, rng)
                 # If there are no successors to the current node, then we've
                 # hit a leaf of the tree and have found a path
-                if not out_edges:
+                if next is None:
                     break
-                # For determinism in testing, sort the out edges
-                if 'TEST_FLAG' in os.environ:
-                    out_edges = sorted(list(out_edges))
-                # The float is necessary here for Python 2 compatibility
-                weights = [float(t[2]['weight']) for t in out_edges]
-                # Normalize the weights to a proper probability distribution
-                p = np.array(weights) / np.sum(weights)
-                # Choose a successor at random based on the weights
-                pred_idx = np.random.choice(range(len(out_edges)), p=p)
-                node = out_edges[pred_idx][1]
+                node = next
             # Add the path (contained by the leaf node) to the list of sampled
             # paths
             sampled_paths.append(node)
@@ -1,20 +1,22 @@
-import os
 import logging
 import itertools
 from copy import deepcopy
 import numpy as np
-from collections import defaultdict
 import networkx as nx
+from .compiled import CompiledGraph, LevelSets, expand_levels
+from .sampling import SuccessorSampler, get_rng, check_distribution
+from .parallel import sample_parallel
 
 logger = logging.getLogger('paths_graph')
 
 
-def get_reachable_sets(g, source, target, max_depth=10, signed=False):
+def get_reachable_sets(g, source, target, max_depth=10, signed=False,
+                       vectorized=False, cache=None):
     """Get sets of nodes reachable from source and target at different depths.
 
     Parameters
     ----------
-    g : nx.DiGraph
+    g : nx.DiGraph or CompiledGraph
         The underlying graph used for computing reachable node sets.
     source : str
         Name of source node.
@@ -26,6 +28,17 @@ def get_reachable_sets(g, source, target, max_depth=10, signed=False):
         Whether the graph is signed. If True, sign information should be encoded
         in the 'sign' field of the edge data, with 0 indicating a positive edge
         and 1 indicating a negative edge.
+    vectorized : boolean
+        If True, the graph is compiled into a
+        :py:class:`paths_graph.CompiledGraph` (if it isn't one already) and
+        each level is expanded as a whole using boolean masks over the node
+        states. Reachable sets are always computed this way for compiled
+        graphs. Default is False.
+    cache : Optional[paths_graph.ReachSetCache]
+        If provided, the forward and backward levels are looked up in (and
+        added to) the cache, so that queries sharing a source or a target
+        reuse each other's work. The graph is compiled if it isn't a
+        :py:class:`paths_graph.CompiledGraph` already.
 
     Returns
     -------
@@ -38,8 +51,17 @@ def get_reachable_sets(g, source, target, max_depth=10, signed=False):
         consist of tuples (u, w), where u is the name of the node and w is the
         cumulative polarity, forwards or backwards, from the source or target,
         respectively. Note that if the source or target are not reachable by
-        any path within the given maximum depth, both dicts are empty.
+        any path within the given maximum depth, both dicts are empty. For
+        compiled graphs, the reachable sets are returned as
+        :py:class:`paths_graph.compiled.LevelSets`, which build the sets of
+        nodes lazily from the underlying boolean masks.
     """
+    if (vectorized or cache is not None) and \
+       not isinstance(g, CompiledGraph):
+        g = CompiledGraph.from_graph(g)
+    if isinstance(g, CompiledGraph):
+        return _get_compiled_reachable_sets(g, source, target, max_depth,
+                                            signed, cache=cache)
     # Forward and backward level sets for signed and unsigned graphs
     if signed:
         source = (source, 0)
@@ -95,6 +117,37 @@ def get_reachable_sets(g, source, target, max_depth=10, signed=False):
     return (f_level, b_level)
 
 
+def _get_compiled_reachable_sets(cg, source, target, max_depth, signed,
+                                 cache=None):
+    """Get reachable sets by vectorized expansion of boolean level masks.
+
+    Each level is represented as a boolean mask over the states of the
+    compiled graph (node ids for unsigned graphs, and 2 * node id + polarity
+    for signed graphs), and the frontier is expanded by gathering the edges
+    of all frontier states from the CSR arrays at once.
+    """
+    if signed:
+        cg._check_signed()
+    src_state = cg.state((source, 0) if signed else source, signed)
+    tgt_state = cg.state((target, 0) if signed else target, signed)
+    directions = (('forward', src_state, tgt_state),
+                  ('backward', tgt_state, src_state))
+    levels = []
+    for direction, start, end in directions:
+        if cache is not None:
+            masks = cache.get_levels(cg, start, max_depth, direction, signed)
+        else:
+            masks = [np.zeros(cg.num_states(signed), dtype=bool)]
+            masks[0][start] = True
+            expand_levels(cg, masks, max_depth, direction, signed)
+        masks = masks[:max_depth+1]
+        # Make sure that we reached the other end
+        if not any(mask[end] for mask in masks):
+            return ({}, {})
+        levels.append(LevelSets(cg, masks, signed))
+    return tuple(levels)
+
+
 class PathsGraph(object):
     """Class representing the Paths Graph data structure.
 
@@ -139,6 +192,8 @@ class PathsGraph(object):
         self.path_length = path_length
         # Used in cycle-free path sampling
         self._blacklist_by_path = {}
+        self._sampler = None
+        self._layered = None
 
     @classmethod
     def from_graph(klass, g, source, target, length, fwd_reachset=None,
@@ -152,18 +207,19 @@ class PathsGraph(object):
 
         The function uses the forward and backward reach sets provided as
         arguments to efficiently identify the subset of nodes that are
-        reachable from both the forward and backward directions. Pairs of nodes
-        at neighboring levels are then checked against the original graph to
-        determine which nodes are connected by edges with the appropriate
-        direction and polarity. These nodes are then used to create a new
-        graph, the "paths graph," which consists solely of these nodes and
-        edges. This graph represents the superset of all possible paths from
-        source to target of a given legnth and target polarity. Specific paths
-        can then be obtained by sampling.
+        reachable from both the forward and backward directions. The
+        out-edges of the nodes at each level are then looked up in the
+        original graph to determine which nodes at the next level they are
+        connected to with the appropriate direction and polarity. These
+        nodes are then used to create a new graph, the "paths graph," which
+        consists solely of these nodes and edges. This graph represents the
+        superset of all possible paths from source to target of a given
+        legnth and target polarity. Specific paths can then be obtained by
+        sampling.
 
         Parameters
         ----------
-        g : networkx.DiGraph
+        g : networkx.DiGraph or CompiledGraph
             The underlying graph on which paths will be generated.
         source : str
             Name of the source node.
@@ -202,140 +258,9 @@ class PathsGraph(object):
             Instance of PathsGraph class representing paths from source to
             target with a given length and overall polarity.
         """
-        # If the reachable sets aren't provided by the user, compute them here
-        # with a maximum depth given by the target path length.
-        if fwd_reachset is None or back_reachset is None:
-            (fwd_reachset, back_reachset) = get_reachable_sets(g, source,
-                                                 target, max_depth=length,
-                                                 signed=signed)
-
-        # If either fwd_reachset or back_reachset is an empty dict (as they
-        # would be if the nodes were unreachable from either directions) return
-        # an empty paths graph
-        if not fwd_reachset or not back_reachset:
-            paths_graph = nx.DiGraph()
-            return PathsGraph(source, target, paths_graph, length, signed,
-                              target_polarity)
-        # Otherwise, if the reachable sets are provided, use them after checking
-        # if they have a depth at least equal to the given path length
-        _check_reach_depth('forward', fwd_reachset, length)
-        _check_reach_depth('backward', back_reachset, length)
-        # Also, if the reachable sets do not have entries at the given length,
-        # this means that either we are attempting to create a paths_graph for
-        # a path longer than we generated reachable sets, or there is no path of
-        # the given length (may depend on whether cycles were eliminated when
-        # when generating the reachable sets).
-        if not (length in fwd_reachset and length in back_reachset):
-            paths_graph = nx.DiGraph()
-            return klass(source, target, paths_graph, length, signed,
-                         target_polarity)
-        # By default, we set the "adjusted backward reach set", aka
-        # back_reachset_adj, to be the same as the original back_reachset; this
-        # is only overriden if we have a signed graph and a negative target
-        # polarity
-        back_reachset_adj = back_reachset
-        # Signed graphs
-        if signed:
-            level = {0: set([(source, 0)]),
-                     length: set([(target, target_polarity)])}
-            # If the target polarity is even (positive/neutral), then the
-            # cumulative polarities in the forward direction will match those
-            # in the reverse direction; if the target polarity is odd, then the
-            # polarities will be opposite at each matching node. Thus we check
-            # the target polarity and flip the polarities of the backward reach
-            # set if appropriate.
-            if target_polarity == 1:
-                back_reachset_adj = {}
-                for i in range(0, len(back_reachset)):
-                    polar_set = set()
-                    for (u, w) in back_reachset[i]:
-                        w_flipped = (w + 1) % 2
-                        polar_set.add((u, w_flipped))
-                    back_reachset_adj[i] = polar_set
-        # Unsigned graphs
-        else:
-            level = {0: set([source]), length: set([target])}
-        # Next we calculate the subset of nodes at each level that are reachable
-        # from both the forward and backward directions. Because the polarities
-        # have already been set appropriately, we can do this with a simple
-        # set intersection. We also make sure that the target doesn't reappear
-        # anywhere except at the correct level.
-        for i in range(1, length):
-            f_reach_set = fwd_reachset[i]
-            b_reach_set = back_reachset_adj[length - i]
-            path_nodes = set(f_reach_set) & set(b_reach_set) - set([target])
-            level[i] = path_nodes
-        # Next we explicitly enumerate the path graph nodes by tagging each node
-        # with its level in the path
-        pg_nodes = {}
-        for i in range(0,length+1):
-            pg_nodes[i] = list(itertools.product([i], level[i])) 
-        # Finally we add edges between these nodes if they are found in the
-        # original graph. Note that we have to check for an edge of the
-        # appropriate polarity.
-        pg_edges = []
-        g_edges = []
-        edge_weights = {}
-        # Collect edge and edge weight info from the graph
-        for u, v, data in g.edges(data=True):
-            if signed:
-                edge_key = (u, v, data['sign'])
-            else:
-                edge_key = (u, v)
-            g_edges.append(edge_key)
-            edge_weights[edge_key] = float(data.get('weight', 1.0))
-        for i in range(0, length):
-            actual_edges = []
-            logger.info("paths_graph: identifying edges at level %d" % i)
-            if signed:
-                # This set stores the information for performing the set
-                # intersection with the edges in the source graph
-                possible_edges = set()
-                # This dict stores the information for the actual edge, with
-                # weight, as we will need to add it to the PG
-                edge_lookup = {}
-                for edge in itertools.product(pg_nodes[i], pg_nodes[i+1]):
-                    u_name, u_pol = edge[0][1]
-                    v_name, v_pol = edge[1][1]
-                    # If the polarity between neighboring nodes is the same,
-                    # then we need a positive edge
-                    required_sign = 0 if u_pol == v_pol else 1
-                    edge_key = (u_name, v_name, required_sign)
-                    possible_edges.add(edge_key)
-                    edge_lookup[edge_key] = edge
-                for edge_key in possible_edges.intersection(g_edges):
-                    weighted_edge = edge_lookup[edge_key] + \
-                                       ({'weight': edge_weights[edge_key]},)
-                    actual_edges.append(weighted_edge)
-            else:
-                # Build a set representing possible edges between adjacent
-                # levels
-                num_possible_edges = len(pg_nodes[i]) * len(pg_nodes[i+1])
-                logger.info("%d nodes at level %d, %d nodes at level %d,"
-                            "%d possible edges" %
-                            (len(pg_nodes[i]), i, len(pg_nodes[i+1]), i+1,
-                             num_possible_edges))
-                logger.info("%d edges in graph" % len(g_edges))
-                if num_possible_edges < len(g_edges):
-                    logger.info("Enumerating possible edges")
-                    possible_edges = set([(u[1], v[1])
-                                         for u, v in
-                                         itertools.product(pg_nodes[i],
-                                                           pg_nodes[i+1])])
-                    # Actual edges are the ones contained in the original graph;
-                    # add to list with prepended depths
-                    logger.info("Enumerating actual edges")
-                    for u, v in possible_edges.intersection(g_edges):
-                        actual_edges.append(((i, u), (i+1, v),
-                                             {'weight': edge_weights[(u, v)]}))
-                else:
-                    logger.info("Enumerating edges in graph")
-                    for u, v in g_edges:
-                        if u in level[i] and v in level[i+1]:
-                            actual_edges.append(((i, u), (i+1, v),
-                                              {'weight': edge_weights[(u, v)]}))
-            pg_edges.extend(actual_edges)
-            logger.info("Done.")
+        pg_edges = get_paths_graph_edges(g, source, target, length,
+                                          fwd_reachset, back_reachset,
+                                          signed, target_polarity)
         logger.info("Creating graph")
         paths_graph = nx.DiGraph()
         paths_graph.add_edges_from(pg_edges)
@@ -345,41 +270,142 @@ class PathsGraph(object):
                      target_polarity)
 
     def enumerate_paths(self, names_only=True):
+        return tuple(self.iter_paths(names_only=names_only))
+
+    def iter_paths(self, names_only=True, chunk_size=None):
+        """Iterate over all paths from source to target.
+
+        Unlike :py:meth:`enumerate_paths`, paths are generated one at a time
+        as they are found, so they don't all have to be kept in memory. The
+        enumeration runs on the layered representation of the graph (see
+        :py:meth:`to_layered`), and paths are generated in canonical order.
+
+        Parameters
+        ----------
+        names_only : boolean
+            Whether the paths should consist only of node names, or of node
+            tuples (e.g., including depth and polarity). Default is True
+            (only names).
+        chunk_size : Optional[int]
+            If given, the paths are yielded in tuples of (at most) this many
+            paths instead of one by one.
+
+        Returns
+        -------
+        generator
+            Generator of paths (or tuples of paths, if chunk_size is given).
+        """
         if not self.graph:
+            return iter_chunks((), chunk_size)
+        return self.to_layered().iter_paths(names_only=names_only,
+                                            chunk_size=chunk_size)
+
+    def path_at(self, index, names_only=True):
+        """Return the path with the given index in enumeration order.
+
+        Paths are numbered from 0 to count_paths() - 1 in the order in which
+        they are generated by :py:meth:`iter_paths`, using the cached path
+        counts of the layered representation of the graph, so that any path
+        can be accessed without enumerating the paths before it. Negative
+        indices count from the end.
+
+        Parameters
+        ----------
+        index : int
+            The index of the path.
+        names_only : boolean
+            Whether the path should consist only of node names, or of node
+            tuples (e.g., including depth and polarity). Default is True
+            (only names).
+
+        Returns
+        -------
+        tuple
+            The path with the given index.
+        """
+        # Counting first raises in subclasses that can't count their paths
+        if not self.count_paths():
+            raise IndexError("Path index out of range")
+        return self.to_layered().path_at(index, names_only=names_only)
+
+    def index_of(self, path, names_only=True):
+        """Return the index of a path in enumeration order.
+
+        This is the inverse of :py:meth:`path_at`.
+
+        Parameters
+        ----------
+        path : tuple
+            The path, as a sequence of node names (or of nodes, if
+            names_only is False).
+        names_only : boolean
+            Whether the path is given as node names or as node tuples.
+            Default is True (names).
+
+        Returns
+        -------
+        int
+            The index of the path.
+
+        Raises
+        ------
+        ValueError
+            If the path is not in the graph.
+        """
+        if not self.count_paths():
+            raise ValueError("%s is not a path in the graph" % str(path))
+        return self.to_layered().index_of(path, names_only=names_only)
+
+    def paths_slice(self, start, stop=None, names_only=True):
+        """Return the paths with indices from start up to (excluding) stop.
+
+        See :py:meth:`path_at` for the numbering of paths. Only the paths
+        in the slice are generated.
+
+        Parameters
+        ----------
+        start : int
+            The index of the first path.
+        stop : Optional[int]
+            The index after the last path. If None or larger than the number
+            of paths, paths up to the last one are returned.
+        names_only : boolean
+            Whether the paths should consist only of node names, or of node
+            tuples (e.g., including depth and polarity). Default is True
+            (only names).
+
+        Returns
+        -------
+        tuple of tuples
+            The paths in the slice.
+        """
+        if not self.count_paths():
             return tuple()
-        paths = [tuple(path) for path in nx.all_simple_paths(self.graph,
-                                    self.source_node, self.target_node)]
-        if names_only:
-            paths = self._name_paths(paths)
-        return tuple(paths)
+        return self.to_layered().paths_slice(start, stop,
+                                             names_only=names_only)
 
     def _get_path_counts(self):
         """Get a dictionary giving the number of paths through each node.
 
         The entry for the source node gives the total number of paths in the
-        graph.
+        graph. The counts are computed level by level on the layered
+        representation of the graph (see :py:meth:`to_layered`), and are
+        cached along with it.
         """
         if not self.graph:
             return {}
-        # Group nodes by level
-        levels = defaultdict(list)
-        for node in self.graph.nodes():
-            levels[node[0]].append(node)
-        # Initialize the path count
-        path_counts = {}
-        path_counts[self.target_node] = 1
-        # Iterate over the levels going "backwards" from the target. This way
-        # the path count at each node reflects the number of paths passing
-        # through that node from source to target
-        for i in reversed(range(0, self.path_length)):
-            # Iterate over the nodes at this level
-            for node in levels[i]:
-                # The count for this node is the sum of the counts over all
-                # of its successors
-                path_counts[node] = \
-                        sum([path_counts[succ]
-                            for succ in self.graph.successors(node)])
-        return path_counts
+        layered = self.to_layered()
+        cached = getattr(self, '_path_counts', None)
+        if cached is None or cached[0] is not layered:
+            # Nodes that are not on any path have a count of 0
+            path_counts = dict.fromkeys(self.graph, 0)
+            path_counts[self.target_node] = 1
+            for i, counts in enumerate(layered._get_path_counts()):
+                for pos, count in enumerate(counts.tolist()):
+                    path_counts[layered.node(i, pos)] = count
+            cached = (layered, path_counts)
+            self._path_counts = cached
+        return cached[1]
 
     def count_paths(self):
         """Count the total number of paths without enumerating them.
@@ -389,11 +415,9 @@ class PathsGraph(object):
         int
             The number of paths.
         """
-        path_counts = self._get_path_counts()
-        total_count = path_counts.get(self.source_node)
-        if total_count is None:
-            total_count = 0
-        return total_count
+        if not self.graph:
+            return 0
+        return self.to_layered().count_paths()
 
     def _get_cf_path_counts(self):
         """Get the total number of cycle-free paths.
@@ -414,30 +438,236 @@ class PathsGraph(object):
         cfpc = self._get_cf_path_counts()
         return cfpc.get(self.source_node, tuple())
 
+    def node_path_counts(self, weighted=False):
+        """Return the number of paths passing through each node.
+
+        Counts are computed on the layered representation of the graph (see
+        :py:meth:`paths_graph.LayeredPathsGraph.node_path_counts`), without
+        enumerating or sampling paths, and are aggregated by node name over
+        levels and, for signed graphs, polarities. A path visiting a node
+        more than once is counted once per visit.
+
+        Parameters
+        ----------
+        weighted : bool
+            If True, return instead the expected number of visits to each
+            node by a path sampled with :py:meth:`sample_paths` under the
+            current edge weights; for cycle-free paths (as in a CFPG) this
+            is the probability that a sampled path visits the node. Default
+            is False.
+
+        Returns
+        -------
+        dict
+            Dictionary keyed by node name, with the number of paths (or the
+            expected number of visits) as values.
+        """
+        if not self.graph:
+            return {}
+        counts = self.to_layered().node_path_counts(weighted=weighted)
+        if not self.signed:
+            return counts
+        return _merge_keys(counts, lambda name: name[0])
+
+    def edge_path_counts(self, weighted=False):
+        """Return the number of paths passing through each edge.
+
+        See :py:meth:`node_path_counts`; counts are aggregated by the names
+        of the nodes at either end of the edges.
+
+        Parameters
+        ----------
+        weighted : bool
+            If True, return instead the expected number of traversals of
+            each edge by a path sampled with :py:meth:`sample_paths` under
+            the current edge weights. Default is False.
+
+        Returns
+        -------
+        dict
+            Dictionary keyed by (name, name) tuples, with the number of
+            paths (or the expected number of traversals) as values.
+        """
+        if not self.graph:
+            return {}
+        counts = self.to_layered().edge_path_counts(weighted=weighted)
+        if not self.signed:
+            return counts
+        return _merge_keys(counts, lambda edge: (edge[0][0], edge[1][0]))
+
+    def visit_probabilities(self):
+        """Return the probability that a sampled path visits each node and
+        edge.
+
+        The probabilities are exact marginals of the distribution of paths
+        sampled by :py:meth:`sample_paths` under the current edge weights,
+        computed with a forward-backward pass over the normalized transition
+        probabilities of the layered representation of the graph, in time
+        linear in the number of edges (see
+        :py:meth:`paths_graph.LayeredPathsGraph.node_path_counts`).
+
+        Returns
+        -------
+        tuple of dicts
+            Dictionaries mapping the nodes and the edges (as (u, v) tuples)
+            of the paths graph to their visit probabilities. Nodes and edges
+            that are not on any path are omitted.
+        """
+        if not self.graph:
+            return {}, {}
+        layered = self.to_layered()
+        node_probs, edge_probs = layered._get_visit_probabilities()
+        node_dict = {}
+        edge_dict = {}
+        for i, probs in enumerate(node_probs):
+            for pos in np.flatnonzero(probs).tolist():
+                node_dict[layered.node(i, pos)] = float(probs[pos])
+        for i, probs in enumerate(edge_probs):
+            indptr = layered.succ_indptr[i]
+            us = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+            for edge in np.flatnonzero(probs).tolist():
+                u = layered.node(i, int(us[edge]))
+                v = layered.node(i+1, int(layered.succ_indices[i][edge]))
+                edge_dict[(u, v)] = float(probs[edge])
+        return node_dict, edge_dict
+
+    def top_k_paths(self, k, names_only=True):
+        """Return the k most probable paths under the current edge weights.
+
+        The probability of a path is the probability of sampling it with
+        :py:meth:`sample_paths`. The paths are found with a best-first
+        search over the layered representation of the graph, without
+        enumerating all paths (see
+        :py:meth:`paths_graph.LayeredPathsGraph.top_k_paths`).
+
+        Parameters
+        ----------
+        k : int
+            The number of paths to return.
+        names_only : boolean
+            Whether the paths should consist only of node names, or of the
+            nodes of the paths graph. Default is True (only names).
+
+        Returns
+        -------
+        tuple of tuples
+            Up to k (path, probability) tuples, in order of decreasing
+            probability.
+        """
+        if not self.graph:
+            return tuple()
+        return self.to_layered().top_k_paths(k, names_only=names_only)
+
     def set_uniform_path_distribution(self):
         """Adjusts edge weights to allow uniform sampling of paths.
 
         Note that calling this method will over-write any existing edge
         weights in the graph.
         """
-        path_counts = self._get_path_counts()
-        weight_dict = {}
-        for u in self.graph.nodes():
-            count_tuples = [(v, float(path_counts[v]))
-                            for v in self.graph.successors(u)]
-            if not count_tuples:
-                continue
-            v_list, counts = zip(*count_tuples)
-            weights = np.array(counts) / np.sum(counts)
-            for ix, v in enumerate(v_list):
-                weight_dict[(u, v)] = weights[ix]
+        if not self.graph:
+            return
+        layered = self.to_layered()
+        layered.set_uniform_path_distribution()
+        # Edges that are not on any path get a weight of 0
+        weight_dict = dict.fromkeys(self.graph.edges(), 0.0)
+        for i in range(0, len(layered.succ_indptr)):
+            nodes = [layered.node(i, pos)
+                     for pos in range(len(layered.level_names[i]))]
+            next_nodes = [layered.node(i+1, pos)
+                          for pos in range(len(layered.level_names[i+1]))]
+            indptr = layered.succ_indptr[i].tolist()
+            succs = layered.succ_indices[i].tolist()
+            weights = layered.weights[i].tolist()
+            for u_pos, u in enumerate(nodes):
+                for edge in range(indptr[u_pos], indptr[u_pos+1]):
+                    weight_dict[(u, next_nodes[succs[edge]])] = weights[edge]
         nx.set_edge_attributes(self.graph, name='weight', values=weight_dict)
+        # The layered graph has the same weights, so it remains valid
+        self._sampler = None
+
+    @property
+    def sampler(self):
+        """The SuccessorSampler used to draw successors during sampling.
+
+        The sampler is created on first use and precomputes the sampling
+        table of each node when it is first visited. It is discarded when
+        weights are reset by :py:meth:`set_uniform_path_distribution`; if
+        the edge weights of the graph are changed directly,
+        :py:meth:`clear_cache` should be called.
+        """
+        sampler = getattr(self, '_sampler', None)
+        if sampler is None or sampler.graph is not self.graph:
+            sampler = SuccessorSampler(self.graph)
+            self._sampler = sampler
+        return sampler
+
+    def clear_cache(self):
+        """Discard the cached layered graph, path counts and sampler.
+
+        They are computed from the graph and its edge weights when first
+        needed, and reused afterwards; this method should be called after
+        changing the edge weights of the graph directly (e.g.,
+        pg.graph[u][v]['weight']) so that they are recomputed.
+        """
+        self._layered = None
+        self._path_counts = None
+        self._sampler = None
+
+    def to_layered(self):
+        """Return the paths graph as a LayeredPathsGraph.
+
+        The LayeredPathsGraph is created on first use and reused until
+        :py:meth:`clear_cache` is called (or the graph is replaced). It is
+        kept by :py:meth:`set_uniform_path_distribution`, which sets the
+        same weights in both representations.
+
+        Returns
+        -------
+        paths_graph.LayeredPathsGraph
+            Array-based representation of the paths graph.
+        """
+        from .layered import LayeredPathsGraph
+        cached = getattr(self, '_layered', None)
+        if cached is None or cached[0] is not self.graph:
+            cached = (self.graph, LayeredPathsGraph.from_pg(self))
+            self._layered = cached
+        return cached[1]
+
+    def sample_paths_batch(self, num_samples, rng=None,
+                           distribution='weighted'):
+        """Sample paths, advancing all samples together level by level.
+
+        See :py:meth:`paths_graph.LayeredPathsGraph.sample_paths_batch`.
+
+        Parameters
+        ----------
+        num_samples : int
+            The number of paths to sample.
+        rng : None, int, numpy.random.SeedSequence or numpy.random.Generator
+            Source of randomness, see :py:func:`paths_graph.sampling.get_rng`.
+            Default is None (the global NumPy random state).
+        distribution : str
+            'weighted' to sample according to the edge weights, or 'uniform'
+            to sample every path with the same probability, using the cached
+            path counts and without changing the edge weights (see
+            :py:meth:`paths_graph.LayeredPathsGraph.sample_paths`). Default
+            is 'weighted'.
+
+        Returns
+        -------
+        tuple
+            A (num_samples, path_length + 1) integer array of indices into
+            the table of node names, and the table of node names.
+        """
+        return self.to_layered().sample_paths_batch(
+                            num_samples, rng=rng, distribution=distribution)
 
     @staticmethod
     def _name_paths(paths):
         return [tuple([node[1] for node in path]) for path in paths]
 
-    def sample_paths(self, num_samples, names_only=True):
+    def sample_paths(self, num_samples, names_only=True, rng=None,
+                     n_jobs=None, executor=None, distribution='weighted'):
         """Sample paths of the given length between source and target.
 
         Parameters
@@ -448,6 +678,23 @@ class PathsGraph(object):
             Whether the paths should consist only of node names, or of node
             tuples (e.g., including depth and polarity). Default is True
             (only names).
+        rng : None, int, numpy.random.SeedSequence or numpy.random.Generator
+            Source of randomness, see :py:func:`paths_graph.sampling.get_rng`.
+            Default is None (the global NumPy random state).
+        n_jobs : Optional[int]
+            If given (and not 1), the samples are split across this many
+            worker processes, each with an independent random stream spawned
+            from rng (see :py:func:`paths_graph.parallel.sample_parallel`).
+            -1 uses all CPUs. Default is None (sample in this process).
+        executor : Optional[concurrent.futures.Executor]
+            Process-based executor to run parallel sampling tasks in. If
+            given without n_jobs, the number of CPUs is used as n_jobs.
+        distribution : str
+            'weighted' to sample according to the edge weights, or 'uniform'
+            to sample every path with the same probability, using the cached
+            path counts and without changing the edge weights (see
+            :py:meth:`paths_graph.LayeredPathsGraph.sample_paths`). Default
+            is 'weighted'.
 
         Returns
         -------
@@ -455,12 +702,21 @@ class PathsGraph(object):
             Each item in the list is a tuple of strings representing a path.
             Note that the paths may not be unique.
         """
+        check_distribution(distribution)
         if not self.graph:
             return tuple()
+        if _is_parallel(n_jobs, executor):
+            return sample_parallel(self, 'sample_paths', num_samples,
+                                   n_jobs, executor, rng,
+                                   names_only=names_only,
+                                   distribution=distribution)
+        if distribution == 'uniform':
+            return self._sample_uniform_paths(num_samples, names_only, rng)
+        rng = get_rng(rng)
         paths = []
         while len(paths) < num_samples:
             try:
-                path = self.sample_single_path(names_only=False)
+                path = self.sample_single_path(names_only=False, rng=rng)
                 paths.append(path)
             except PathSamplingException:
                 pass
@@ -468,7 +724,80 @@ class PathsGraph(object):
             paths = self._name_paths(paths)
         return tuple(paths)
 
-    def sample_single_path(self, names_only=True):
+    def iter_samples(self, num_samples=None, names_only=True, rng=None,
+                     chunk_size=None, cycle_free=False,
+                     distribution='weighted'):
+        """Iterate over paths sampled between source and target.
+
+        Paths are sampled one at a time as the generator is consumed, so
+        that memory use doesn't grow with the number of samples.
+
+        Parameters
+        ----------
+        num_samples : Optional[int]
+            The number of paths to sample. If None, sampling continues for
+            as long as the generator is consumed.
+        names_only : boolean
+            Whether the paths should consist only of node names, or of node
+            tuples (e.g., including depth and polarity). Default is True
+            (only names).
+        rng : None, int, numpy.random.SeedSequence or numpy.random.Generator
+            Source of randomness, see :py:func:`paths_graph.sampling.get_rng`.
+            Default is None (the global NumPy random state).
+        chunk_size : Optional[int]
+            If given, the paths are yielded in tuples of (at most) this many
+            paths instead of one by one.
+        cycle_free : bool
+            If True, sample cycle-free paths as in
+            :py:meth:`sample_cf_paths`. Default is False.
+        distribution : str
+            'weighted' or 'uniform', see :py:meth:`sample_paths`. Uniform
+            sampling is not supported together with cycle_free (a CFPG
+            can be used instead). Default is 'weighted'.
+
+        Returns
+        -------
+        generator
+            Generator of paths (or tuples of paths, if chunk_size is given).
+        """
+        check_distribution(distribution)
+        if cycle_free and distribution == 'uniform':
+            raise ValueError("Uniform sampling of cycle-free paths is not "
+                             "supported, use a CFPG instead.")
+        return iter_chunks(self._iter_samples(num_samples, names_only, rng,
+                                              cycle_free, distribution),
+                           chunk_size)
+
+    def _iter_samples(self, num_samples, names_only, rng, cycle_free,
+                      distribution='weighted'):
+        if not self.graph:
+            return
+        rng = get_rng(rng)
+        if distribution == 'uniform':
+            if not self.count_paths():
+                return
+            while num_samples is None or num_samples > 0:
+                yield self._sample_uniform_paths(1, names_only, rng)[0]
+                if num_samples is not None:
+                    num_samples -= 1
+            return
+        count = 0
+        while num_samples is None or count < num_samples:
+            if cycle_free:
+                path = self._sample_single_cf_path(names_only, rng)
+                # If there are no cycle free paths, we're done
+                if path is None:
+                    return
+            else:
+                try:
+                    path = self.sample_single_path(names_only, rng)
+                except PathSamplingException:
+                    continue
+            count += 1
+            yield path
+
+    def sample_single_path(self, names_only=True, rng=None,
+                           distribution='weighted'):
         """Sample a path between source and target.
 
         Parameters
@@ -477,20 +806,35 @@ class PathsGraph(object):
             Whether the paths should consist only of node names, or of node
             tuples (e.g., including depth and polarity). Default is True
             (only names).
+        rng : None, int, numpy.random.SeedSequence or numpy.random.Generator
+            Source of randomness, see :py:func:`paths_graph.sampling.get_rng`.
+            Default is None (the global NumPy random state).
+        distribution : str
+            'weighted' to sample according to the edge weights, or 'uniform'
+            to sample every path with the same probability, using the cached
+            path counts and without changing the edge weights (see
+            :py:meth:`paths_graph.LayeredPathsGraph.sample_paths`). Default
+            is 'weighted'.
 
         Returns
         -------
         tuple
             Tuple of nodes or node names representing a path.
         """
+        check_distribution(distribution)
         # Sample a path from the paths graph.
         # If the path graph is empty, there are no paths
         if not self.graph:
             return tuple()
+        if distribution == 'uniform':
+            paths = self._sample_uniform_paths(1, names_only, rng)
+            return paths[0] if paths else tuple()
+        rng = get_rng(rng)
+        sampler = self.sampler
         path = [self.source_node]
         current = self.source_node
         while current[1] != self.target_name:
-            next = self._successor(path, current)
+            next = self._successor(path, current, sampler, rng)
             path.append(next)
             current = next
         if names_only:
@@ -499,7 +843,54 @@ class PathsGraph(object):
             path = tuple(path)
         return path
 
-    def sample_cf_paths(self, num_samples, names_only=True):
+    def _sample_uniform_paths(self, num_samples, names_only, rng):
+        # Counting paths first makes sure that paths can be counted for
+        # this kind of graph (it isn't implemented for PreCFPGs, whose
+        # paths also depend on node tags)
+        if not self.count_paths():
+            return tuple()
+        return self.to_layered().sample_paths(num_samples,
+                                              names_only=names_only, rng=rng,
+                                              distribution='uniform')
+
+    def sample_unique_paths(self, k, weighted=True, names_only=True,
+                            rng=None):
+        """Sample k distinct paths without replacement.
+
+        See :py:meth:`paths_graph.LayeredPathsGraph.sample_unique_paths`.
+
+        Parameters
+        ----------
+        k : int
+            The number of paths to sample. If it is at least the number of
+            paths, all paths are returned.
+        weighted : bool
+            If True, paths are drawn according to the edge weights of the
+            graph, in the order they are drawn. If False, every set of k
+            paths is equally likely and the paths are returned in
+            enumeration order. Default is True.
+        names_only : boolean
+            Whether the paths should consist only of node names, or of node
+            tuples (e.g., including depth and polarity). Default is True
+            (only names).
+        rng : None, int, numpy.random.SeedSequence or numpy.random.Generator
+            Source of randomness, see :py:func:`paths_graph.sampling.get_rng`.
+            Default is None (the global NumPy random state).
+
+        Returns
+        -------
+        tuple of tuples
+            The sampled paths.
+        """
+        # Counting first raises in subclasses that can't count their paths
+        if not self.count_paths():
+            return tuple()
+        return self.to_layered().sample_unique_paths(
+                                k, weighted=weighted, names_only=names_only,
+                                rng=rng)
+
+    def sample_cf_paths(self, num_samples, names_only=True, rng=None,
+                        n_jobs=None, executor=None):
         """Sample a set of cycle-free paths from source to target.
 
         Parameters
@@ -510,6 +901,17 @@ class PathsGraph(object):
             Whether the paths should consist only of node names, or of node
             tuples (e.g., including depth and polarity). Default is True
             (only names).
+        rng : None, int, numpy.random.SeedSequence or numpy.random.Generator
+            Source of randomness, see :py:func:`paths_graph.sampling.get_rng`.
+            Default is None (the global NumPy random state).
+        n_jobs : Optional[int]
+            If given (and not 1), the samples are split across this many
+            worker processes, each with an independent random stream spawned
+            from rng (see :py:func:`paths_graph.parallel.sample_parallel`).
+            -1 uses all CPUs. Default is None (sample in this process).
+        executor : Optional[concurrent.futures.Executor]
+            Process-based executor to run parallel sampling tasks in. If
+            given without n_jobs, the number of CPUs is used as n_jobs.
 
         Returns
         -------
@@ -517,108 +919,107 @@ class PathsGraph(object):
             Each item in the list is a tuple of strings representing a path.
             Note that the paths may not be unique.
         """
-        # First, implement successor enumeration with a blacklist
-        def _successor_blacklist(path, node):
-            out_edges = []
-            weights = []
-            if tuple(path) in self._blacklist_by_path:
-                for e in self.graph.out_edges(node, data=True):
-                    if e[1] not in self._blacklist_by_path[tuple(path)]:
-                        out_edges.append(e)
-                        weights.append(e[2]['weight'])
-            else:
-                for e in self.graph.out_edges(node, data=True):
-                    out_edges.append(e)
-                    weights.append(e[2]['weight'])
-            # If there are no successors...
-            if not out_edges:
-                return None
-            # For determinism in testing
-            #if 'TEST_FLAG' in os.environ:
-            #    out_edges.sort()
-            #weights = [t[2]['weight'] for t in out_edges]
-            # Normalize the weights to a proper probability distribution
-            p = np.array(weights) / np.sum(weights)
-            pred_idx = np.random.choice(len(out_edges), p=p)
-            return out_edges[pred_idx][1]
-
         # Check to make sure we don't have an empty graph!
         if not self.graph:
             return tuple()
+        if _is_parallel(n_jobs, executor):
+            paths, blacklists = sample_parallel(
+                                self, 'sample_cf_paths', num_samples, n_jobs,
+                                executor, rng, '_blacklist_by_path',
+                                names_only=names_only)
+            # Keep what the workers learned about dead ends; entries are
+            # merged in chunk order so that the result is deterministic
+            for blacklist_by_path in blacklists:
+                for path, blacklist in blacklist_by_path.items():
+                    merged = self._blacklist_by_path.setdefault(path, [])
+                    merged.extend(node for node in blacklist
+                                  if node not in merged)
+            return paths
         # Initialize
+        rng = get_rng(rng)
         paths = []
         # Repeat for as many samples as we want...
         for samp_ix in range(num_samples):
-            # The path starts at the source node
-            path = [self.source_node]
-            current = self.source_node
-            # while we haven't reached the target...
-            while current[1] != self.target_name:
-                # ...enumerate the allowable successors for this node
-                next = _successor_blacklist(path, current)
-                # If next is None, this means that there were no
-                # non-blacklisted successors and hence there are no cycle-free
-                # paths that pass through the current node. In this case we
-                # remove the current node from the path (effectively
-                # backtracking a level) and continue after updating the
-                # blacklist
-                if next is None:
-                    # We can pop the information for the partial path from the
-                    # blacklist because we will never come here again
-                    try:
-                        self._blacklist_by_path.pop(tuple(path))
-                    except KeyError:
-                        pass
-                    # Now, backtrack by resetting the path up a level
-                    path = path[:-1]
-                    tup_path = tuple(path)
-                    # If we've walked all the way back to the source node
-                    # and the path is no empty, then there are no cycle free
-                    # paths
-                    if not path:
-                        return tuple()
-                    # The node we're backtracking to is the new final node
-                    # in the path
-                    backtrack_node = path[-1]
-                    # Remember to never come to the "current" node (i.e., the
-                    # one that was the last in the path before we figured out
-                    # that it was a dead end) from the backtrack node again
-                    if tup_path in self._blacklist_by_path:
-                        self._blacklist_by_path[tup_path].append(current)
-                    else:
-                        self._blacklist_by_path[tup_path] = [current]
-                    # Now make the backtrack node the new current node and
-                    # we can proceed normally!
-                    current = backtrack_node
-                # Otherwise we check if the node we've chosen introduces a
-                # cycle; if so, add to our blacklists then backtrack
-                elif next[1] in [node[1] for node in path]:
-                    tup_path = tuple(path)
-                    if tup_path in self._blacklist_by_path:
-                        self._blacklist_by_path[tup_path].append(next)
-                    else:
-                        self._blacklist_by_path[tup_path] = [next]
-                # If it doesn't make a cycle, then we add it to the path
-                else:
-                    path.append(next)
-                    current = next
-            if names_only:
-                path = tuple([node[1] for node in path])
-            else:
-                path = tuple(path)
+            path = self._sample_single_cf_path(names_only, rng)
+            # If there are no cycle free paths, we're done
+            if path is None:
+                return tuple()
             paths.append(path)
         return tuple(paths)
 
-    def _successor(self, path, node):
-        out_edges = list(self.graph.out_edges(node, data=True))
-        # For determinism in testing
-        if 'TEST_FLAG' in os.environ:
-            out_edges = sorted(out_edges)
-        weights = [t[2]['weight'] for t in out_edges]
-        # Normalize the weights to a proper probability distribution
-        p = np.array(weights) / np.sum(weights)
-        pred_idx = np.random.choice(len(out_edges), p=p)
-        return out_edges[pred_idx][1]
+    def _sample_single_cf_path(self, names_only, rng):
+        """Sample a cycle-free path, or return None if there are none."""
+        # First, implement successor enumeration with a blacklist
+        def _successor_blacklist(path, node):
+            blacklist = self._blacklist_by_path.get(tuple(path))
+            # If there are no successors, None is returned
+            if blacklist is None:
+                return self.sampler.sample(node, rng)
+            return self.sampler.sample_filtered(
+                                    node, lambda v: v not in blacklist, rng)
+
+        # The path starts at the source node
+        path = [self.source_node]
+        current = self.source_node
+        # while we haven't reached the target...
+        while current[1] != self.target_name:
+            # ...enumerate the allowable successors for this node
+            next = _successor_blacklist(path, current)
+            # If next is None, this means that there were no
+            # non-blacklisted successors and hence there are no cycle-free
+            # paths that pass through the current node. In this case we
+            # remove the current node from the path (effectively
+            # backtracking a level) and continue after updating the
+            # blacklist
+            if next is None:
+                # We can pop the information for the partial path from the
+                # blacklist because we will never come here again
+                try:
+                    self._blacklist_by_path.pop(tuple(path))
+                except KeyError:
+                    pass
+                # Now, backtrack by resetting the path up a level
+                path = path[:-1]
+                tup_path = tuple(path)
+                # If we've walked all the way back to the source node
+                # and the path is no empty, then there are no cycle free
+                # paths
+                if not path:
+                    return None
+                # The node we're backtracking to is the new final node
+                # in the path
+                backtrack_node = path[-1]
+                # Remember to never come to the "current" node (i.e., the
+                # one that was the last in the path before we figured out
+                # that it was a dead end) from the backtrack node again
+                if tup_path in self._blacklist_by_path:
+                    self._blacklist_by_path[tup_path].append(current)
+                else:
+                    self._blacklist_by_path[tup_path] = [current]
+                # Now make the backtrack node the new current node and
+                # we can proceed normally!
+                current = backtrack_node
+            # Otherwise we check if the node we've chosen introduces a
+            # cycle; if so, add to our blacklists then backtrack
+            elif next[1] in [node[1] for node in path]:
+                tup_path = tuple(path)
+                if tup_path in self._blacklist_by_path:
+                    self._blacklist_by_path[tup_path].append(next)
+                else:
+                    self._blacklist_by_path[tup_path] = [next]
+            # If it doesn't make a cycle, then we add it to the path
+            else:
+                path.append(next)
+                current = next
+        if names_only:
+            return tuple([node[1] for node in path])
+        return tuple(path)
+
+    def _successor(self, path, node, sampler, rng):
+        next = sampler.sample(node, rng)
+        if next is None:
+            raise PathSamplingException("No successors")
+        return next
 
 
 class CombinedPathsGraph(object):
@@ -661,15 +1062,31 @@ class CombinedPathsGraph(object):
         self._pg.source_name = self.source_name
         self._pg.source_node = self.source_node
         self._pg.target_name = self.target_name
-        self._pg.target_node = self.target_node
+        # The wrapped PG ends at the deepest level, so that its layered
+        # representation includes the paths of all lengths
+        self._pg.target_node = (max([node[0] for node in self.graph] or
+                                    [self.target_node[0]]),
+                                self.target_name)
 
-    def sample_paths(self, num_samples):
+    def sample_paths(self, num_samples, rng=None, n_jobs=None,
+                     executor=None):
         """Sample paths from the combined paths graph.
 
         Parameters
         ----------
         num_samples : int
             The number of paths to sample.
+        rng : None, int, numpy.random.SeedSequence or numpy.random.Generator
+            Source of randomness, see :py:func:`paths_graph.sampling.get_rng`.
+            Default is None (the global NumPy random state).
+        n_jobs : Optional[int]
+            If given (and not 1), the samples are split across this many
+            worker processes, each with an independent random stream spawned
+            from rng (see :py:func:`paths_graph.parallel.sample_parallel`).
+            -1 uses all CPUs. Default is None (sample in this process).
+        executor : Optional[concurrent.futures.Executor]
+            Process-based executor to run parallel sampling tasks in. If
+            given without n_jobs, the number of CPUs is used as n_jobs.
 
         Returns
         -------
@@ -677,7 +1094,18 @@ class CombinedPathsGraph(object):
             Each item in the list is a tuple of strings representing a path.
             Note that the paths may not be unique.
         """
-        return self._pg.sample_paths(num_samples=num_samples)
+        return self._pg.sample_paths(num_samples=num_samples, rng=rng,
+                                     n_jobs=n_jobs, executor=executor)
+
+    def iter_samples(self, num_samples=None, rng=None, chunk_size=None,
+                     cycle_free=False):
+        """Iterate over paths sampled from the combined paths graph.
+
+        See :py:meth:`PathsGraph.iter_samples` for the parameters.
+        """
+        return self._pg.iter_samples(num_samples=num_samples, rng=rng,
+                                     chunk_size=chunk_size,
+                                     cycle_free=cycle_free)
 
     def count_paths(self):
         total_paths = 0
@@ -685,6 +1113,93 @@ class CombinedPathsGraph(object):
             total_paths += pg.count_paths()
         return total_paths
 
+    def node_path_counts(self, weighted=False):
+        """Return the number of paths of any length through each node.
+
+        Parameters
+        ----------
+        weighted : bool
+            If True, return instead the expected number of visits to each
+            node by a path sampled with :py:meth:`sample_paths`, which
+            chooses between paths of different lengths according to the edge
+            weights of the combined graph. Default is False.
+
+        Returns
+        -------
+        dict
+            Dictionary keyed by node name, with the number of paths (or the
+            expected number of visits) as values. See
+            :py:meth:`PathsGraph.node_path_counts`.
+        """
+        if weighted:
+            return self._pg.node_path_counts(weighted=True)
+        return _sum_counts(pg.node_path_counts() for pg in self.pg_list)
+
+    def edge_path_counts(self, weighted=False):
+        """Return the number of paths of any length through each edge.
+
+        Parameters
+        ----------
+        weighted : bool
+            If True, return instead the expected number of traversals of
+            each edge by a path sampled with :py:meth:`sample_paths` (see
+            :py:meth:`node_path_counts`). Default is False.
+
+        Returns
+        -------
+        dict
+            Dictionary keyed by (name, name) tuples, with the number of
+            paths (or the expected number of traversals) as values.
+        """
+        if weighted:
+            return self._pg.edge_path_counts(weighted=True)
+        return _sum_counts(pg.edge_path_counts() for pg in self.pg_list)
+
+    def visit_probabilities(self):
+        """Return the probability that a sampled path visits each node and
+        edge of the combined graph.
+
+        See :py:meth:`PathsGraph.visit_probabilities`. Paths end when they
+        reach the target, at whichever depth.
+
+        Returns
+        -------
+        tuple of dicts
+            Dictionaries mapping the nodes and the edges (as (u, v) tuples)
+            of the combined graph to their visit probabilities.
+        """
+        return self._pg.visit_probabilities()
+
+    def path_length_distribution(self):
+        """Return the probability that a sampled path has each length.
+
+        Returns
+        -------
+        dict
+            Dictionary mapping path lengths to the probability that a path
+            sampled with :py:meth:`sample_paths` has that length, computed
+            analytically from :py:meth:`visit_probabilities`.
+        """
+        node_probs, _ = self.visit_probabilities()
+        return dict((node[0], prob) for node, prob in node_probs.items()
+                    if node[1] == self.target_name)
+
+    def top_k_paths(self, k, names_only=True):
+        """Return the k most probable paths of any length.
+
+        See :py:meth:`PathsGraph.top_k_paths`. The probabilities are those
+        of sampling the paths with :py:meth:`sample_paths`, which chooses
+        between paths of different lengths according to the edge weights of
+        the combined graph.
+
+        Returns
+        -------
+        tuple of tuples
+            Up to k (path, probability) tuples, in order of decreasing
+            probability.
+        """
+        return self._pg.top_k_paths(k, names_only=names_only)
+
     def count_cf_paths(self):
         total_paths = 0
         for pg in self.pg_list:
@@ -692,13 +1207,25 @@ class CombinedPathsGraph(object):
                 total_paths += pg.count_cf_paths()
         return total_paths
 
-    def sample_cf_paths(self, num_samples):
+    def sample_cf_paths(self, num_samples, rng=None, n_jobs=None,
+                        executor=None):
         """Sample cycle-free paths from the combined paths graph.
 
         Parameters
         ----------
         num_samples : int
             The number of paths to sample.
+        rng : None, int, numpy.random.SeedSequence or numpy.random.Generator
+            Source of randomness, see :py:func:`paths_graph.sampling.get_rng`.
+            Default is None (the global NumPy random state).
+        n_jobs : Optional[int]
+            If given (and not 1), the samples are split across this many
+            worker processes, each with an independent random stream spawned
+            from rng (see :py:func:`paths_graph.parallel.sample_parallel`).
+            -1 uses all CPUs. Default is None (sample in this process).
+        executor : Optional[concurrent.futures.Executor]
+            Process-based executor to run parallel sampling tasks in. If
+            given without n_jobs, the number of CPUs is used as n_jobs.
 
         Returns
         -------
@@ -706,7 +1233,192 @@ class CombinedPathsGraph(object):
             Each item in the list is a tuple of strings representing a path.
             Note that the paths may not be unique.
         """
-        return self._pg.sample_cf_paths(num_samples=num_samples)
+        return self._pg.sample_cf_paths(num_samples=num_samples, rng=rng,
+                                        n_jobs=n_jobs, executor=executor)
+
+
+def _merge_keys(counts, key_func):
+    """Sum the values of a dict over keys mapped to the same new key."""
+    merged = {}
+    for key, value in counts.items():
+        new_key = key_func(key)
+        merged[new_key] = merged.get(new_key, 0) + value
+    return merged
+
+
+def _sum_counts(counts_list):
+    """Sum the values of several dicts for each key."""
+    total = {}
+    for counts in counts_list:
+        for key, value in counts.items():
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+def get_paths_graph_edges(g, source, target, length, fwd_reachset=None,
+                          back_reachset=None, signed=False,
+                          target_polarity=0):
+    """Get the weighted edges of the paths graph for a given path length.
+
+    Takes the same arguments as :py:meth:`PathsGraph.from_graph`.
+
+    Returns
+    -------
+    list of tuples
+        Edges of the paths graph, as (u, v, {'weight': weight}) tuples where
+        the nodes u and v are tuples of the form (depth, name) for unsigned
+        graphs and (depth, (name, polarity)) for signed graphs. The list is
+        empty if there are no paths of the given length.
+    """
+    # If the reachable sets aren't provided by the user, compute them here
+    # with a maximum depth given by the target path length.
+    if fwd_reachset is None or back_reachset is None:
+        (fwd_reachset, back_reachset) = get_reachable_sets(g, source, target,
+                                                           max_depth=length,
+                                                           signed=signed)
+
+    # If either fwd_reachset or back_reachset is an empty dict (as they
+    # would be if the nodes were unreachable from either directions) return
+    # an empty paths graph
+    if not fwd_reachset or not back_reachset:
+        return []
+    # Otherwise, if the reachable sets are provided, use them after checking
+    # if they have a depth at least equal to the given path length
+    _check_reach_depth('forward', fwd_reachset, length)
+    _check_reach_depth('backward', back_reachset, length)
+    # Also, if the reachable sets do not have entries at the given length,
+    # this means that either we are attempting to create a paths_graph for
+    # a path longer than we generated reachable sets, or there is no path of
+    # the given length (may depend on whether cycles were eliminated when
+    # when generating the reachable sets).
+    if not (length in fwd_reachset and length in back_reachset):
+        return []
+    # By default, we set the "adjusted backward reach set", aka
+    # back_reachset_adj, to be the same as the original back_reachset; this
+    # is only overriden if we have a signed graph and a negative target
+    # polarity
+    back_reachset_adj = back_reachset
+    # Signed graphs
+    if signed:
+        level = {0: set([(source, 0)]),
+                 length: set([(target, target_polarity)])}
+        # If the target polarity is even (positive/neutral), then the
+        # cumulative polarities in the forward direction will match those
+        # in the reverse direction; if the target polarity is odd, then the
+        # polarities will be opposite at each matching node. Thus we check
+        # the target polarity and flip the polarities of the backward reach
+        # set if appropriate.
+        if target_polarity == 1:
+            back_reachset_adj = {}
+            for i in range(0, len(back_reachset)):
+                polar_set = set()
+                for (u, w) in back_reachset[i]:
+                    w_flipped = (w + 1) % 2
+                    polar_set.add((u, w_flipped))
+                back_reachset_adj[i] = polar_set
+    # Unsigned graphs
+    else:
+        level = {0: set([source]), length: set([target])}
+    # Next we calculate the subset of nodes at each level that are reachable
+    # from both the forward and backward directions. Because the polarities
+    # have already been set appropriately, we can do this with a simple
+    # set intersection. We also make sure that the target doesn't reappear
+    # anywhere except at the correct level.
+    for i in range(1, length):
+        f_reach_set = fwd_reachset[i]
+        b_reach_set = back_reachset_adj[length - i]
+        path_nodes = set(f_reach_set) & set(b_reach_set) - set([target])
+        level[i] = path_nodes
+    # Finally we add edges between these nodes if they are found in the
+    # original graph. Note that we have to check for an edge of the
+    # appropriate polarity.
+    if isinstance(g, CompiledGraph):
+        return _get_compiled_pg_edges(g, level, length, signed)
+    else:
+        return _get_pg_edges(g, level, length, signed)
+
+
+def _get_pg_edges(g, level, length, signed):
+    """Get the weighted edges of a paths graph from a networkx graph.
+
+    For each level i, we iterate over the out-edges of the nodes at level i
+    and keep the edges whose target (with the cumulative polarity obtained
+    from the sign of the edge, for signed graphs) is at level i+1. The cost
+    is therefore proportional to the number of out-edges of the nodes in the
+    paths graph rather than to the number of edges in the graph or to the
+    number of possible pairs of nodes at neighboring levels.
+    """
+    multigraph = g.is_multigraph()
+    pg_edges = []
+    for i in range(0, length):
+        logger.info("paths_graph: identifying edges at level %d" % i)
+        next_level = level[i+1]
+        for u in level[i]:
+            u_name, u_pol = u if signed else (u, 0)
+            for v_name, edge_data in g.succ[u_name].items():
+                # For multidigraphs, the adjacency gives a dict of edge data
+                # keyed by integers
+                for data in (edge_data.values() if multigraph
+                             else [edge_data]):
+                    if signed:
+                        # The polarity of the successor depends on the sign
+                        # of the edge
+                        v = (v_name, (u_pol + data['sign']) % 2)
+                    else:
+                        v = v_name
+                    if v in next_level:
+                        weight = float(data.get('weight', 1.0))
+                        pg_edges.append(((i, u), (i+1, v),
+                                         {'weight': weight}))
+    return pg_edges
+
+
+def _get_compiled_pg_edges(cg, level, length, signed):
+    """Get the weighted edges of a paths graph from a CompiledGraph.
+
+    Rather than checking pairs of nodes at neighboring levels against the
+    full list of edges, the out-edges of all nodes at level i are gathered
+    directly from the CSR arrays and kept if the successor (with the
+    appropriate polarity) is at level i+1.
+    """
+    masks = [cg.states_mask(level[i], signed) for i in range(0, length+1)]
+    pg_edges = []
+    for i in range(0, length):
+        logger.info("paths_graph: identifying edges at level %d" % i)
+        states = np.flatnonzero(masks[i])
+        edges, rows = cg._edge_positions(states, 'forward', signed)
+        u_states = states[rows]
+        v_states = cg._edge_states(edges, u_states, 'forward', signed)
+        keep = masks[i+1][v_states]
+        for u, v, weight in zip(u_states[keep].tolist(),
+                                v_states[keep].tolist(),
+                                cg.weights[edges[keep]].tolist()):
+            pg_edges.append(((i, cg.label(u, signed)),
+                             (i+1, cg.label(v, signed)),
+                             {'weight': weight}))
+    return pg_edges
+
+
+def iter_chunks(items, chunk_size=None):
+    """Return a generator of items grouped into tuples of chunk_size items.
+
+    The last tuple may contain fewer items. If chunk_size is None, the items
+    are generated one by one.
+    """
+    items = iter(items)
+    if chunk_size is None:
+        for item in items:
+            yield item
+        return
+    while True:
+        chunk = tuple(itertools.islice(items, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _is_parallel(n_jobs, executor):
+    return executor is not None or (n_jobs is not None and n_jobs != 1)
 
 
 def _check_reach_depth(dir_name, reachset, length):
@@ -1,9 +1,8 @@
-import os
 import logging
 from copy import copy, deepcopy
-import numpy as np
 import networkx as nx
 from paths_graph.pg import PathsGraph, PathSamplingException
+from paths_graph.prune import prune_graph
 
 
 logger = logging.getLogger('pre_cfpg')
@@ -70,6 +69,7 @@ class PreCFPG(PathsGraph):
         self.target_name = pg.target_name
         self.target_node = pg.target_node
         self.path_length = pg.path_length
+        self.signed = pg.signed
         self.graph = graph
         self.tags = tags
 
@@ -79,7 +79,7 @@ class PreCFPG(PathsGraph):
 
         Parameters
         ----------
-        g : networkx.DiGraph
+        g : networkx.DiGraph or CompiledGraph
             The underlying graph on which paths will be generated.
         source : str
             Name of the source node.
@@ -179,7 +179,7 @@ class PreCFPG(PathsGraph):
                         # If there are no nodes to prune then just add the tag
                         # 'x' to all the nodes in g_x_f but not to x
                         g_x_prune = prune(g_x, nodes_to_prune, source_node,
-                                          target_node)
+                                          target_node, in_place=True)
                         nodes_to_tag = [v for v in g_x_prune.nodes()
                                         if v[0] >= k]
                         # Otherwise add the tag x to the nodes in the strict
@@ -229,29 +229,40 @@ class PreCFPG(PathsGraph):
     def enumerate_paths(self):
         raise NotImplementedError()
 
+    def iter_paths(self, names_only=True, chunk_size=None):
+        raise NotImplementedError()
+
     def count_paths(self):
         raise NotImplementedError()
 
+    def node_path_counts(self, weighted=False):
+        raise NotImplementedError()
+
+    def edge_path_counts(self, weighted=False):
+        raise NotImplementedError()
+
+    def visit_probabilities(self):
+        raise NotImplementedError()
+
+    def top_k_paths(self, k, names_only=True):
+        raise NotImplementedError()
+
+    def sample_paths_batch(self, num_samples, rng=None,
+                           distribution='weighted'):
+        raise NotImplementedError()
+
     def set_uniform_path_distribution():
         raise NotImplementedError()
 
-    def _successor(self, path, u):
+    def _successor(self, path, u, sampler, rng):
         """Randomly choose a successor node of u given the current path."""
-        out_edges = []
-        for edge in self.graph.out_edges(u, data=True):
-            if set(path) <= set(self.tags[edge[1]]):
-                out_edges.append(edge)
+        path_set = set(path)
+        next = sampler.sample_filtered(
+                            u, lambda v: path_set.issubset(self.tags[v]), rng)
         # If there are no admissible successors, raise a PathSamplingException
-        if not out_edges:
+        if next is None:
             raise PathSamplingException("No cycle-free successors")
-        # For determinism in testing
-        if 'TEST_FLAG' in os.environ:
-            out_edges = sorted(list(out_edges))
-        weights = [t[2]['weight'] for t in out_edges]
-        # Normalize the weights to a proper probability distribution
-        p = np.array(weights) / np.sum(weights)
-        pred_idx = np.random.choice(len(out_edges), p=p)
-        return out_edges[pred_idx][1]
+        return next
 
 
 def _initialize_pre_cfpg(pg):
@@ -291,10 +302,10 @@ def _add_tag(tag_dict, tag_node, nodes_to_tag):
         tag_dict[v].append(tag_node)
 
 
-def prune(pg, nodes_to_prune, source, target):
+def prune(g, nodes_to_prune, source, target, in_place=False):
     """Iteratively prunes nodes from (a copy of) a paths graph or CFPG.
 
-    We prune the graph *pg* iteratively by the following procedure:
+    We prune the graph *g* iteratively by the following procedure:
       1. Remove the nodes given by *nodes_to_prune* from the graph.
       2. Identify nodes (other than the source node) that now have no
          incoming edges.
@@ -303,9 +314,12 @@ def prune(pg, nodes_to_prune, source, target):
       4. Set *nodes_to_prune* to the nodes identified in steps 2 and 3.
       5. Repeat from 1 until there are no more nodes to prune.
 
+    See :py:func:`paths_graph.prune.prune_graph`, which also returns the set
+    of removed nodes.
+
     Parameters
     ----------
-    pg : networkx.DiGraph
+    g : networkx.DiGraph
         Paths graph to prune.
     nodes_to_prune : list
         Nodes to prune from paths graph.
@@ -313,31 +327,16 @@ def prune(pg, nodes_to_prune, source, target):
         Source node, of the form (0, source_name).
     target : tuple
         Target node, of the form (target_depth, source_name).
+    in_place : bool
+        If True, the nodes are removed from g itself instead of from a copy.
+        Default is False.
 
     Returns
     -------
     networkx.DiGraph()
         Pruned paths graph.
     """
-    # First check if we are pruning any nodes to prevent unnecessary copying
-    # of the paths graph
-    if not nodes_to_prune:
-        return pg
-    # Make a copy of the graph
-    pg_pruned = pg.copy()
-    # Perform iterative pruning
-    while nodes_to_prune:
-        # Remove the nodes in our pruning list
-        pg_pruned.remove_nodes_from(nodes_to_prune)
-        # Make a list of nodes whose in or out degree is now 0 (making
-        # sure to exclude the source and target, whose depths are at 0 and
-        # path_length, respectively)
-        no_in_edges = [node for node, in_deg in pg_pruned.in_degree()
-                        if in_deg == 0 and node != source]
-        no_out_edges = [node for node, out_deg in pg_pruned.out_degree()
-                        if out_deg == 0 and node != target]
-        nodes_to_prune = set(no_in_edges + no_out_edges)
-    return pg_pruned
+    return prune_graph(g, nodes_to_prune, source, target, in_place)[0]
 
 
 def _forward(v, H, length):
@@ -0,0 +1,142 @@
+import logging
+import numpy as np
+
+logger = logging.getLogger('paths_graph')
+
+
+def prune_graph(g, nodes_to_prune, source, target, in_place=False):
+    """Iteratively prunes nodes from a paths graph or CFPG.
+
+    Removes the nodes given by *nodes_to_prune* from the graph, then
+    repeatedly removes the nodes (other than the source) that are left
+    without incoming edges and the nodes (other than the target) that are
+    left without outgoing edges, until there are none. The result is the
+    same as that of removing all such nodes round by round, but in-degrees
+    and out-degrees are kept as counters and updated only for the neighbors
+    of removed nodes, so that the time taken is proportional to the number
+    of edges of the removed nodes (plus one initial scan of the degrees).
+
+    Parameters
+    ----------
+    g : networkx.DiGraph
+        Paths graph to prune.
+    nodes_to_prune : iterable
+        Nodes to prune from the graph. Nodes not in the graph are ignored.
+    source : tuple
+        Source node, which is never removed for lack of incoming edges.
+    target : tuple
+        Target node, which is never removed for lack of outgoing edges.
+    in_place : bool
+        If True, nodes are removed from g itself; otherwise g is left
+        unchanged and a pruned copy is returned. Default is False.
+
+    Returns
+    -------
+    tuple : (networkx.DiGraph, set)
+        The pruned graph and the set of removed nodes. If there are no nodes
+        to prune, g itself is returned (even if in_place is False) along
+        with an empty set.
+    """
+    nodes_to_prune = list(nodes_to_prune)
+    if not nodes_to_prune:
+        return g, set()
+    in_degree = dict(g.in_degree())
+    out_degree = dict(g.out_degree())
+    # Nodes that are already dangling are removed as well
+    seeds = [node for node in nodes_to_prune if node in in_degree]
+    seeds += [node for node, in_deg in in_degree.items()
+              if in_deg == 0 and node != source]
+    seeds += [node for node, out_deg in out_degree.items()
+              if out_deg == 0 and node != target]
+    removed = _peel(seeds, g.successors, g.predecessors, in_degree,
+                    out_degree, source, target)
+    logger.debug("Pruning %d nodes" % len(removed))
+    if not in_place:
+        g = g.copy()
+    g.remove_nodes_from(removed)
+    return g, removed
+
+
+def prune_arrays(indptr, indices, nodes_to_prune, source, target):
+    """Iteratively prunes nodes from a graph given as compressed arrays.
+
+    The array version of :py:func:`prune_graph`, for graphs whose nodes are
+    the integers 0, ..., n-1 and whose edges are stored in compressed sparse
+    row form, as in :py:class:`paths_graph.LayeredPathsGraph`.
+
+    Parameters
+    ----------
+    indptr : numpy.ndarray
+        Array of length n+1; the successors of node u are
+        indices[indptr[u]:indptr[u+1]].
+    indices : numpy.ndarray
+        The successors of all nodes.
+    nodes_to_prune : iterable of int
+        Nodes to prune from the graph.
+    source : int
+        Source node, which is never removed for lack of incoming edges.
+    target : int
+        Target node, which is never removed for lack of outgoing edges.
+
+    Returns
+    -------
+    numpy.ndarray
+        Boolean array of length n, True for the nodes that were removed.
+    """
+    num_nodes = len(indptr) - 1
+    nodes_to_prune = list(nodes_to_prune)
+    if not nodes_to_prune:
+        return np.zeros(num_nodes, dtype=bool)
+    indptr = np.asarray(indptr)
+    indices = np.asarray(indices)
+    # The predecessors of each node, from the transposed edges
+    sources = np.repeat(np.arange(num_nodes), np.diff(indptr))
+    order = np.argsort(indices, kind='stable')
+    pred_indptr = np.concatenate(
+        [[0], np.cumsum(np.bincount(indices, minlength=num_nodes))]).tolist()
+    pred_indices = sources[order].tolist()
+    succ_indptr = indptr.tolist()
+    succ_indices = indices.tolist()
+    in_degree = np.diff(pred_indptr).tolist()
+    out_degree = np.diff(succ_indptr).tolist()
+    seeds = nodes_to_prune
+    seeds += [node for node in range(num_nodes)
+              if (in_degree[node] == 0 and node != source) or
+                 (out_degree[node] == 0 and node != target)]
+    removed = _peel(
+        seeds,
+        lambda u: succ_indices[succ_indptr[u]:succ_indptr[u+1]],
+        lambda v: pred_indices[pred_indptr[v]:pred_indptr[v+1]],
+        in_degree, out_degree, source, target)
+    mask = np.zeros(num_nodes, dtype=bool)
+    mask[list(removed)] = True
+    return mask
+
+
+def _peel(seeds, successors, predecessors, in_degree, out_degree, source,
+          target):
+    """Remove the seeds and, transitively, the nodes left dangling.
+
+    The degree counters are updated as nodes are removed; only the
+    neighbors of removed nodes are visited.
+    """
+    removed = set()
+    worklist = list(seeds)
+    while worklist:
+        node = worklist.pop()
+        if node in removed:
+            continue
+        removed.add(node)
+        for v in successors(node):
+            if v in removed:
+                continue
+            in_degree[v] -= 1
+            if in_degree[v] == 0 and v != source:
+                worklist.append(v)
+        for u in predecessors(node):
+            if u in removed:
+                continue
+            out_degree[u] -= 1
+            if out_degree[u] == 0 and u != target:
+                worklist.append(u)
+    return removed
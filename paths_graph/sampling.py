@@ -0,0 +1,317 @@
+import logging
+from bisect import bisect_right
+import numpy as np
+
+logger = logging.getLogger('paths_graph')
+
+
+class SuccessorSampler(object):
+    """Draws weighted random successors of nodes in a graph.
+
+    For each node, the list of successors (in canonical order, see
+    :py:func:`canonical_order`) and the cumulative distribution of their
+    (normalized) edge weights are computed once, on first use, and then
+    reused for every subsequent draw. Each draw takes a single uniform
+    random number and a binary search over the node's successors, and
+    consumes the random number stream exactly as `numpy.random.choice` does
+    given the same weights.
+
+    The tables become stale if the edge weights of the graph are changed;
+    in that case :py:meth:`clear` should be called (or a new sampler
+    created).
+
+    Parameters
+    ----------
+    graph : networkx.DiGraph
+        The graph to sample successors from.
+    weight : str
+        The edge attribute containing the weights. Default is 'weight'.
+    default : float
+        The weight of edges without the weight attribute. Default is 1.0.
+    """
+    def __init__(self, graph, weight='weight', default=1.0):
+        self.graph = graph
+        self.weight = weight
+        self.default = default
+        self._succs = {}
+        self._cdfs = {}
+        self._probs = {}
+
+    def clear(self):
+        """Remove all precomputed tables, e.g. after weights have changed."""
+        self._succs = {}
+        self._cdfs = {}
+        self._probs = {}
+
+    def successors(self, node):
+        """Return the successors of a node in sampling order, with weights.
+
+        The lists are computed on the first call for each node and reused
+        afterwards; they must not be modified.
+
+        Successors are in canonical order, so that sampling with a given
+        random seed is reproducible independently of the order in which
+        the edges were added to the graph.
+
+        Returns
+        -------
+        tuple
+            A list of successors and a corresponding list of weights.
+        """
+        entry = self._succs.get(node)
+        if entry is None:
+            entry = self._get_successors(node)
+            self._succs[node] = entry
+        return entry
+
+    def _get_successors(self, node):
+        succs = canonical_order(self.graph.successors(node))
+        weights = [self.graph.edges[node, v].get(self.weight, self.default)
+                   for v in succs]
+        return succs, weights
+
+    def sample(self, node, rng):
+        """Return a random successor of the node, or None if it has none.
+
+        Parameters
+        ----------
+        node : hashable
+            The node whose successors are sampled.
+        rng : numpy.random.Generator or numpy.random.RandomState
+            Source of randomness, as returned by :py:func:`get_rng`.
+        """
+        succs, cdf = self._get_cdf(node)
+        if not succs:
+            return None
+        return succs[bisect_right(cdf, rng.random())]
+
+    def sample_filtered(self, node, keep, rng):
+        """Return a random successor of the node among those satisfying a
+        condition, or None if there are none.
+
+        The precomputed distribution of the node's successors is reused: if
+        all successors are kept, the draw is the same as with
+        :py:meth:`sample`; otherwise the cached probabilities of the kept
+        successors are renormalized. Either way, a single random number is
+        drawn.
+
+        Parameters
+        ----------
+        node : hashable
+            The node whose successors are sampled.
+        keep : function
+            Called on each successor; only successors for which it returns
+            True are considered.
+        rng : numpy.random.Generator or numpy.random.RandomState
+            Source of randomness, as returned by :py:func:`get_rng`.
+        """
+        succs, cdf = self._get_cdf(node)
+        kept = [keep(v) for v in succs]
+        if not any(kept):
+            return None
+        if all(kept):
+            return succs[bisect_right(cdf, rng.random())]
+        probs = self._probs[node]
+        kept = [(v, p) for v, p, k in zip(succs, probs, kept) if k]
+        value = rng.random() * sum(p for _, p in kept)
+        total = 0.0
+        for v, p in kept:
+            total += p
+            if value < total:
+                return v
+        # Rounding may leave the value just above the total
+        return kept[-1][0]
+
+    def _get_cdf(self, node):
+        try:
+            return self._cdfs[node]
+        except KeyError:
+            succs, weights = self.successors(node)
+            cdf = cumulative_weights(weights)
+            self._cdfs[node] = (succs, cdf)
+            # The probability of each successor, for filtered sampling
+            self._probs[node] = [b - a for a, b in zip([0.0] + cdf[:-1], cdf)]
+            return succs, cdf
+
+
+def cumulative_weights(weights):
+    """Return the normalized cumulative distribution of a list of weights.
+
+    The computation mirrors the one in `numpy.random.choice`, so that
+    searching a uniform random number in the result gives the same choice.
+    """
+    if not len(weights):
+        return []
+    p = np.array(weights) / np.sum(weights)
+    cdf = p.cumsum()
+    cdf /= cdf[-1]
+    return cdf.tolist()
+
+
+def choose(items, weights, rng):
+    """Return a random element of items according to the weights."""
+    return items[bisect_right(cumulative_weights(weights), rng.random())]
+
+
+def get_rng(rng=None):
+    """Return the source of randomness to use for sampling.
+
+    Parameters
+    ----------
+    rng : None, int, numpy.random.SeedSequence, numpy.random.Generator or
+          numpy.random.RandomState
+        If None, the global NumPy random state is used, so that results can
+        be made reproducible with `numpy.random.seed`. Generators and
+        RandomState instances are used as they are; anything else is used
+        to seed a new Generator with `numpy.random.default_rng`.
+
+    Returns
+    -------
+    object
+        An object with a `random` method drawing uniform random numbers,
+        such as a numpy.random.Generator.
+    """
+    if rng is None or rng is np.random:
+        return np.random
+    if isinstance(rng, (np.random.Generator, np.random.RandomState)):
+        return rng
+    return np.random.default_rng(rng)
+
+
+def check_distribution(distribution):
+    """Raise a ValueError if a sampling distribution is not supported.
+
+    Paths can be sampled either according to the edge weights of a graph
+    ('weighted') or uniformly among all paths ('uniform').
+    """
+    if distribution not in ('weighted', 'uniform'):
+        raise ValueError("Unknown sampling distribution %s, expected "
+                         "'weighted' or 'uniform'." % distribution)
+
+
+def canonical_order(nodes):
+    """Return a list of nodes in a canonical, sorted order.
+
+    Sets of nodes nested in the nodes (such as the tags of CFPG nodes) are
+    compared as sorted tuples. If the nodes cannot be compared, they are
+    returned in their original order.
+    """
+    nodes = list(nodes)
+    try:
+        return sorted(nodes, key=_canonical_key)
+    except TypeError:
+        return nodes
+
+
+def _canonical_key(node):
+    if isinstance(node, tuple):
+        return tuple(_canonical_key(n) for n in node)
+    if isinstance(node, (set, frozenset)):
+        return tuple(sorted(_canonical_key(n) for n in node))
+    return node
+
+
+def random_below(n, rng):
+    """Return a uniformly random integer in [0, n), for any size of n.
+
+    Parameters
+    ----------
+    n : int
+        The (exclusive) upper bound, which may exceed the range of 64-bit
+        integers.
+    rng : numpy.random.Generator or numpy.random.RandomState
+        Source of randomness, as returned by :py:func:`get_rng`.
+    """
+    if n <= 2**62:
+        return int(_randint(rng, n))
+    # Draw enough random bits and reject values that are too large
+    num_bits = n.bit_length()
+    while True:
+        value = 0
+        for i in range(0, num_bits, 31):
+            value = (value << 31) | int(_randint(rng, 2**31))
+        value >>= -num_bits % 31
+        if value < n:
+            return value
+
+
+def sample_distinct_indices(n, k, rng):
+    """Return k distinct integers drawn uniformly from [0, n), in order.
+
+    Uses Floyd's algorithm, so that only k random numbers are drawn and the
+    memory used does not depend on n.
+    """
+    indices = set()
+    for j in range(n - k, n):
+        index = random_below(j + 1, rng)
+        indices.add(j if index in indices else index)
+    return sorted(indices)
+
+
+def stochastic_beam_search(root, children, k, rng):
+    """Sample k distinct sequences without replacement by their probability.
+
+    Sequences are built step by step from the root state, with the
+    probability of each step given by the children function. The sequences
+    are sampled with Gumbel-top-k sampling, i.e., equivalently to drawing
+    them one at a time with probability proportional to their probability
+    among the sequences not drawn yet. The top k perturbed log-probabilities
+    are found with a stochastic beam search, which perturbs the
+    log-probabilities of partial sequences with Gumbel noise conditioned on
+    the maximum of their extensions, so that only k partial sequences need
+    to be kept at each step (see Kool et al., 2019, Stochastic Beams and
+    Where to Find Them).
+
+    Parameters
+    ----------
+    root : object
+        The initial state.
+    children : function
+        Called with a state, returns a list of (state, log_prob, is_final)
+        tuples for the possible next states and the log-probabilities of
+        moving to them. Final states are not expanded further.
+    k : int
+        The number of sequences to sample.
+    rng : numpy.random.Generator or numpy.random.RandomState
+        Source of randomness, as returned by :py:func:`get_rng`.
+
+    Returns
+    -------
+    list
+        The final states of up to k sampled sequences, in the order in which
+        they would have been drawn one at a time.
+    """
+    # Each entry is (perturbed log-prob, log-prob, state, is_final)
+    beam = [(0.0, 0.0, root, False)]
+    while not all(entry[3] for entry in beam):
+        candidates = [entry for entry in beam if entry[3]]
+        for perturbed, log_prob, state, is_final in beam:
+            if is_final:
+                continue
+            kids = [kid for kid in children(state) if kid[1] > -np.inf]
+            # Sequences that reach a dead end are dropped
+            if not kids:
+                continue
+            log_probs = log_prob + np.array([kid[1] for kid in kids])
+            gumbels = log_probs - np.log(-np.log(rng.random(len(kids))))
+            # Condition the perturbed values of the children on their
+            # maximum being equal to that of the parent, in a numerically
+            # stable way (the maximum child gets v = -inf)
+            with np.errstate(divide='ignore'):
+                v = perturbed - gumbels + \
+                    np.log1p(-np.exp(gumbels - np.max(gumbels)))
+            conditioned = perturbed - np.maximum(v, 0) - \
+                          np.log1p(np.exp(-np.abs(v)))
+            for kid, kid_perturbed, kid_log_prob in \
+                    zip(kids, conditioned, log_probs):
+                candidates.append((kid_perturbed, kid_log_prob, kid[0],
+                                   kid[2]))
+        candidates.sort(key=lambda entry: -entry[0])
+        beam = candidates[:k]
+    return [entry[2] for entry in beam]
+
+
+def _randint(rng, n):
+    if isinstance(rng, np.random.Generator):
+        return rng.integers(n)
+    return rng.randint(n)
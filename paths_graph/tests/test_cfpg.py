@@ -7,6 +7,7 @@ import networkx as nx
 import paths_graph as pg
 
 random_graph_pkl = join(dirname(__file__), 'random_graphs_edges.pkl')
+cfpg_baseline_pkl = join(dirname(__file__), 'cfpg_baseline.pkl')
 
 g_uns = nx.DiGraph()
 g_uns.add_edges_from((('A', 'B'), ('A', 'C'), ('C', 'D'), ('B', 'D'),
@@ -55,6 +56,96 @@ def test_from_pg():
     assert len(d_nodes) == 2
 
 
+def test_get_past():
+    pg_0 = pg.PathsGraph.from_graph(g_uns, source, target, length)
+    node_bits = pg.cfpg._NodeBits(pg_0.graph)
+    past = pg.cfpg._get_past_bits(pg_0.source_node, pg_0.target_node,
+                                  pg_0.graph, node_bits)
+    past_nodes = pg.cfpg.get_past(pg_0.source_node, pg_0.target_node,
+                                  pg_0.graph)
+    for node in pg_0.graph:
+        assert set(node_bits.to_nodes(past[node])) == \
+            nx.ancestors(pg_0.graph, node) | set([node])
+        assert isinstance(past_nodes[node], list)
+        assert set(past_nodes[node]) == set(node_bits.to_nodes(past[node]))
+    # Nodes on paths from the source to (3, 'C') avoiding (1, 'C')
+    past_c = past[(3, 'C')] & ~node_bits.bit((1, 'C'))
+    assert node_bits.to_nodes(node_bits.closure(past_c, pg_0.source_node,
+                                                (3, 'C'))) == \
+        [(0, 'A'), (1, 'B'), (2, 'D'), (3, 'C')]
+    past_c &= ~node_bits.bit((1, 'B'))
+    assert node_bits.closure(past_c, pg_0.source_node, (3, 'C')) == 0
+
+
+def test_from_pg_source_pruned():
+    g = nx.DiGraph()
+    g.add_edges_from([('N0', 'N1'), ('N0', 'N3'), ('N1', 'N2'), ('N1', 'N3'),
+                      ('N2', 'N0'), ('N2', 'N1'), ('N2', 'N4'), ('N3', 'N1'),
+                      ('N3', 'N4'), ('N4', 'N2')])
+    # The paths graph only keeps the edges from level 2 to level 3, so the
+    # source is pruned from it
+    pg_0 = pg.PathsGraph.from_graph(g, 'N0', 'N1', 3)
+    assert (0, 'N0') not in pg_0.graph
+    cfpg = pg.CFPG.from_pg(pg_0)
+    assert not cfpg.graph
+    assert cfpg.count_paths() == 0
+
+
+def test_same_as_baseline():
+    """Check that CFPGs built from paths graphs and from pre-CFPGs of random
+    graphs have the same nodes, with the same tags, as those built by the
+    original set-based construction."""
+    with open(cfpg_baseline_pkl, 'rb') as f:
+        cases = pickle.load(f)
+    for edges, source, target, length, pg_nodes, pre_nodes in cases:
+        g = nx.DiGraph()
+        g.add_edges_from(edges)
+        paths_graph = pg.PathsGraph.from_graph(g, source, target, length)
+        pre_cfpg = pg.PreCFPG.from_graph(g, source, target, length)
+        for cfpg, nodes in ((pg.CFPG.from_pg(paths_graph), pg_nodes),
+                            (pg.CFPG.from_pre_cfpg(pre_cfpg), pre_nodes)):
+            assert sorted((node[0], node[1], tuple(sorted(node[2] or ())))
+                          for node in cfpg.graph) == nodes
+
+
+def test_compact():
+    cfpg = pg.CFPG.from_graph(g_uns, source, target, length)
+    compact = pg.CFPG.from_graph(g_uns, source, target, length,
+                                 compact=True)
+    assert cfpg.tag_sets is None
+    assert all(isinstance(node[2], int) for node in compact.graph)
+    assert len(compact.tag_sets) == len(set(compact.tag_sets))
+    assert set(compact.enumerate_paths()) == set(cfpg.enumerate_paths())
+    assert compact.count_paths() == 2
+    # The nodes with their tag sets are available on demand
+    assert set(compact.node_view(node) for node in compact.graph) == \
+        set(cfpg.graph)
+    assert set(compact.to_full().graph.edges()) == set(cfpg.graph.edges())
+    assert set(cfpg.to_compact().to_full().graph.edges()) == \
+        set(cfpg.graph.edges())
+    assert compact.to_compact() is compact
+
+
+def test_parallel_construction():
+    with open(random_graph_pkl, 'rb') as f:
+        rg_dict = pickle.load(f)
+    edges, src, tgt = rg_dict[0]
+    g = nx.DiGraph()
+    g.add_edges_from(edges)
+    pg_0 = pg.PathsGraph.from_graph(g, src, tgt, 6)
+    cfpg = pg.CFPG.from_pg(pg_0)
+    cfpg_par = pg.CFPG.from_pg(pg_0, n_jobs=2)
+    assert list(cfpg_par.graph.nodes()) == list(cfpg.graph.nodes())
+    assert list(cfpg_par.graph.edges()) == list(cfpg.graph.edges())
+    compact = pg.CFPG.from_pg(pg_0, compact=True)
+    compact_par = pg.CFPG.from_pg(pg_0, compact=True, n_jobs=2)
+    assert compact_par.tag_sets == compact.tag_sets
+    pre_cfpg = pg.PreCFPG.from_graph(g, src, tgt, 5)
+    cfpg = pg.CFPG.from_pre_cfpg(pre_cfpg)
+    cfpg_par = pg.CFPG.from_pre_cfpg(pre_cfpg, n_jobs=2)
+    assert list(cfpg_par.graph.edges()) == list(cfpg.graph.edges())
+
+
 def test_sample_paths():
     cfpg = pg.CFPG.from_graph(g_uns, source, target, length)
     sample_paths = cfpg.sample_paths(100)
@@ -77,6 +168,25 @@ def test_count_paths():
     assert num_paths == 2
 
 
+
+def test_node_path_counts():
+    cfpg = pg.CFPG.from_graph(g_uns, source, target, length)
+    assert cfpg.node_path_counts() == \
+        {'A': 2, 'B': 2, 'C': 2, 'D': 2, 'E': 2}
+    assert cfpg.edge_path_counts()[('B', 'D')] == 1
+    # Paths are cycle-free, so expected visits are visit probabilities
+    probs = cfpg.node_path_counts(weighted=True)
+    assert all(np.isclose(prob, 1.0) for prob in probs.values())
+    assert np.isclose(cfpg.edge_path_counts(weighted=True)[('A', 'B')], 0.5)
+
+
+def test_top_k_paths():
+    cfpg = pg.CFPG.from_graph(g_uns, source, target, length)
+    top = cfpg.top_k_paths(5)
+    assert len(top) == 2
+    assert set(path for path, _ in top) == set(cfpg.enumerate_paths())
+    assert all(np.isclose(prob, 0.5) for _, prob in top)
+
 def test_on_random_graphs():
     """For each of 25 random graphs, check that the number of cycle free paths
     for a given depth and source/target pair matches the results from
@@ -197,7 +307,6 @@ def test_uniform_sampling_example_graph1():
     length = 8
     cfpg = pg.CFPG.from_graph(g, source, target, length, signed=True,
                               target_polarity=0)
-    os.environ['TEST_FLAG'] = 'TRUE'
     np.random.seed(1)
     # Count paths
     # Now, re-weight for uniformity and re-sample
@@ -267,7 +376,6 @@ def test_weighted_sampling():
         ('C', 'E')])
     source, target, length = ('A', 'E', 4)
     cfpg = pg.CFPG.from_graph(g, source, target, length)
-    os.environ['TEST_FLAG'] = 'TRUE'
     np.random.seed(1)
     samp_paths = cfpg.sample_paths(1000)
     ctr = Counter(samp_paths)
@@ -288,6 +396,44 @@ def test_combine_cfpgs():
     path_ctr = Counter(paths)
 
 
+def test_combined_cfpg_unique_paths():
+    g = nx.DiGraph()
+    g.add_edges_from([('S', 'A'), ('S', 'T'), ('A', 'T'), ('A', 'S'),
+                      ('S', 'B'), ('B', 'A'), ('B', 'T')])
+    cfpg_list = [pg.CFPG.from_graph(g, 'S', 'T', length)
+                 for length in range(1, 5)]
+    cpg = pg.CombinedCFPG(cfpg_list)
+    all_paths = tuple(path for cfpg in cfpg_list
+                      for path in cfpg.enumerate_paths())
+    assert len(all_paths) == 4
+    assert cpg.sample_unique_paths(10) == all_paths
+    for weighted in (True, False):
+        paths = cpg.sample_unique_paths(3, weighted=weighted, rng=1)
+        assert len(set(paths)) == 3
+        assert set(paths) <= set(all_paths)
+    # Weighted sampling draws paths in proportion to their probability
+    first = Counter(cpg.sample_unique_paths(2, rng=i)[0] for i in range(1000))
+    assert abs(first[('S', 'T')] / 1000. - 1 / 3.) < 0.05
+
+
+
+def test_combined_cfpg_path_length_distribution():
+    g = nx.DiGraph()
+    g.add_edges_from([('S', 'A'), ('S', 'T'), ('A', 'T'), ('A', 'S'),
+                      ('S', 'B'), ('B', 'A'), ('B', 'T'), ('A', 'B')])
+    cpg = pg.CombinedCFPG([pg.CFPG.from_graph(g, 'S', 'T', length)
+                           for length in range(1, 5)])
+    dist = cpg.path_length_distribution()
+    assert sorted(dist) == [1, 2, 3]
+    assert np.allclose(list(dist.values()), 1 / 3.)
+    node_probs, edge_probs = cpg.visit_probabilities()
+    assert np.isclose(node_probs[(2, 'A')], 1 / 6.)
+    assert np.isclose(edge_probs[((1, 'B'), (2, 'A'))], 1 / 6.)
+    np.random.seed(1)
+    lengths = Counter(len(path) - 1 for path in cpg.sample_paths(3000))
+    assert all(abs(lengths[length] / 3000. - 1 / 3.) < 0.05
+               for length in dist)
+
 def test_problem_graph():
     g = nx.DiGraph()
     g.add_edges_from([
@@ -0,0 +1,180 @@
+from os.path import dirname, join
+import networkx as nx
+import paths_graph as pg
+
+korkut_sif = join(dirname(__file__), 'korkut_im.sif')
+
+g_uns = nx.DiGraph()
+g_uns.add_edges_from((('A', 'B'), ('A', 'C'), ('C', 'D'), ('B', 'D'),
+                      ('D', 'B'), ('D', 'C'), ('B', 'E'), ('C', 'E')))
+
+g_signed = nx.DiGraph()
+g_signed.add_edges_from([
+    ('A', 'B', {'sign': 1, 'weight': 3}),
+    ('A', 'C', {'sign': 0}),
+    ('C', 'D', {'sign': 0}),
+    ('B', 'D', {'sign': 0}),
+    ('D', 'B', {'sign': 0}),
+    ('D', 'C', {'sign': 1}),
+    ('B', 'E', {'sign': 0}),
+    ('C', 'E', {'sign': 0})])
+
+
+def test_compile_graph():
+    cg = pg.CompiledGraph.from_graph(g_signed)
+    assert len(cg) == 5
+    assert 'A' in cg
+    assert 'Z' not in cg
+    assert cg.number_of_edges() == 8
+    assert set(cg.out_edges('A')) == {('B', 3.0), ('C', 1.0)}
+    assert set(cg.out_edges(('A', 1), signed=True)) == \
+            {(('B', 0), 3.0), (('C', 1), 1.0)}
+    # Backward adjacency points back to the forward edge data
+    d = cg.node_id('D')
+    preds = cg.back_indices[cg.back_indptr[d]:cg.back_indptr[d+1]]
+    assert set(cg.nodes[u] for u in preds) == {'B', 'C'}
+
+
+def test_compiled_reachable_sets():
+    for g, signed in ((g_uns, False), (g_signed, True)):
+        cg = pg.CompiledGraph.from_graph(g)
+        for max_depth in (2, 4, 6):
+            ref = pg.get_reachable_sets(g, 'A', 'E', max_depth, signed=signed)
+            res = pg.get_reachable_sets(cg, 'A', 'E', max_depth,
+                                        signed=signed)
+            assert res == ref
+
+
+def test_compiled_multidigraph_signed():
+    graph = nx.MultiDiGraph()
+    graph.add_edges_from([('A', 'B', {'sign': 0}), ('A', 'B', {'sign': 1})])
+    cg = pg.CompiledGraph.from_graph(graph)
+    f_level, b_level = pg.get_reachable_sets(cg, 'A', 'B', max_depth=3,
+                                             signed=True)
+    assert f_level[1] == {('B', 0), ('B', 1)}
+    assert b_level[1] == {('A', 0), ('A', 1)}
+
+
+def test_compiled_paths_graph():
+    for g, signed, tp in ((g_uns, False, 0), (g_signed, True, 1)):
+        cg = pg.CompiledGraph.from_graph(g)
+        for length in range(1, 6):
+            ref = pg.PathsGraph.from_graph(g, 'A', 'E', length, signed=signed,
+                                           target_polarity=tp)
+            res = pg.PathsGraph.from_graph(cg, 'A', 'E', length,
+                                           signed=signed, target_polarity=tp)
+            assert set(res.graph.edges(data='weight')) == \
+                   set(ref.graph.edges(data='weight'))
+
+
+def test_compiled_api():
+    g = pg.load_signed_sif(korkut_sif)
+    cg = pg.CompiledGraph.from_graph(g)
+    source = 'BLK_phosphoY389_phosphorylation_PTK2_Y397'
+    target = 'EIF4EBP1_T37_p_obs'
+    kwargs = {'signed': True, 'target_polarity': 0, 'max_depth': 6}
+    assert pg.count_paths(cg, source, target, **kwargs) == \
+           pg.count_paths(g, source, target, **kwargs)
+    assert set(pg.enumerate_paths(cg, source, target, **kwargs)) == \
+           set(pg.enumerate_paths(g, source, target, **kwargs))
+
+
+def test_vectorized_reachable_sets():
+    for g, signed in ((g_uns, False), (g_signed, True)):
+        ref = pg.get_reachable_sets(g, 'A', 'E', 5, signed=signed)
+        f_level, b_level = pg.get_reachable_sets(g, 'A', 'E', 5,
+                                                 signed=signed,
+                                                 vectorized=True)
+        assert isinstance(f_level, pg.compiled.LevelSets)
+        assert (f_level, b_level) == ref
+        assert max(f_level.keys()) == 5
+        # The raw masks are available on request
+        mask = f_level.mask(1)
+        assert mask.sum() == len(f_level[1])
+    # Unreachable targets give empty dicts
+    f_level, b_level = pg.get_reachable_sets(g_uns, 'E', 'A', 5,
+                                             vectorized=True)
+    assert f_level == {} and b_level == {}
+
+
+def test_reach_set_cache():
+    cache = pg.ReachSetCache()
+    cg = pg.CompiledGraph.from_graph(g_signed)
+    ref = pg.get_reachable_sets(g_signed, 'A', 'E', 3, signed=True)
+    assert cache.get_reachable_sets(cg, 'A', 'E', 3, signed=True) == ref
+    assert (cache.hits, cache.misses) == (0, 2)
+    # A query with the same source reuses the forward levels
+    ref = pg.get_reachable_sets(g_signed, 'A', 'D', 3, signed=True)
+    assert cache.get_reachable_sets(cg, 'A', 'D', 3, signed=True) == ref
+    assert (cache.hits, cache.misses) == (1, 3)
+    # Deeper and shallower queries extend or truncate the cached levels
+    for max_depth in (6, 2):
+        ref = pg.get_reachable_sets(g_signed, 'A', 'E', max_depth,
+                                    signed=True)
+        res = cache.get_reachable_sets(cg, 'A', 'E', max_depth, signed=True)
+        assert res == ref
+    assert len(cache) == 3
+
+
+def test_reach_set_cache_eviction():
+    cg = pg.CompiledGraph.from_graph(g_uns)
+    cache = pg.ReachSetCache(max_bytes=1)
+    cache.get_reachable_sets(cg, 'A', 'E', 4)
+    # Only the most recently used entry is kept
+    assert len(cache) == 1
+    cache.clear()
+    assert len(cache) == 0 and cache.nbytes == 0
+
+
+def test_api_reach_cache():
+    g = pg.load_signed_sif(korkut_sif)
+    cg = pg.CompiledGraph.from_graph(g)
+    source = 'BLK_phosphoY389_phosphorylation_PTK2_Y397'
+    targets = ['EIF4EBP1_T37_p_obs', 'MAPK1_T185_p_obs']
+    cache = pg.ReachSetCache()
+    for target in targets:
+        kwargs = {'signed': True, 'max_depth': 5, 'cycle_free': False}
+        assert pg.count_paths(cg, source, target, reach_cache=cache,
+                              **kwargs) == \
+               pg.count_paths(g, source, target, **kwargs)
+    assert cache.hits == 1
+
+
+def test_count_paths_by_length():
+    multi = nx.MultiDiGraph()
+    multi.add_edges_from([('A', 'B', {'sign': 0}), ('A', 'B', {'sign': 1}),
+                          ('A', 'B', {'sign': 1}), ('B', 'A', {'sign': 0}),
+                          ('B', 'C', {'sign': 0})])
+    for g, source, target, signed in ((g_uns, 'A', 'E', False),
+                                      (g_uns, 'A', 'D', False),
+                                      (g_signed, 'A', 'E', True),
+                                      (multi, 'A', 'C', True)):
+        for tp in ((0, 1) if signed else (0,)):
+            counts = pg.count_paths_by_length(g, source, target, 8,
+                                              signed=signed,
+                                              target_polarity=tp)
+            assert len(counts) == 9
+            assert counts[0] == 0
+            for length in range(1, 9):
+                pg_i = pg.PathsGraph.from_graph(g, source, target, length,
+                                                signed=signed,
+                                                target_polarity=tp)
+                assert counts[length] == pg_i.count_paths()
+            assert sum(counts) == pg.count_paths(g, source, target, 8,
+                                                 cycle_free=False,
+                                                 signed=signed,
+                                                 target_polarity=tp)
+    # Paths of polarity 1 are counted even if the target can't be reached
+    # with polarity 0, which leaves the paths graphs empty
+    g = nx.DiGraph()
+    g.add_edge('N0', 'N1', sign=1)
+    counts = pg.count_paths_by_length(g, 'N0', 'N1', 2, signed=True,
+                                      target_polarity=1)
+    assert list(counts) == [0, 1, 0]
+    assert pg.PathsGraph.from_graph(g, 'N0', 'N1', 1, signed=True,
+                                    target_polarity=1).count_paths() == 0
+    # Counts beyond the int64 range are exact
+    g = nx.complete_graph(40, nx.DiGraph())
+    counts = pg.count_paths_by_length(pg.CompiledGraph.from_graph(g), 0, 39,
+                                      16)
+    assert list(counts) == [0] + [38**(k-1) for k in range(1, 17)]
@@ -0,0 +1,212 @@
+from collections import Counter
+import numpy as np
+import networkx as nx
+import paths_graph as pg
+from paths_graph.layered import LayeredPathsGraph
+
+g_uns = nx.DiGraph()
+g_uns.add_edges_from((('A', 'B'), ('A', 'C'), ('C', 'D'), ('B', 'D'),
+                      ('D', 'B'), ('D', 'C'), ('B', 'E'), ('C', 'E')))
+
+g_signed = nx.DiGraph()
+g_signed.add_edges_from([
+    ('A', 'B', {'sign': 1, 'weight': 3}),
+    ('A', 'C', {'sign': 0}),
+    ('C', 'D', {'sign': 0}),
+    ('B', 'D', {'sign': 0}),
+    ('D', 'B', {'sign': 0}),
+    ('D', 'C', {'sign': 1}),
+    ('B', 'E', {'sign': 0}),
+    ('C', 'E', {'sign': 0})])
+
+
+def _edges(graph):
+    return set(graph.edges(data='weight'))
+
+
+def test_from_pg_round_trip():
+    for g, signed in ((g_uns, False), (g_signed, True)):
+        for length in range(1, 6):
+            pg_i = pg.PathsGraph.from_graph(g, 'A', 'E', length,
+                                            signed=signed)
+            lpg = LayeredPathsGraph.from_pg(pg_i)
+            assert _edges(lpg.to_networkx()) == _edges(pg_i.graph)
+            assert lpg.count_paths() == pg_i.count_paths()
+            assert set(lpg.enumerate_paths()) == set(pg_i.enumerate_paths())
+            assert set(lpg.enumerate_paths(names_only=False)) == \
+                   set(pg_i.enumerate_paths(names_only=False))
+
+
+def test_from_graph():
+    for g, signed in ((g_uns, False), (g_signed, True)):
+        for length in range(1, 6):
+            pg_i = pg.PathsGraph.from_graph(g, 'A', 'E', length,
+                                            signed=signed)
+            lpg = LayeredPathsGraph.from_graph(g, 'A', 'E', length,
+                                               signed=signed)
+            assert lpg.source_node == pg_i.source_node
+            assert lpg.target_node == pg_i.target_node
+            assert _edges(lpg.to_networkx()) == _edges(pg_i.graph)
+    # No paths of length 1
+    lpg = LayeredPathsGraph.from_graph(g_uns, 'A', 'E', 1)
+    assert lpg.count_paths() == 0
+    assert lpg.enumerate_paths() == tuple()
+    assert lpg.sample_paths(10) == tuple()
+
+
+def test_layered_cfpg():
+    pg_i = pg.PathsGraph.from_graph(g_uns, 'A', 'E', 4)
+    cfpg = pg.CFPG.from_pg(pg_i)
+    lpg = LayeredPathsGraph.from_pg(cfpg)
+    assert _edges(lpg.to_networkx()) == _edges(cfpg.graph)
+    assert set(lpg.enumerate_paths()) == set(cfpg.enumerate_paths())
+
+
+def test_layered_sample_paths():
+    pg_i = pg.PathsGraph.from_graph(g_signed, 'A', 'E', 4, signed=True)
+    lpg = LayeredPathsGraph.from_pg(pg_i, weight_dtype=np.float32)
+    assert lpg.weights[0].dtype == np.float32
+    paths = lpg.sample_paths(200)
+    assert len(paths) == 200
+    assert set(paths) <= set(pg_i.enumerate_paths())
+
+
+def test_layered_uniform_distribution():
+    g = nx.DiGraph()
+    g.add_edges_from((('S', 'A'), ('S', 'B'), ('A', 'T'), ('B', 'C'),
+                      ('B', 'D'), ('C', 'T'), ('D', 'T'), ('A', 'X'),
+                      ('X', 'T')))
+    lpg = LayeredPathsGraph.from_graph(g, 'S', 'T', 3)
+    assert lpg.count_paths() == 3
+    lpg.set_uniform_path_distribution()
+    # From the source, B leads to twice as many paths as A
+    weights = dict(zip(lpg.successors(0, 0).tolist(), lpg.weights[0]))
+    assert sorted(weights.values()) == [1/3., 2/3.]
+    assert lpg.nbytes > 0
+
+
+def test_sample_paths_batch():
+    pg_i = pg.PathsGraph.from_graph(g_signed, 'A', 'E', 4, signed=True)
+    all_paths = set(pg_i.enumerate_paths())
+    paths, names = pg_i.sample_paths_batch(2000, rng=1)
+    assert paths.shape == (2000, 5)
+    sampled = [tuple(names[ix] for ix in row) for row in paths]
+    assert set(sampled) == all_paths
+    # Same seed, same samples
+    paths2, _ = pg_i.sample_paths_batch(2000, rng=1)
+    assert np.array_equal(paths, paths2)
+    # Path frequencies follow the uniform distribution over paths
+    pg_i.set_uniform_path_distribution()
+    paths, names = pg_i.sample_paths_batch(20000, rng=2)
+    _, counts = np.unique(paths, axis=0, return_counts=True)
+    assert len(counts) == len(all_paths)
+    expected = 20000. / len(all_paths)
+    assert np.all(np.abs(counts - expected) < 0.1 * expected)
+
+
+def test_sample_paths_batch_empty():
+    lpg = LayeredPathsGraph.from_graph(g_uns, 'A', 'E', 1)
+    paths, names = lpg.sample_paths_batch(10)
+    assert paths.shape == (0, 2)
+
+
+def test_layered_enumeration_order():
+    pg_i = pg.PathsGraph.from_graph(g_uns, 'A', 'E', 5)
+    cfpg = pg.CFPG.from_pg(pg.PathsGraph.from_graph(g_uns, 'A', 'E', 4))
+    for paths_graph in (pg_i, cfpg):
+        lpg = LayeredPathsGraph.from_pg(paths_graph)
+        paths = lpg.enumerate_paths()
+        assert len(paths) == lpg.count_paths()
+        assert paths == paths_graph.enumerate_paths()
+        ids = lpg.enumerate_path_ids()
+        assert ids.shape == (len(paths), paths_graph.path_length + 1)
+        assert tuple(tuple(lpg.names[ix] for ix in row)
+                     for row in ids) == paths
+    chunks = list(lpg.iter_paths(names_only=False, chunk_size=1))
+    assert sum(chunks, ()) == cfpg.enumerate_paths(names_only=False)
+
+
+def test_path_ranking():
+    pg_i = pg.PathsGraph.from_graph(g_uns, 'A', 'E', 6)
+    pg_signed = pg.PathsGraph.from_graph(g_signed, 'A', 'E', 4, signed=True)
+    cfpg = pg.CFPG.from_pg(pg.PathsGraph.from_graph(g_uns, 'A', 'E', 4))
+    for paths_graph in (pg_i, pg_signed, cfpg):
+        paths = paths_graph.enumerate_paths()
+        nodes = paths_graph.enumerate_paths(names_only=False)
+        for ix, path in enumerate(paths):
+            assert paths_graph.path_at(ix) == path
+            assert paths_graph.index_of(path) == ix
+            assert paths_graph.index_of(nodes[ix], names_only=False) == ix
+        assert paths_graph.path_at(-1) == paths[-1]
+        for start in range(len(paths) + 1):
+            for stop in range(start, len(paths) + 2):
+                assert paths_graph.paths_slice(start, stop) == \
+                       paths[start:stop]
+    try:
+        pg_i.path_at(len(pg_i.enumerate_paths()))
+        assert False
+    except IndexError:
+        pass
+    try:
+        pg_i.index_of(('A', 'B', 'E'))
+        assert False
+    except ValueError:
+        pass
+
+
+def test_sample_unique_paths():
+    pg_i = pg.PathsGraph.from_graph(g_uns, 'A', 'E', 6)
+    cfpg = pg.CFPG.from_pg(pg.PathsGraph.from_graph(g_uns, 'A', 'E', 4))
+    for paths_graph in (pg_i, cfpg):
+        all_paths = paths_graph.enumerate_paths()
+        for weighted in (True, False):
+            # Asking for all paths or more falls back to enumeration
+            assert paths_graph.sample_unique_paths(
+                len(all_paths), weighted=weighted) == all_paths
+            assert paths_graph.sample_unique_paths(
+                len(all_paths) + 1, weighted=weighted) == all_paths
+            k = len(all_paths) - 1
+            paths = paths_graph.sample_unique_paths(k, weighted=weighted,
+                                                    rng=1)
+            assert len(set(paths)) == k
+            assert set(paths) <= set(all_paths)
+            assert paths == paths_graph.sample_unique_paths(
+                k, weighted=weighted, rng=1)
+    nodes = pg_i.sample_unique_paths(2, weighted=False, names_only=False,
+                                     rng=1)
+    assert nodes[0][0] == pg_i.source_node
+    pg_empty = pg.PathsGraph.from_graph(g_uns, 'A', 'E', 3)
+    assert pg_empty.sample_unique_paths(3) == tuple()
+
+
+def test_path_counts_beyond_int64():
+    g = nx.complete_graph(40, nx.DiGraph())
+    for length in (6, 14):
+        pg_i = pg.PathsGraph.from_graph(g, 0, 39, length)
+        # Intermediate nodes can be any node other than the target
+        assert pg_i.count_paths() == 38**(length-1)
+        counts = pg_i._get_path_counts()
+        assert counts[pg_i.source_node] == pg_i.count_paths()
+        pg_i.set_uniform_path_distribution()
+        layered = pg_i.to_layered()
+        assert np.all(layered.weights[0] == 1. / 38)
+        assert pg_i.graph.edges[pg_i.source_node, (1, 1)]['weight'] == \
+            1. / 38
+    assert pg_i.count_paths() > 2**63
+    last = pg_i.path_at(pg_i.count_paths() - 1)
+    assert last == (0,) + (38, 37) * 6 + (38, 39)
+    assert pg_i.index_of(last) == pg_i.count_paths() - 1
+
+
+def test_uniform_batch_sampling_beyond_float_range():
+    g = nx.complete_graph(12, nx.DiGraph())
+    layered = pg.PathsGraph.from_graph(g, 0, 11, 320).to_layered()
+    assert layered.count_paths() > 10**308
+    paths, names = layered.sample_paths_batch(200, rng=1,
+                                              distribution='uniform')
+    assert paths.shape == (200, 321)
+    # The intermediate nodes are uniformly distributed among the 11
+    # nodes other than the target
+    ctr = Counter(paths[:, 1:-1].ravel().tolist())
+    assert set(ctr) == set(range(11))
+    assert max(ctr.values()) < 1.2 * min(ctr.values())
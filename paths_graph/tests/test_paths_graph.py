@@ -1,4 +1,3 @@
-import os
 import pickle
 from collections import Counter
 import numpy as np
@@ -187,8 +186,6 @@ def test_sample_paths_default_weights():
     g.add_edges_from([('A', 'B'), ('A', 'C'), ('B', 'D'), ('C', 'D')])
     source, target, length = ('A', 'D', 2)
     pg = PathsGraph.from_graph(g, source, target, length)
-    # For determinism in testing
-    os.environ['TEST_FLAG'] = 'TRUE'
     # Seed the random number generator
     np.random.seed(1)
     sample_paths = pg.sample_paths(200)
@@ -207,8 +204,6 @@ def test_sample_paths_weighted():
         ('C', 'D', {'weight': 1})])
     source, target, length = ('A', 'D', 2)
     pg = PathsGraph.from_graph(g, source, target, length)
-    # For determinism in testing
-    os.environ['TEST_FLAG'] = 'TRUE'
     # Seed the random number generator
     np.random.seed(1)
     sample_paths = pg.sample_paths(200)
@@ -228,8 +223,6 @@ def test_sample_paths_weighted_signed():
     source, target, length = ('A', 'D', 2)
     pg = PathsGraph.from_graph(g, source, target, length, signed=True,
                                target_polarity=0)
-    # For determinism in testing
-    os.environ['TEST_FLAG'] = 'TRUE'
     # Seed the random number generator
     np.random.seed(1)
     sample_paths = pg.sample_paths(200)
@@ -267,7 +260,6 @@ def test_non_uniform_sampling():
     pg = PathsGraph.from_graph(g_samp, 'source', 'target', 3)
     # There are five different paths, but sampling uniformly based on local
     # edge weights should result in ~50% of paths going through B1
-    os.environ['TEST_FLAG'] = 'TRUE'
     np.random.seed(1) # Seed the random number generator
     num_samples = 1000
     paths = pg.sample_paths(num_samples)
@@ -283,7 +275,6 @@ def test_uniform_sampling():
     # path distribution should result in 20% of paths going through each of
     # paths going through B1-B5.
     pg.set_uniform_path_distribution()
-    os.environ['TEST_FLAG'] = 'TRUE'
     np.random.seed(1) # Seed the random number generator
     num_samples = 5000
     path_count = pg.count_paths()
@@ -294,6 +285,37 @@ def test_uniform_sampling():
     assert b_ctr == {'B1': 1021, 'B2': 991, 'B3': 964, 'B4': 1022, 'B5': 1002}
 
 
+
+def test_uniform_distribution_sampling():
+    g = g_samp.copy()
+    g.edges['source', 'A1']['weight'] = 5
+    pg = PathsGraph.from_graph(g, 'source', 'target', 3)
+    weights = dict(((u, v), w) for u, v, w in pg.graph.edges(data='weight'))
+    num_samples = 5000
+    for paths in (pg.sample_paths(num_samples, rng=1,
+                                  distribution='uniform'),
+                  tuple(pg.iter_samples(num_samples, rng=1,
+                                        distribution='uniform'))):
+        b_ctr = Counter([p[2] for p in paths])
+        assert all(abs(b_ctr[b] / float(num_samples) - 0.2) < 0.03
+                   for b in ('B1', 'B2', 'B3', 'B4', 'B5'))
+    ids, names = pg.sample_paths_batch(num_samples, rng=1,
+                                       distribution='uniform')
+    b_ctr = Counter(names[ix] for ix in ids[:, 2])
+    assert all(abs(b_ctr[b] / float(num_samples) - 0.2) < 0.03
+               for b in ('B1', 'B2', 'B3', 'B4', 'B5'))
+    # The edge weights are left as they are
+    assert dict(((u, v), w) for u, v, w in
+                pg.graph.edges(data='weight')) == weights
+    paths = pg.sample_paths(num_samples, rng=1)
+    assert len([p for p in paths if 'B1' in p]) > 0.8 * num_samples
+    assert len(pg.sample_single_path(distribution='uniform')) == 4
+    try:
+        pg.sample_paths(1, distribution='other')
+        assert False
+    except ValueError:
+        pass
+
 def test_combine_paths_graphs():
     g = nx.DiGraph()
     g.add_edges_from([('S', 'A'), ('S', 'T'), ('A', 'T'), ('A', 'S')])
@@ -353,8 +375,6 @@ def test_paths_tree_weighted_sampling():
     paths = list(nx.all_simple_paths(g, source, target))
     pt = PathsTree(paths, source_graph=g)
     num_samples = 1000
-    # For determinism in testing
-    os.environ['TEST_FLAG'] = 'TRUE'
     # Seed the random number generator
     np.random.seed(1)
     samp_paths = pt.sample(num_samples=num_samples)
@@ -500,3 +520,168 @@ def test_cf_path_count_random():
     assert cf_count == simple_path_count
     assert set(simple_paths) == set(cf_paths)
 
+
+
+def test_batch_count_paths():
+    g = nx.DiGraph()
+    g.add_edges_from([('S', 'A'), ('S', 'B'), ('A', 'T'), ('B', 'T'),
+                      ('A', 'U'), ('T', 'U')])
+    pairs = [('S', 'T'), ('S', 'U'), ('A', 'U')]
+    counts = batch_count_paths(g, pairs, max_depth=3)
+    assert counts == {('S', 'T'): 2, ('S', 'U'): 3, ('A', 'U'): 2}
+    for pair in pairs:
+        assert counts[pair] == count_paths(g, *pair, max_depth=3)
+    # Results can also be streamed as each pair completes
+    cache = ReachSetCache()
+    results = batch_count_paths(g, pairs, max_depth=3, reach_cache=cache,
+                                as_generator=True)
+    assert dict(results) == counts
+    # The levels from S (forward) and U (backward) are computed only once
+    assert cache.misses == 4
+    # With fewer targets than sources, the pairs are grouped by target
+    pairs = [('S', 'U'), ('A', 'T'), ('A', 'U'), ('B', 'T'), ('B', 'U')]
+    counts = batch_count_paths(g, pairs, max_depth=3, as_generator=True)
+    assert [pair for pair, _ in counts] == \
+        [('S', 'U'), ('A', 'U'), ('B', 'U'), ('A', 'T'), ('B', 'T')]
+
+
+def test_batch_sample_paths():
+    pairs = [('A', 'D', 0), ('A', 'D', 1)]
+    paths = batch_sample_paths(graph1_s, pairs, max_depth=3, num_samples=10,
+                               signed=True)
+    assert set(paths[('A', 'D', 0)]) == {(('A', 0), ('B', 0), ('D', 0)),
+                                         (('A', 0), ('C', 0), ('D', 0))}
+    assert paths[('A', 'D', 1)] == []
+
+
+def test_parallel_sampling():
+    g = nx.DiGraph()
+    g.add_edges_from((('A', 'B'), ('A', 'C'), ('C', 'D'), ('B', 'D'),
+                      ('D', 'B'), ('D', 'C'), ('B', 'E'), ('C', 'E')))
+    pg = PathsGraph.from_graph(g, 'A', 'E', 4)
+    paths = pg.sample_paths(1000, rng=1, n_jobs=2)
+    assert len(paths) == 1000
+    assert set(paths) == set(pg.enumerate_paths())
+    # Reproducible for a given seed and number of jobs
+    assert paths == pg.sample_paths(1000, rng=1, n_jobs=2)
+    cf_paths = pg.sample_cf_paths(100, rng=1, n_jobs=2)
+    assert set(cf_paths) == {('A', 'B', 'D', 'C', 'E'),
+                             ('A', 'C', 'D', 'B', 'E')}
+    # The workers' blacklists are merged back
+    assert pg._blacklist_by_path
+    cfpg = CombinedCFPG([CFPG.from_pg(PathsGraph.from_graph(g, 'A', 'E', l))
+                         for l in range(1, 5)])
+    assert cfpg.sample_paths(100, rng=3, n_jobs=2) == \
+           cfpg.sample_paths(100, rng=3, n_jobs=2)
+
+
+def test_iter_paths_and_samples():
+    g = nx.DiGraph()
+    g.add_edges_from((('A', 'B'), ('A', 'C'), ('C', 'D'), ('B', 'D'),
+                      ('D', 'B'), ('D', 'C'), ('B', 'E'), ('C', 'E')))
+    pg = PathsGraph.from_graph(g, 'A', 'E', 4)
+    assert tuple(pg.iter_paths()) == pg.enumerate_paths()
+    chunks = list(pg.iter_paths(chunk_size=3))
+    assert [len(chunk) for chunk in chunks] == [3, 1]
+    assert sum(chunks, ()) == pg.enumerate_paths()
+    assert tuple(pg.iter_samples(50, rng=1)) == pg.sample_paths(50, rng=1)
+    samples = pg.iter_samples(rng=1, cycle_free=True)
+    assert len([next(samples) for i in range(500)]) == 500
+    # api level
+    paths = list(iter_paths(g, 'A', 'E', 5))
+    assert paths == enumerate_paths(g, 'A', 'E', 5)
+    chunks = list(iter_samples(g, 'A', 'E', 5, num_samples=10, rng=2,
+                               chunk_size=4))
+    assert sum(chunks, ()) == \
+           tuple(sample_paths(g, 'A', 'E', 5, num_samples=10, rng=2))
+
+
+def test_node_and_edge_path_counts():
+    g = nx.DiGraph()
+    g.add_edges_from([('A', 'B', {'weight': 3, 'sign': 0}),
+                      ('A', 'C', {'weight': 1, 'sign': 1}),
+                      ('C', 'D', {'sign': 0}), ('B', 'D', {'sign': 1}),
+                      ('D', 'B', {'sign': 0}), ('D', 'C', {'sign': 0}),
+                      ('B', 'E', {'sign': 0}), ('C', 'E', {'sign': 0})])
+    for signed in (False, True):
+        for length in range(1, 7):
+            pg = PathsGraph.from_graph(g, 'A', 'E', length, signed=signed)
+            paths = pg.enumerate_paths()
+            if signed:
+                paths = [tuple(name for name, _ in path) for path in paths]
+            node_ctr = Counter(node for path in paths for node in path)
+            edge_ctr = Counter(edge for path in paths
+                               for edge in zip(path[:-1], path[1:]))
+            assert pg.node_path_counts() == dict(node_ctr)
+            assert pg.edge_path_counts() == dict(edge_ctr)
+            # With uniform weights, every path has the same probability
+            pg.set_uniform_path_distribution()
+            node_probs = pg.node_path_counts(weighted=True)
+            assert set(node_probs) == set(node_ctr)
+            for node, count in node_ctr.items():
+                assert np.isclose(node_probs[node], count / len(paths))
+    # In a combined graph, paths of different lengths are weighted by the
+    # probability of the sampler ending up on them
+    cpg = CombinedPathsGraph([PathsGraph.from_graph(g, 'A', 'E', length)
+                              for length in range(1, 6)])
+    assert cpg.node_path_counts() == {'A': 6, 'B': 5, 'C': 5, 'D': 4, 'E': 6}
+    assert cpg.node_path_counts(weighted=True) == \
+        {'A': 1.0, 'B': 1.0, 'C': 0.5, 'D': 0.5, 'E': 1.0}
+    edge_probs = cpg.edge_path_counts(weighted=True)
+    assert edge_probs[('A', 'B')] == 0.75
+    assert edge_probs[('B', 'E')] == 0.625
+
+
+def test_visit_probabilities():
+    g = nx.DiGraph()
+    g.add_edges_from([('S', 'A'), ('S', 'T'), ('A', 'T'), ('A', 'S'),
+                      ('S', 'B'), ('B', 'A'), ('B', 'T'), ('A', 'B')])
+    pg = PathsGraph.from_graph(g, 'S', 'T', 3)
+    node_probs, edge_probs = pg.visit_probabilities()
+    assert node_probs[pg.source_node] == 1.0
+    assert np.isclose(node_probs[pg.target_node], 1.0)
+    for depth in range(4):
+        assert np.isclose(sum(prob for node, prob in node_probs.items()
+                              if node[0] == depth), 1.0)
+    assert np.isclose(edge_probs[((0, 'S'), (1, 'A'))], 0.5)
+    cpg = CombinedPathsGraph([PathsGraph.from_graph(g, 'S', 'T', length)
+                              for length in range(1, 5)])
+    dist = cpg.path_length_distribution()
+    assert np.allclose([dist[length] for length in range(1, 5)],
+                       [1 / 3., 5 / 18., 4 / 27., 13 / 54.])
+    node_probs, _ = cpg.visit_probabilities()
+    assert np.isclose(node_probs[(2, 'S')], 1 / 9.)
+
+
+def test_top_k_paths():
+    pg = PathsGraph.from_graph(g_samp, 'source', 'target', 3)
+    top = pg.top_k_paths(2)
+    assert top == ((('source', 'A1', 'B1', 'target'), 0.5),
+                   (('source', 'A2', 'B2', 'target'), 0.125))
+    assert len(pg.top_k_paths(10)) == 5
+    # Compare with the probabilities of all paths on a random weighted graph
+    rng = np.random.default_rng(1)
+    g = nx.gnp_random_graph(8, 0.5, seed=1, directed=True)
+    for u, v in g.edges():
+        g.edges[u, v]['weight'] = float(rng.random())
+    pg = PathsGraph.from_graph(g, 0, 7, 4)
+    paths = pg.top_k_paths(5, names_only=False)
+    probs = {}
+    for path in pg.enumerate_paths(names_only=False):
+        prob = 1.0
+        for u, v in zip(path[:-1], path[1:]):
+            total = sum(pg.graph.edges[u, w]['weight']
+                        for w in pg.graph.successors(u))
+            prob *= pg.graph.edges[u, v]['weight'] / total
+        probs[path] = prob
+    expected = sorted(probs.values(), reverse=True)[:5]
+    assert np.allclose([prob for _, prob in paths], expected)
+    for path, prob in paths:
+        assert np.isclose(probs[path], prob)
+    # Paths of all lengths, ending at the target
+    cpg = CombinedPathsGraph([PathsGraph.from_graph(g_samp, 'source',
+                                                    'target', length)
+                              for length in range(1, 4)])
+    assert cpg.top_k_paths(1) == ((('source', 'A1', 'B1', 'target'), 0.5),)
+    assert PathsGraph.from_graph(g_samp, 'source', 'target', 2).\
+        top_k_paths(3) == tuple()
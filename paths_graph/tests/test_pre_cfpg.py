@@ -219,7 +219,6 @@ def test_weighted_sampling():
         ('C', 'E')])
     source, target, length = ('A', 'E', 4)
     pre_cfpg = pg.PreCFPG.from_graph(g, source, target, length)
-    os.environ['TEST_FLAG'] = 'TRUE'
     np.random.seed(1)
     samp_paths = pre_cfpg.sample_paths(1000)
     ctr = Counter(samp_paths)
@@ -238,3 +237,57 @@ def test_count_not_implemented():
     pre_cfpg = pg.PreCFPG.from_graph(g3_uns, 'A', 'D', 3)
     pre_cfpg.count_paths()
 
+
+
+@raises(NotImplementedError)
+def test_iter_paths_not_implemented():
+    pre_cfpg = pg.PreCFPG.from_graph(g3_uns, 'A', 'D', 3)
+    pre_cfpg.iter_paths()
+
+
+def test_path_access_not_implemented():
+    pre_cfpg = pg.PreCFPG.from_graph(g3_uns, 'A', 'D', 3)
+    for method, args in ((pre_cfpg.path_at, (0,)),
+                         (pre_cfpg.index_of, (('A', 'B', 'C', 'D'),)),
+                         (pre_cfpg.paths_slice, (0, 2))):
+        try:
+            method(*args)
+        except NotImplementedError:
+            pass
+        else:
+            assert False, method
+
+
+@raises(NotImplementedError)
+def test_sample_unique_paths_not_implemented():
+    pre_cfpg = pg.PreCFPG.from_graph(g3_uns, 'A', 'D', 3)
+    pre_cfpg.sample_unique_paths(2)
+
+
+def test_path_counts_not_implemented():
+    pre_cfpg = pg.PreCFPG.from_graph(g3_uns, 'A', 'D', 3)
+    for method in (pre_cfpg.node_path_counts, pre_cfpg.edge_path_counts):
+        try:
+            method()
+        except NotImplementedError:
+            pass
+        else:
+            assert False, method
+
+
+@raises(NotImplementedError)
+def test_visit_probabilities_not_implemented():
+    pre_cfpg = pg.PreCFPG.from_graph(g3_uns, 'A', 'D', 3)
+    pre_cfpg.visit_probabilities()
+
+
+@raises(NotImplementedError)
+def test_top_k_paths_not_implemented():
+    pre_cfpg = pg.PreCFPG.from_graph(g3_uns, 'A', 'D', 3)
+    pre_cfpg.top_k_paths(2)
+
+
+@raises(NotImplementedError)
+def test_sample_paths_batch_not_implemented():
+    pre_cfpg = pg.PreCFPG.from_graph(g3_uns, 'A', 'D', 3)
+    pre_cfpg.sample_paths_batch(5, rng=0)
@@ -0,0 +1,66 @@
+import numpy as np
+import networkx as nx
+import paths_graph as pg
+from paths_graph.prune import prune_graph, prune_arrays
+
+g = nx.DiGraph()
+g.add_edges_from((('S', 'A'), ('S', 'B'), ('A', 'S'), ('B', 'C'),
+                  ('C', 'D'), ('D', 'T'), ('B', 'T')))
+length = 4
+
+
+def _round_prune(g, nodes_to_prune, source, target):
+    # Reference implementation removing dangling nodes round by round
+    g = g.copy()
+    while nodes_to_prune:
+        g.remove_nodes_from(nodes_to_prune)
+        nodes_to_prune = set(
+            [node for node, deg in g.in_degree()
+             if deg == 0 and node != source] +
+            [node for node, deg in g.out_degree()
+             if deg == 0 and node != target])
+    return g
+
+
+def test_prune_graph():
+    pg_raw = pg.PathsGraph.from_graph(g, 'S', 'T', length)
+    source, target = pg_raw.source_node, pg_raw.target_node
+    pruned, removed = prune_graph(pg_raw.graph, [(2, 'S')], source, target)
+    assert set(pruned.edges()) == \
+           set([((0, 'S'), (1, 'B')), ((1, 'B'), (2, 'C')),
+                ((2, 'C'), (3, 'D')), ((3, 'D'), (4, 'T'))])
+    assert removed == set(pg_raw.graph) - set(pruned)
+    # The original graph is unchanged unless pruning in place
+    assert (2, 'S') in pg_raw.graph
+    graph = pg_raw.graph.copy()
+    pruned, _ = prune_graph(graph, [(2, 'S')], source, target,
+                            in_place=True)
+    assert pruned is graph and (2, 'S') not in graph
+    pruned, removed = prune_graph(graph, [], source, target)
+    assert pruned is graph and removed == set()
+
+
+def test_prune_matches_rounds():
+    rg = nx.gnp_random_graph(30, 0.15, seed=1, directed=True)
+    pg_raw = pg.PathsGraph.from_graph(rg, 0, 1, 5)
+    source, target = pg_raw.source_node, pg_raw.target_node
+    nodes = sorted(pg_raw.graph)
+    rng = np.random.default_rng(1)
+    for i in range(10):
+        nodes_to_prune = [nodes[j] for j in
+                          rng.choice(len(nodes), 3, replace=False)]
+        expected = _round_prune(pg_raw.graph, nodes_to_prune, source, target)
+        pruned, _ = prune_graph(pg_raw.graph, nodes_to_prune, source, target)
+        assert set(pruned.edges()) == set(expected.edges())
+        assert set(pruned) == set(expected)
+        # The same on the compressed array representation
+        index = dict((node, j) for j, node in enumerate(nodes))
+        succs = [[index[v] for v in pg_raw.graph.successors(u)]
+                 for u in nodes]
+        indptr = np.cumsum([0] + [len(s) for s in succs])
+        indices = np.array([v for s in succs for v in s], dtype=int)
+        removed = prune_arrays(indptr, indices,
+                               [index[node] for node in nodes_to_prune],
+                               index[source], index[target])
+        assert set(nodes[j] for j in np.flatnonzero(~removed)) == \
+            set(expected)
@@ -0,0 +1,111 @@
+from collections import Counter
+import numpy as np
+import networkx as nx
+import paths_graph as pg
+from paths_graph.sampling import SuccessorSampler, get_rng, \
+    canonical_order, random_below, sample_distinct_indices
+
+g = nx.DiGraph()
+g.add_edges_from((('S', 'A', {'weight': 1}), ('S', 'B', {'weight': 3}),
+                  ('S', 'C'), ('A', 'T'), ('B', 'T'), ('C', 'T')))
+
+
+def test_sampler_matches_random_choice():
+    sampler = SuccessorSampler(g)
+    succs, weights = sampler.successors('S')
+    assert succs == ['A', 'B', 'C']
+    assert weights == [1, 3, 1.0]
+    np.random.seed(1)
+    sampled = [sampler.sample('S', np.random) for i in range(1000)]
+    np.random.seed(1)
+    p = np.array(weights) / np.sum(weights)
+    expected = [succs[np.random.choice(len(succs), p=p)]
+                for i in range(1000)]
+    assert sampled == expected
+    assert sampler.sample('T', np.random) is None
+
+
+def test_sampler_filtered():
+    sampler = SuccessorSampler(g)
+    rng = get_rng(1)
+    for i in range(20):
+        assert sampler.sample_filtered('S', lambda v: v != 'B', rng) in \
+                ('A', 'C')
+    assert sampler.sample_filtered('S', lambda v: False, rng) is None
+    # Kept successors are drawn in proportion to their weights
+    ctr = Counter(sampler.sample_filtered('S', lambda v: v != 'C', rng)
+                  for i in range(1000))
+    assert 700 < ctr['B'] < 800
+    # With all successors kept, the draws are those of sample
+    draws = [sampler.sample_filtered('S', lambda v: True, get_rng(2))
+             for i in range(10)]
+    assert draws == [sampler.sample('S', get_rng(2)) for i in range(10)]
+
+
+def test_sampler_invalidated():
+    pg_i = pg.PathsGraph.from_graph(g, 'S', 'T', 2)
+    sampler = pg_i.sampler
+    assert pg_i.sampler is sampler
+    pg_i.set_uniform_path_distribution()
+    assert pg_i.sampler is not sampler
+    assert set(pg_i.sample_paths(50)) <= {('S', 'A', 'T'), ('S', 'B', 'T'),
+                                          ('S', 'C', 'T')}
+    # Weights changed directly are used after clearing the caches
+    layered = pg_i.to_layered()
+    for v in ('A', 'B'):
+        pg_i.graph[(0, 'S')][(1, v)]['weight'] = 0.0
+    pg_i.clear_cache()
+    assert pg_i.to_layered() is not layered
+    assert set(pg_i.sample_paths(20)) == {('S', 'C', 'T')}
+    ids, names = pg_i.sample_paths_batch(20)
+    assert set(names[i] for i in ids[:, 1]) == {'C'}
+
+
+def test_seeded_sampling():
+    pg_i = pg.PathsGraph.from_graph(g, 'S', 'T', 2)
+    # Edges added in a different order give the same samples
+    g_rev = nx.DiGraph()
+    g_rev.add_edges_from(reversed(list(g.edges(data=True))))
+    pg_rev = pg.PathsGraph.from_graph(g_rev, 'S', 'T', 2)
+    for rng in (5, np.random.SeedSequence(5)):
+        assert pg_i.sample_paths(100, rng=rng) == \
+               pg_rev.sample_paths(100, rng=rng)
+    rng = np.random.default_rng(5)
+    paths = pg_i.sample_paths(100, rng=rng)
+    assert paths != pg_i.sample_paths(100, rng=rng)
+    assert paths == pg_i.sample_paths(100, rng=np.random.default_rng(5))
+    assert pg.sample_paths(g, 'S', 'T', max_depth=3, num_samples=10,
+                           rng=3) == \
+           pg.sample_paths(g_rev, 'S', 'T', max_depth=3, num_samples=10,
+                           rng=3)
+
+
+def test_canonical_order():
+    assert canonical_order(['b', 'c', 'a']) == ['a', 'b', 'c']
+    nodes = [(1, 'A', frozenset({'C', 'B'})), (1, 'A', frozenset({'A'}))]
+    assert canonical_order(nodes) == nodes[::-1]
+    # Nodes that can't be compared keep their order
+    assert canonical_order([1, 'a']) == [1, 'a']
+
+
+def test_sample_distinct_indices():
+    rng = get_rng(1)
+    for n, k in ((10, 0), (10, 3), (10, 10), (2**100, 5)):
+        indices = sample_distinct_indices(n, k, rng)
+        assert len(set(indices)) == k
+        assert indices == sorted(indices)
+        assert all(0 <= ix < n for ix in indices)
+    assert random_below(1, rng) == 0
+
+
+def test_sample_unique_paths_weighted():
+    pg_s = pg.PathsGraph.from_graph(g, 'S', 'T', 2)
+    rng = get_rng(1)
+    first = Counter()
+    for i in range(2000):
+        paths = pg_s.sample_unique_paths(2, rng=rng)
+        assert len(set(paths)) == 2
+        first[paths[0]] += 1
+    # The first path is drawn in proportion to the weights 1:3:1
+    assert abs(first[('S', 'B', 'T')] / 2000. - 0.6) < 0.05
+    assert abs(first[('S', 'A', 'T')] / 2000. - 0.2) < 0.05